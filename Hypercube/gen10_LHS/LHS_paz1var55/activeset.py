@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+from copy import deepcopy
+
+"""
+Active set of the pesticide fate
+
+Before the first application (app_days), and on the plots that are never treated, the pesticide
+mass of a layer is the background of initial() (sm_background), which only decays.
+model.active[layer] (0/1 map) marks the cells holding mass beyond it:
+ - layer 0: cells with applied mass
+ - layer j > 0: cells receiving leached mass from active cells of layer j - 1
+ - all layers: cells downstream (ldd_subs) of active cells, reached by the lateral mass flux
+Mass counts when it exceeds model.active_tol x the background mass of the receiving layer.
+
+PCRaster map algebra runs over the whole raster, so the fate kernels are skipped per layer:
+a layer without active cells (model.active_layers[layer] False) only takes the closed-form decay
+of its masses (getBackgroundDecayPair, pesti_v4.py); volatilisation, leaching, run-off, lateral
+and drainage mass are not computed there. A layer with active cells runs the full kernels.
+With model.ACTIVE_SET False every layer is active (all kernels, every time step).
+"""
+
+
+def initActiveSet(model):
+    """
+    Sets model.active and model.active_layers (initial), no cell is active
+    """
+    model.active = [deepcopy(model.zero_map) for _ in range(model.num_layers)]
+    model.active_layers = [not model.ACTIVE_SET] * model.num_layers
+
+
+def isActive(model, layer):
+    return not model.ACTIVE_SET or model.active_layers[layer]
+
+
+def markActive(model, layer, mass, source=None):
+    """
+    :param mass: mass entering the layer (g), e.g. applied or leached from the layer above
+    :param source: 0/1 map of the cells the mass comes from (None: all cells)
+    """
+    if not model.ACTIVE_SET:
+        return
+    if source is not None:
+        mass = mass * source
+    cells = ifthenelse(mass > model.active_tol * model.sm_background[layer], scalar(1), scalar(0))
+    model.active[layer] = max(model.active[layer], cells)
+    if not model.active_layers[layer]:
+        model.active_layers[layer] = float(mapmaximum(cells)) > 0
+
+
+def spreadActive(model, layer):
+    """
+    Active cells of a layer after the lateral mass flux: the cells downstream of them
+    """
+    if not model.ACTIVE_SET or not model.active_layers[layer]:
+        return
+    model.active[layer] = ifthenelse(accuflux(model.ldd_subs, model.active[layer]) > 0, scalar(1), scalar(0))
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+import numpy as np
+
+from hydro_np import asArray, anyCell, cellMaxima, getTopLayerInfil_np, getPercolation_np, \
+    getArtificialDrainage_np, getLateralFlow_np, getLateralFlow_Manfreda_np, getActualEvap_np, \
+    getActualTransp_np, getLayerTemp_np
+from model_g10 import BeachModel, start_jday
+from forcing import isDry
+from routing import outletIndexTotals
+from compact import getCellIndex, compressCells, getArrayOutletIndex
+from trajectory import getHydroKey, getTrajectoryPath, isComplete, openRecording, appendHydro, closeRecording
+
+"""
+Batched hydrology
+
+The LHS parameters only enter the model as spatially uniform values (mask * vector[i] * upper[i]),
+while the catchment, forcing and crop tables are the same for all samples.
+BatchModel carries the soil state as float32 arrays shaped (samples, cells), the catchment
+cells only (compact.py), and advances all samples of the hypercube in one time step:
+the sample-independent inputs are computed once (BeachModel.getDrivers()), the column processes
+run on the stacked arrays (hydro_np.py) and the parameters broadcast as (samples, 1) arrays.
+
+Lateral flow runs on the stacked arrays too (routing.py); the outlet totals of run-off,
+drainage, baseflow and ETP of all samples are weighted sums over the outlet index. The index
+is not yet validated against PCRaster on the dataset (routing.py): compareBatch() checks it
+against BeachModel's default 'pcraster' outlet totals.
+The theta corrections are those of BeachModel.dynamic(), in the same order; the ones conditioned
+on a whole map (e.g. mapmaximum(theta) > mapmaximum(theta_sat)) are tested per sample (model.batched).
+compareBatch() runs the first LHS row with both models -> batch_diff.csv
+
+Only the water balance is batched. With trajectory='record' the batch writes the hydrology
+trajectory of each unique hydrology row (trajectory.py), the same calls as BeachModel's runHydro():
+the pesticide fate of the samples is then run by BeachModel, replaying them (runBatch(), __main__).
+Outputs (outlet discharge per sample and time step, m3) -> batch_hydro.npz
+"""
+
+class BatchModel(BeachModel):
+    def __init__(self, cloneMap, names, params, upper, samples, test=False, trajectory='off'):
+        BeachModel.__init__(self, cloneMap, names, params, upper, test=test)
+        self.samples = samples
+        self.record_trajectories = trajectory == 'record'
+
+    def defineOutputs(self):
+        # Replaces the TimeoutputTimeseries of BeachModel (one value per sample -> npz)
+        self.batch_out = dict((name, []) for name in ['q_m3', 'runoff_m3', 'latflow_m3', 'drain_m3',
+                                                      'baseflow_m3', 'etp_m3'])
+
+    def getParam(self, name):
+        """
+        :return: (samples, cells) array, vector[i] * upper[i] of every sample
+        """
+        i = self.names.index(name)
+        values = np.asarray(self.batch_params[:, i], dtype=np.float32) * np.float32(self.upper[i])
+        return values.reshape((-1,) + (1,) * self.mask_np.ndim) * self.mask_np
+
+    def outletTotals(self, materials):
+        """
+        Same as sampling areatotal(accuflux(ldd, x), outlet_multi) at the outlet, for each sample.
+        Weighted sums over the outlet index (routing.py), no routing.
+        :param materials: list of (samples, cells) or (cells,) arrays
+        :return: (materials, samples) float64 array
+        """
+        stack = np.stack([np.broadcast_to(m, (self.samples,) + self.shape) for m in materials])
+        outlet_index = getArrayOutletIndex(self)
+        return outletIndexTotals(outlet_index, stack)[..., self.outlet_column]
+
+    def openRecordings(self):
+        """
+        One recording per unique hydrology row without a complete trajectory, as (row, trajectory)
+        """
+        self.recordings = []
+        if not self.record_trajectories:
+            return
+        keys = set()
+        for row in range(len(self.batch_params)):
+            key = getHydroKey(self, self.batch_params[row])
+            path = getTrajectoryPath(self, key)
+            if key in keys or isComplete(path):
+                continue
+            keys.add(key)
+            self.recordings.append((row, openRecording(self, path, row + 1)))
+        print("Recording " + str(len(self.recordings)) + " hydrology trajectories")
+
+    def recordBatch(self, name, res, rows=None):
+        """
+        Appends the result of the hydro_v3 function name (as runHydro() in BeachModel) to the recordings
+        :param rows: (samples,) bool, samples that make the call, default all
+        """
+        full = (self.samples,) + self.shape
+        for row, trajectory in self.recordings:
+            if rows is None or rows[row]:
+                appendHydro(self, trajectory, name, res, lambda value: np.broadcast_to(value, full)[row])
+
+    def initial(self):
+        self.premcloop()
+        self.hydro_backend = 'numpy' if self.hydro_backend == 'pcraster' else self.hydro_backend
+        self.compact = True  # State as (samples, catchment cells)
+        self.batched = True  # Map-wide branch tests per sample (hydro_np.anyCell)
+        self.num_layers = int(self.ini_param.get("layers"))
+        self.bsmntIsPermeable = False
+
+        self.mask_np = asArray(self, self.mask)
+        self.shape = self.mask_np.shape
+        self.cell_area = asArray(self, cellarea())
+        self.outlet_zone = compressCells(getCellIndex(self), self.outlet_multi) == 1
+        self.outlet_column = int(np.flatnonzero(getArrayOutletIndex(self)['zone_codes'] == 1)[0])
+
+        if self.TEST:
+            self.batch_params = np.tile(np.atleast_2d(self.params)[0], (self.samples, 1))
+        else:
+            self.batch_params = np.atleast_2d(self.params)[:self.samples]
+        print("Batch of " + str(len(self.batch_params)) + " samples")
+
+        z3_factor = self.getParam('z3_factor')
+        self.gamma = []
+        self.c_lf = []
+        for layer in range(self.num_layers):
+            if layer < 2:
+                self.gamma.append(self.getParam('gamma01'))
+                self.c_lf.append(self.getParam('cZ0Z1'))
+            else:
+                self.gamma.append(self.getParam('gammaZ'))
+                self.c_lf.append(self.getParam('cZ'))
+        self.c_adr = self.getParam('c_adr')
+        self.k_g = self.getParam('k_g')
+        self.f_transp = self.getParam('f_transp')
+        self.f_evap = self.getParam('f_evap')
+        self.drainage_layers = [False, False, True, False, False]
+
+        # Soil moisture (state, one layer per sample)
+        stack = lambda x: np.repeat(asArray(self, x)[np.newaxis], self.samples, axis=0)
+        self.theta = []
+        self.theta_sat = []
+        self.theta_fc = []
+        self.theta_wp = []
+        for layer in range(self.num_layers):
+            if layer < 2:
+                self.theta_sat.append(np.zeros(self.shape, dtype=np.float32))
+                self.theta_fc.append(np.zeros(self.shape, dtype=np.float32))
+                self.theta_wp.append(self.mask_np * np.float32(self.ini_param.get("WPZ01")))
+            else:
+                self.theta_sat.append(self.mask_np * np.float32(self.ini_param.get("SATZ")))
+                self.theta_fc.append(self.mask_np * np.float32(self.ini_param.get("FCZ")))
+                self.theta_wp.append(self.mask_np * np.float32(self.ini_param.get("WPZ")))
+            if start_jday() < 100:
+                self.theta.append(stack(readmap('d14_theta_z' + str(layer))))
+            else:
+                self.theta.append(stack(readmap('d166_theta_z' + str(layer))))
+
+        self.p_bZ = scalar(self.ini_param.get("p_bZ"))
+
+        # Layer depths (z3 and z4 depend on z3_factor)
+        self.layer_depth = []
+        self.tot_depth = np.zeros(self.shape, dtype=np.float32)
+        for layer in range(self.num_layers):
+            if layer < self.num_layers - 2:
+                self.layer_depth.append(asArray(self, self.zero_map + scalar(self.ini_param.get('z' + str(layer)))))
+            elif layer < self.num_layers - 1:
+                bottom_depth = (asArray(self, self.datum_depth) +
+                                np.float32(self.ini_param.get('z' + str(layer))) + 100 - self.tot_depth)
+                self.layer_depth.append(bottom_depth * z3_factor)
+            else:
+                self.layer_depth.append(bottom_depth * (1 - z3_factor))
+            self.tot_depth = self.tot_depth + self.layer_depth[layer]
+
+        # Temperature
+        self.temp_ave_air = scalar(12.)
+        self.lag = scalar(0.8)
+        day = 'd14' if start_jday() < 100 else 'd166'
+        self.temp_surf_fin = stack(readmap(day + "_temp_z0"))
+        self.temp_fin = [stack(readmap(day + "_temp_z" + str(layer))) for layer in range(self.num_layers)]
+        self.dd_max = (scalar(2500) * self.p_bZ) / (self.p_bZ + 686 * exp(-5.63 * self.p_bZ))
+
+        self.rain_cum_mm = self.zero_map + scalar(400.0)  # Cum Rainfall, as BeachModel
+        self.setSimulationStart()
+        self.openRecordings()
+
+    def dynamic(self):
+        a = lambda x: asArray(self, x)
+        jd_sim = self.jd_start + self.jd_cum
+
+        # Sample-independent inputs, once for the whole batch
+        drivers = self.getDrivers(jd_sim)
+        for layer in range(2):
+            self.theta_sat[layer] = a(self.theta_sat[layer])
+            self.theta_fc[layer] = a(self.theta_fc[layer])
+        k_sat = drivers["k_sat"]
+        root_depth_tot = a(drivers["root_depth_tot"])
+        pot_evapor = a(drivers["pot_evapor"])
+        depth = self.layer_depth
+
+        with np.errstate(all='ignore'):
+            excess_z0 = np.where(self.theta[0] > self.theta_sat[0], self.theta[0] - self.theta_sat[0], 0)
+            excess_z1 = np.where(self.theta[1] > self.theta_sat[1], self.theta[1] - self.theta_sat[1], 0)
+            self.theta[0] = np.minimum(self.theta[0], self.theta_sat[0])
+            self.theta[1] = np.minimum(self.theta[1], self.theta_sat[1])
+
+            root_depth = []
+            top = np.float32(0)
+            for layer in range(self.num_layers):
+                if layer < self.num_layers - 1:
+                    root_depth.append(np.clip(root_depth_tot - top, 0, depth[layer]))
+                    top = top + depth[layer]
+                else:
+                    root_depth.append(np.float32(0))
+
+            # Infiltration, runoff & percolation (dry: per sample, as BeachModel)
+            precip = a(drivers["precip"]) + (excess_z0 + excess_z1)
+            dry = ((self.DRY_DAYS and isDry(self, 'rain')) & ~anyCell(self, excess_z0 + excess_z1 > 0) &
+                   ~anyCell(self, self.theta[0] < self.theta_wp[0]) & ~anyCell(self, self.theta[1] < self.theta_wp[1]))
+            dry = np.broadcast_to(dry, (self.samples,) + (1,) * len(self.shape))
+            if np.all(dry):
+                zero = np.zeros_like(self.theta[0])
+                iro = {"roff": zero, "infil_z0": zero, "infil_z1": zero}
+            else:
+                iro = getTopLayerInfil_np(self, precip, drivers["CN2"], drivers["crop_type"], jd_sim,
+                                          drivers["jd_dev"], drivers["jd_mid"], drivers["jd_end"],
+                                          drivers["len_dev_stage"])
+                iro = dict((key, np.where(dry, np.float32(0), value)) for key, value in iro.items())
+                self.recordBatch('getTopLayerInfil', iro, rows=~dry.ravel())
+            runoff_z0 = iro["roff"]
+            self.theta[0] = (self.theta[0] * depth[0] + iro["infil_z0"]) / depth[0]
+            self.theta[1] = (self.theta[1] * depth[1] + iro["infil_z1"]) / depth[1]
+            self.theta[0] = np.minimum(self.theta[0], self.theta_sat[0])
+            self.theta[1] = np.minimum(self.theta[1], self.theta_sat[1])
+
+            percolation = []
+            for layer in range(self.num_layers):
+                permeable = True
+                if layer > 0:
+                    if layer == (self.num_layers - 1):
+                        permeable = self.bsmntIsPermeable
+                    self.theta[layer] = np.minimum(self.theta[layer], self.theta_sat[layer])
+                    self.theta[layer] = (self.theta[layer] * depth[layer] + percolation[layer - 1]) / depth[layer]
+                    self.theta[layer] = np.minimum(self.theta[layer], self.theta_sat[layer])
+                percolation.append(getPercolation_np(self, layer, k_sat[layer], isPermeable=permeable))
+                self.recordBatch('getPercolation', percolation[layer])
+                self.theta[layer] = (self.theta[layer] * depth[layer] - percolation[layer]) / depth[layer]
+
+            # Artificial drainage
+            adr_layer = 2
+            cell_drainge_outflow = getArtificialDrainage_np(self, adr_layer)
+            self.recordBatch('getArtificialDrainage', cell_drainge_outflow)
+            self.theta[adr_layer] = ((self.theta[adr_layer] * depth[adr_layer] - cell_drainge_outflow) /
+                                     depth[adr_layer])
+
+        # Lateral flow, all samples in one sweep of the ldd (routing.py)
+        latflow_m3 = np.zeros(self.samples)
+        if self.LF_scheme == 'manfreda':
+            lateral_flow, lateral_name = getLateralFlow_Manfreda_np, 'getLateralFlow_Manfreda'
+        else:
+            lateral_flow, lateral_name = getLateralFlow_np, 'getLateralFlow'
+        with np.errstate(all='ignore'):
+            for layer in range(self.num_layers):
+                latflow_dict = lateral_flow(self, layer, run=self.LF)
+                self.recordBatch(lateral_name, latflow_dict)
+                outflow = np.broadcast_to(latflow_dict['cell_outflow'], self.theta[layer].shape)
+                latflow_m3 += np.nansum(outflow[:, self.outlet_zone] * self.cell_area[self.outlet_zone] / 1000,
+                                        axis=1, dtype=np.float64)
+                theta = np.broadcast_to(latflow_dict['new_moisture'], self.theta[layer].shape)
+                # SAT correction only if the maximum of the sample exceeds the maximum of theta_sat
+                exceeded = cellMaxima(self, theta, theta.shape) > cellMaxima(self, self.theta_sat[layer], theta.shape)
+                self.theta[layer] = np.where(exceeded, np.minimum(theta, self.theta_sat[layer]), theta)
+
+        with np.errstate(all='ignore'):
+            # Evapotranspiration
+            etp_mm = np.float32(0)
+            for layer in range(self.num_layers):
+                act_evaporation_layer = np.float32(0)
+                if layer < 2:
+                    act_evaporation_layer = getActualEvap_np(self, layer, pot_evapor, run=self.ETP)
+                    self.recordBatch('getActualEvap', act_evaporation_layer)
+                    if layer == 0:
+                        pot_evapor = np.maximum(pot_evapor - act_evaporation_layer, 0)
+                self.theta[layer] = (self.theta[layer] * depth[layer] - act_evaporation_layer) / depth[layer]
+
+                act_transpir_layer = getActualTransp_np(self, layer, root_depth_tot, root_depth[layer],
+                                                        drivers["pot_transpir"], drivers["depletable_water"],
+                                                        run=self.ETP)
+                self.recordBatch('getActualTransp', act_transpir_layer)
+                act_transpir_layer = act_transpir_layer * self.f_transp
+                self.theta[layer] = (self.theta[layer] * depth[layer] - act_transpir_layer) / depth[layer]
+                etp_mm = etp_mm + act_evaporation_layer + act_transpir_layer
+
+            # Baseflow
+            SWbsmt = self.theta[-1] * depth[-1]
+            baseflow_mm = SWbsmt / self.k_g
+            self.theta[-1] = np.maximum((SWbsmt - baseflow_mm) / depth[-1], 0)
+
+            # Temperature
+            for layer in range(self.num_layers):
+                temp_dict = getLayerTemp_np(self, layer, drivers["temp_bare_soil"])
+                self.recordBatch('getLayerTemp', temp_dict)
+                if layer == 0:
+                    self.temp_surf_fin = temp_dict["temp_surface"]
+                self.temp_fin[layer] = temp_dict["temp_layer"]
+
+        # Outlet discharge (m3)
+        to_m3 = self.cell_area / 1000
+        runoff_m3, drain_m3, baseflow_m3, etp_m3 = self.outletTotals(
+            [runoff_z0 * to_m3, cell_drainge_outflow * to_m3, baseflow_mm * to_m3, etp_mm * to_m3])
+        self.batch_out['runoff_m3'].append(runoff_m3)
+        self.batch_out['latflow_m3'].append(latflow_m3)
+        self.batch_out['drain_m3'].append(drain_m3)
+        self.batch_out['baseflow_m3'].append(baseflow_m3)
+        self.batch_out['etp_m3'].append(etp_m3)
+        self.batch_out['q_m3'].append(runoff_m3 + latflow_m3 + drain_m3 + baseflow_m3)
+
+        self.jd_cum += self.jd_dt
+        if self.currentTimeStep() == self.nrTimeSteps():
+            self.saveBatch('batch_hydro.npz')
+            for row, trajectory in self.recordings:
+                closeRecording(trajectory)
+
+    def saveBatch(self, path):
+        """
+        Arrays shaped (time steps, samples), sample n <- row n-1 of the LHS matrix
+        """
+        out = dict((name, np.array(values)) for name, values in self.batch_out.items())
+        out['params'] = self.batch_params
+        np.savez(path, **out)
+
+
+def runBatch(names, param_values, upper, samples, first, last, test=False, trajectory='off'):
+    """
+    :param trajectory: 'record' -> hydrology trajectories for the fate runs of BeachModel (trajectory='auto')
+    """
+    model = BatchModel("clone_nom.map", names, param_values, upper, samples, test=test, trajectory=trajectory)
+    dynamicModel = DynamicFramework(model, lastTimeStep=last, firstTimestep=first)
+    dynamicModel.run()
+    return model
+
+
+class OutletRecorder(BeachModel):
+    """
+    BeachModel that keeps its outlet discharge terms (model.outlet_terms), as floats
+    """
+    def premcloop(self):
+        BeachModel.premcloop(self)
+        self.outlet_record = True
+        self.scalar_lane = True
+
+
+# Order of BeachModel.outlet_terms
+outlet_terms = ['q_m3', 'runoff_m3', 'latflow_m3', 'drain_m3', 'baseflow_m3', 'etp_m3']
+
+
+def compareBatch(names, param_values, upper, first, last, test=False, path='batch_diff.csv'):
+    """
+    Verification mode: the first LHS row with BatchModel and with BeachModel (sample 1)
+    :return: (time steps, terms) array of the absolute differences of the outlet terms (m3)
+    """
+    batch = runBatch(names, param_values, upper, 1, first, last, test=test)
+    model = OutletRecorder("clone_nom.map", names, param_values, upper, test=test)
+    MonteCarloFramework(DynamicFramework(model, lastTimeStep=last, firstTimestep=first), 1).run()
+
+    reference = np.array(model.outlet_terms, dtype=np.float64)
+    batched = np.stack([np.array(batch.batch_out[name])[:, 0] for name in outlet_terms], axis=1)
+    diff = np.abs(batched - reference)
+    with open(path, 'w') as f:
+        f.write('step,term,beach_m3,batch_m3,abs_diff\n')
+        for n, step in enumerate(range(first, last + 1)):
+            for i, name in enumerate(outlet_terms):
+                f.write(str(step) + ',' + name + ',' + repr(reference[n, i]) + ',' +
+                        repr(batched[n, i]) + ',' + repr(diff[n, i]) + '\n')
+    print("Batch vs BeachModel, max abs diff (m3): " +
+          ', '.join(name + ' ' + repr(float(np.nanmax(diff[:, i]))) for i, name in enumerate(outlet_terms)))
+    return diff
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+from pcraster import pcr2numpy
+from time import perf_counter
+import multiprocessing as mp
+import numpy as np
+import shutil
+import os
+
+from landscape import buildLandscape, toMap, value_scales
+from profiling import StageTimer, readTiming
+
+"""
+Synthetic-catchment benchmark
+
+makeCatchment() builds an input folder of a given number of cells from the Alteckendorf inputs:
+the catchment keeps its extent, the cell size shrinks (or grows) so that the clone has ~cells cells.
+ - elevation maps (dem_maps) are interpolated (bilinear), the other maps (masks, landuse, farm/plot
+   codes, initial theta & temperature) are resampled to the nearest cell
+ - the sampling points (*_out, *_ave: one cell per point, read by timeoutput) stay single cells,
+   the cell that contains the centre of the source cell (placePoints), at any size
+ - ldd_subs_v3 is derived from the new DEM (lddcreate), the outlets (out_multi_nom_v3, outlet_v3)
+   from its pits
+ - the forcing (.tss) and tables (.csv, .tbl, .txt) are copied: their columns are indexed
+   by landuse / farm codes, which are kept
+runBenchmark() times initial() and N dynamic() steps of BeachModel in each folder, one process
+per size (peak RSS is per process), and writes benchmark.csv:
+cells, catchment cells, steps, seconds, cells x steps per second, peak RSS and seconds per stage.
+
+Usage: runBenchmark(makeCatchments([10 ** 4, 10 ** 5, 10 ** 6]), steps=10)
+"""
+
+source_clone = 'clone_nom.map'
+dem_maps = ['dem_slope', 'dem_ldd', 'dem_ldd_burn3']
+derived_maps = ['ldd_subs_v3', 'out_multi_nom_v3', 'outlet_v3']
+copy_ext = ('.tss', '.tbl', '.csv', '.txt')
+point_suffixes = ('_out', '_ave')
+
+
+def resample(arr, shape, bilinear=False):
+    """
+    :param arr: (rows, cols) array, NaN = missing value
+    :return: arr at shape, over the same extent
+    """
+    rows = (np.arange(shape[0]) + 0.5) * arr.shape[0] / shape[0] - 0.5
+    cols = (np.arange(shape[1]) + 0.5) * arr.shape[1] / shape[1] - 0.5
+    nearest = arr[np.clip(np.rint(rows), 0, arr.shape[0] - 1).astype(np.int64)[:, None],
+                  np.clip(np.rint(cols), 0, arr.shape[1] - 1).astype(np.int64)[None, :]]
+    if not bilinear:
+        return nearest
+
+    r0 = np.clip(np.floor(rows), 0, arr.shape[0] - 2).astype(np.int64)
+    c0 = np.clip(np.floor(cols), 0, arr.shape[1] - 2).astype(np.int64)
+    fr = np.clip(rows - r0, 0, 1)[:, None]
+    fc = np.clip(cols - c0, 0, 1)[None, :]
+    r0 = r0[:, None]
+    c0 = c0[None, :]
+    value = (arr[r0, c0] * (1 - fr) * (1 - fc) + arr[r0 + 1, c0] * fr * (1 - fc) +
+             arr[r0, c0 + 1] * (1 - fr) * fc + arr[r0 + 1, c0 + 1] * fr * fc)
+    # Cells next to missing values keep the nearest value, missing values stay missing
+    return np.where(np.isnan(value), nearest, np.where(np.isnan(nearest), np.nan, value))
+
+
+def placePoints(arr, shape):
+    """
+    :param arr: (rows, cols) array of points, NaN = missing value
+    :return: array at shape, over the same extent, with each point in one cell
+    (two points in the same cell: the last one is kept)
+    """
+    out = np.full(shape, np.nan)
+    rows, cols = np.nonzero(np.isfinite(arr))
+    to_rows = np.minimum(((rows + 0.5) * shape[0] / arr.shape[0]).astype(np.int64), shape[0] - 1)
+    to_cols = np.minimum(((cols + 0.5) * shape[1] / arr.shape[1]).astype(np.int64), shape[1] - 1)
+    out[to_rows, to_cols] = arr[rows, cols]
+    return out
+
+
+def makeCatchment(folder, cells, source='.'):
+    """
+    :param cells: approximate number of cells of the clone
+    :return: folder
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    setclone(os.path.join(source, source_clone))
+    rows, cols = clone().nrRows(), clone().nrCols()
+    factor = np.sqrt(float(cells) / (rows * cols))
+    shape = (max(int(round(rows * factor)), 2), max(int(round(cols * factor)), 2))
+    cell_size = clone().cellSize() * cols / shape[1]
+    west, north = clone().west(), clone().north()
+
+    maps = dict()
+    for name in sorted(os.listdir(source)):
+        stem, ext = os.path.splitext(name)
+        if ext == '.map' and stem not in derived_maps:
+            value = readmap(os.path.join(source, name))
+            maps[stem] = (pcr2numpy(scalar(value), np.nan), value_scales.index(value.dataType()))
+        elif ext in copy_ext:
+            shutil.copy(os.path.join(source, name), os.path.join(folder, name))
+
+    setclone(shape[0], shape[1], cell_size, west, north)
+    for stem, (arr, vs) in maps.items():
+        if stem.endswith(point_suffixes):
+            value = placePoints(arr, shape)
+        else:
+            value = resample(arr, shape, bilinear=stem in dem_maps)
+        report(toMap(value, value_scales[vs]), os.path.join(folder, stem + '.map'))
+
+    # Drainage network and outlets of the new DEM
+    is_catchment = defined(readmap(os.path.join(folder, 'dem_ldd_burn3.map')))
+    ldd = lddcreate(ifthen(is_catchment, readmap(os.path.join(folder, 'dem_slope.map'))), 1e31, 1e31, 1e31, 1e31)
+    is_pit = pit(ldd) != 0
+    up_area = accuflux(ldd, scalar(1))
+    report(ldd, os.path.join(folder, 'ldd_subs_v3.map'))
+    report(ifthen(is_catchment, nominal(ifthenelse(is_pit, scalar(1), scalar(0)))),
+           os.path.join(folder, 'out_multi_nom_v3.map'))
+    report(ifthen(is_pit & (up_area == mapmaximum(up_area)), nominal(1)), os.path.join(folder, 'outlet_v3.map'))
+    return folder
+
+
+def makeCatchments(sizes, base='benchmark', source='.'):
+    """
+    :return: folders <base>/<cells>
+    """
+    return [makeCatchment(os.path.join(base, str(cells)), cells, source=source) for cells in sizes]
+
+
+def getPeakRSS():
+    """
+    :return: peak resident set size of the process (MB), None if unknown (no resource module)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.  # kB on Linux
+
+
+def runCatchment(job):
+    """
+    Worker: one timed run of BeachModel in job['folder']
+    """
+    from model_g10 import BeachModel, start_jday, names
+    from mlhs_v15 import get_vector_test
+
+    class BenchmarkModel(BeachModel):
+        def premcloop(self):
+            BeachModel.premcloop(self)
+            self.profile = True
+            self.timer = StageTimer(self.profile)
+
+        def initial(self):
+            t0 = perf_counter()
+            BeachModel.initial(self)
+            self.initial_seconds = perf_counter() - t0
+
+    base_dir = os.getcwd()
+    os.chdir(job['folder'])
+    try:
+        buildLandscape(source_clone)
+        catchment_cells = int(np.sum(np.isfinite(pcr2numpy(scalar(readmap('dem_ldd_burn3')), np.nan))))
+        values = get_vector_test()
+        model = BenchmarkModel(source_clone, names, values, np.ones(len(values)).tolist(),
+                               staticDT50=False, test=True)
+        first = start_jday()
+        dynamicModel = DynamicFramework(model, lastTimeStep=first + job['steps'] - 1, firstTimestep=first)
+        MonteCarloFramework(dynamicModel, 1).run()
+        stages, steps, sums = readTiming(os.path.join('1', 'timing.csv'))
+    finally:
+        os.chdir(base_dir)
+
+    return {'folder': job['folder'], 'cells': clone().nrRows() * clone().nrCols(),
+            'catchment_cells': catchment_cells, 'steps': steps,
+            'initial_s': model.initial_seconds, 'dynamic_s': sums['total'],
+            'cell_steps_per_s': catchment_cells * steps / sums['total'],
+            'peak_rss_mb': getPeakRSS(), 'stages': [(stage, sums[stage]) for stage in stages if stage != 'total']}
+
+
+def runBenchmark(folders, steps=10, path='benchmark.csv'):
+    """
+    :param folders: inputs of makeCatchment(), each run in its own process
+    :return: list of results (dict), also written to path
+    """
+    results = []
+    for folder in folders:
+        pool = mp.Pool(processes=1)
+        try:
+            results.append(pool.apply(runCatchment, ({'folder': folder, 'steps': steps},)))
+        finally:
+            pool.close()
+            pool.join()
+        res = results[-1]
+        print("Benchmark " + folder + ": " + str(res['catchment_cells']) + " cells, " +
+              str(round(res['cell_steps_per_s'])) + " cells x steps / s")
+
+    stages = []
+    for res in results:
+        for stage, _ in res['stages']:
+            if stage not in stages:
+                stages.append(stage)
+    columns = ['folder', 'cells', 'catchment_cells', 'steps', 'initial_s', 'dynamic_s',
+               'cell_steps_per_s', 'peak_rss_mb']
+    with open(path, 'w') as f:
+        f.write(','.join(columns + stages) + '\n')
+        for res in results:
+            stage_s = dict(res['stages'])
+            f.write(','.join([str(res[c]) for c in columns] + [repr(stage_s.get(s, 0.)) for s in stages]) + '\n')
+    return results
+
+
+if __name__ == "__main__":
+    runBenchmark(makeCatchments([10 ** 4, 10 ** 5, 10 ** 6]), steps=10)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+from pcraster import pcr2numpy, numpy2pcr, Scalar
+import numpy as np
+import json
+import os
+
+"""
+Checkpoint / restart
+
+The state of BeachModel that is carried from one time step to the next is written to a
+compressed .npz file: maps as float32 arrays (NaN = missing value), per-layer lists as
+one array per layer and numbers as 0-d arrays.
+A checkpoint written at time step t resumes the run at t + 1 (firstTimestep of the DynamicFramework).
+"""
+
+# Physical state: soil moisture, temperature, pesticide masses and the clocks of the model.
+# The *_ini lists and theta_ini hold the previous time step (change in storage).
+physical_state = ['theta', 'theta_ini', 'temp_fin', 'temp_surf_fin',
+                  'lightmass', 'heavymass', 'light_aged', 'heavy_aged', 'light_real', 'heavy_real',
+                  'lightmass_ini', 'heavymass_ini', 'lightaged_ini', 'heavyaged_ini',
+                  'delta', 'delta_real', 'delta_aged',
+                  'aged_days', 'volat_days', 'jd_cum', 'rain_cum_mm',
+                  'active', 'active_layers']  # Active set of the fate (activeset.py)
+
+# Cumulative balances and Nash accumulators
+accumulated_state = ['water_balance', 'days_cum', 'q_diff', 'q_var', 'q_obs_cum', 'q_sim_cum', 'q_sim_ave',
+                     'out_conc_diff', 'out_conc_var', 'out_lnconc_diff', 'out_lnconc_var',
+                     'out_iso_diff', 'out_iso_var', 'rain_cum_m3']
+accumulated_prefix = ('cum_', 'tot_')
+accumulated_suffix = ('Conc_diff', 'Conc_var', 'Iso_diff', 'Iso_var')
+static_state = ['tot_depth']  # Matches the prefix, but is set from the parameters in initial()
+
+
+def getStateNames(model):
+    names = physical_state + accumulated_state
+    for name in sorted(vars(model)):
+        if name.startswith(accumulated_prefix) or name.endswith(accumulated_suffix):
+            if name not in names and name not in static_state:
+                names.append(name)
+    return [name for name in names if hasattr(model, name)]
+
+
+def isNumber(value):
+    return isinstance(value, (int, float, np.number))
+
+
+def toArray(value):
+    if isNumber(value):
+        return np.asarray(value)
+    return pcr2numpy(spatial(scalar(value)), np.nan).astype(np.float32)
+
+
+def saveCheckpoint(model, path, step=None):
+    """
+    :param path: .npz file, e.g. '1/checkpoint_200.npz'
+    :param step: time step of the state (default: current time step)
+    """
+    if step is None:
+        step = model.currentTimeStep()
+    arrays = dict()
+    index = dict()  # name: number of layers, or None for single values
+    for name in getStateNames(model):
+        value = getattr(model, name)
+        if isinstance(value, list):
+            index[name] = len(value)
+            for layer in range(len(value)):
+                arrays[name + '/' + str(layer)] = toArray(value[layer])
+        else:
+            index[name] = None
+            arrays[name] = toArray(value)
+
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    np.savez_compressed(path, step=np.asarray(step), index=np.asarray(json.dumps(index)), **arrays)
+
+
+def fromArray(arr):
+    if arr.ndim == 0:
+        return arr.item()
+    return numpy2pcr(Scalar, arr, np.nan)
+
+
+def getCheckpointStep(path):
+    with np.load(path) as data:
+        return int(data['step'])
+
+
+def loadCheckpoint(model, path, names=None):
+    """
+    Overwrites the state set in initial() with the checkpoint values.
+    :param names: state variables to restore (default: all in the file)
+    :return: time step of the checkpoint
+    """
+    with np.load(path) as data:
+        index = json.loads(str(data['index']))
+        for name, layers in index.items():
+            if names is not None and name not in names:
+                continue
+            if layers is None:
+                setattr(model, name, fromArray(data[name]))
+            else:
+                setattr(model, name, [fromArray(data[name + '/' + str(layer)]) for layer in range(layers)])
+        return int(data['step'])
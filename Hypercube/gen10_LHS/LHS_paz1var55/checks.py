@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+from pcraster import pcr2numpy
+import numpy as np
+
+"""
+State checks
+
+The state of the model (moisture, pesticide masses) is checked for negative values and,
+where a capacity is given, for values above it (e.g. theta_sat). Both tests are one reduction
+of the map: max(-x, x - upper), so a check costs one conversion and one pass over the raster.
+Violations are collected in model.check_report, not printed:
+(time step, where, variable, layer, max. violation, nr. of cells)
+The corrections of the model (theta clamped to [0, theta_sat], masses >= 0) keep their own
+conditions at every level, e.g. theta is only clamped before the lateral flow if a cell exceeds
+theta_sat: cellMax() / cellMin() are these branch tests (one conversion, as a check).
+
+Levels (model.check_level, set in premcloop):
+ - 'off': no checks (calibration runs)
+ - 'sampled': every model.check_every time steps
+ - 'full': every time step
+ - 'strict': every time step, the first violation raises ValueError
+"""
+
+check_levels = ['off', 'sampled', 'full', 'strict']
+
+
+def isChecking(model):
+    level = getattr(model, 'check_level', 'full')
+    if level == 'off':
+        return False
+    if level == 'sampled':
+        return model.currentTimeStep() % max(int(getattr(model, 'check_every', 1)), 1) == 0
+    return True
+
+
+def asCells(value):
+    if isinstance(value, np.ndarray):
+        return value
+    return pcr2numpy(spatial(scalar(value)), np.nan)
+
+
+def cellMax(value):
+    """ mapmaximum(value) as a float, -inf if all cells are missing """
+    x = asCells(value)
+    return float(np.nanmax(x)) if np.any(np.isfinite(x)) else -np.inf
+
+
+def cellMin(value):
+    """ mapminimum(value) as a float, inf if all cells are missing """
+    x = asCells(value)
+    return float(np.nanmin(x)) if np.any(np.isfinite(x)) else np.inf
+
+
+def checkState(model, where, name, value, layer=None, upper=None, tol=0.):
+    """
+    :param value: map or numpy array
+    :param where: process that produced the value, e.g. 'LCH'
+    :param upper: capacity (map or number), None = only negative values are checked
+    :param tol: violations up to tol are not recorded
+    :return: max. violation (0 if none, or not checked)
+    """
+    if not isChecking(model):
+        return 0.
+    x = asCells(value)
+    violation = -x
+    if upper is not None:
+        violation = np.maximum(violation, x - asCells(upper))
+    with np.errstate(invalid='ignore'):
+        worst = float(np.nanmax(violation)) if np.any(np.isfinite(violation)) else 0.
+        if worst <= tol:
+            return 0.
+        cells = int(np.sum(violation > tol))
+
+    if not hasattr(model, 'check_report'):
+        model.check_report = []
+    model.check_report.append((model.currentTimeStep(), where, name, layer, worst, cells))
+    if getattr(model, 'check_level', 'full') == 'strict':
+        raise ValueError("Check failed at step " + str(model.currentTimeStep()) + ', ' + where + ': ' + name +
+                         ('' if layer is None else ', layer ' + str(layer)) + ' by ' + str(worst))
+    return worst
+
+
+def checkMasses(model, where, layer):
+    """ Light and heavy pesticide mass of a layer >= 0 """
+    checkState(model, where, 'lightmass', model.lightmass[layer], layer)
+    checkState(model, where, 'heavymass', model.heavymass[layer], layer)
+
+
+def checkTheta(model, where, layer, tol=0.):
+    """ 0 <= theta <= theta_sat of a layer """
+    checkState(model, where, 'theta', model.theta[layer], layer, upper=model.theta_sat[layer], tol=tol)
+
+
+def reportChecks(model, path='checks.csv'):
+    with open(path, 'w') as f:
+        f.write('step,where,variable,layer,max_violation,cells\n')
+        for step, where, name, layer, worst, cells in getattr(model, 'check_report', []):
+            f.write(str(step) + ',' + where + ',' + name + ',' + ('' if layer is None else str(layer)) + ',' +
+                    repr(worst) + ',' + str(cells) + '\n')
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+from pcraster import pcr2numpy, numpy2pcr, Scalar
+import numpy as np
+
+from routing import getRouting, getOutletIndex
+
+"""
+Compressed catchment cells
+
+The clone rectangle is mostly outside the catchment (dem_ldd_burn3 footprint), where all
+maps are missing values. With model.compact the array backend (hydro_np.py, batch.py) keeps
+only the active cells (catchment or ldd) as 1-D arrays, (..., cells) instead of (..., rows, cols):
+ - index['cells']: flat raster index of each active cell
+ - index['pos']: raster -> position in the vector (-1: not active)
+Maps are compressed once when converted (asArray) and scattered back to the raster only for
+PCRaster / reporting (asMap). The ldd neighbour relations and the outlet index are the ones of
+routing.py, renumbered to vector positions, so the routing operators run on the vectors as well.
+
+Scope: only the water balance uses the vectors, i.e. the array backend of hydro_np.py
+(hydro_backend 'numpy' or 'numba') and BatchModel, where compact is always on. With the default
+hydro_backend 'pcraster' model.compact has no effect. The pesticide fate (pesti_v4.py, including
+the *Pair functions) is PCRaster map algebra and always runs on the full clone rasters.
+"""
+
+
+def buildCellIndex(model):
+    active = pcr2numpy(cover(defined(model.mask) | defined(model.ldd_subs), boolean(0)), 0).ravel() > 0
+    cells = np.flatnonzero(active)
+    pos = np.full(active.size, -1, dtype=np.int64)
+    pos[cells] = np.arange(len(cells))
+    return {'shape': (clone().nrRows(), clone().nrCols()), 'cells': cells, 'pos': pos}
+
+
+def getCellIndex(model):
+    """
+    Active cells of the model, built on first use
+    """
+    try:
+        return model.cell_index
+    except AttributeError:
+        model.cell_index = buildCellIndex(model)
+        return model.cell_index
+
+
+def isCompact(model):
+    return getattr(model, 'compact', False)
+
+
+def compressCells(index, x):
+    """
+    :param x: map, or raster array (..., rows, cols)
+    :return: (..., cells) array
+    """
+    if not isinstance(x, np.ndarray):
+        x = pcr2numpy(spatial(scalar(x)), np.nan)
+    return x.reshape(x.shape[:-2] + (-1,))[..., index['cells']]
+
+
+def scatterCells(index, values):
+    """
+    :param values: (..., cells) array
+    :return: (..., rows, cols) float32 array, NaN outside the active cells
+    """
+    values = np.asarray(values)
+    rows, cols = index['shape']
+    out = np.full(values.shape[:-1] + (rows * cols,), np.nan, dtype=np.float32)
+    out[..., index['cells']] = values
+    return out.reshape(values.shape[:-1] + (rows, cols))
+
+
+def toMap(index, values):
+    return numpy2pcr(Scalar, scatterCells(index, values), np.nan)
+
+
+def compactRouting(routing, index):
+    """
+    :return: routing of routing.py over the vector of active cells (shape (cells,))
+    """
+    compact = dict(routing)
+    compact['shape'] = (len(index['cells']),)
+    compact['cells'] = index['pos'][routing['cells']]
+    return compact
+
+
+def compactOutletIndex(outlet_index, index):
+    compact = dict(outlet_index)
+    compact['cells'] = index['pos'][outlet_index['cells']]
+    compact['codes'] = outlet_index['codes'][index['cells']]
+    compact['ndim'] = 1
+    return compact
+
+
+def getArrayRouting(model):
+    """
+    Routing for the array backend: over the active cells with model.compact, else over the raster
+    """
+    if not isCompact(model):
+        return getRouting(model)
+    try:
+        return model.cell_routing
+    except AttributeError:
+        model.cell_routing = compactRouting(getRouting(model), getCellIndex(model))
+        return model.cell_routing
+
+
+def getArrayOutletIndex(model):
+    if not isCompact(model):
+        return getOutletIndex(model)
+    try:
+        return model.cell_outlet_index
+    except AttributeError:
+        model.cell_outlet_index = compactOutletIndex(getOutletIndex(model), getCellIndex(model))
+        return model.cell_outlet_index
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+from pcraster import pcr2numpy, numpy2pcr, Scalar
+import numpy as np
+
+"""
+Crop parameter cache
+
+croptable.tbl is a PCRaster matrix table: the first row holds the column numbers,
+the first column holds the landuse code (the "fields" value). Instead of calling
+lookupscalar('croptable.tbl', col, fields) for every column on every time step,
+the table is parsed once and the per-cell maps are rebuilt only if the fields map changes.
+"""
+
+# Column number in croptable.tbl
+crop_columns = {
+    'crop_type': 1,
+    'sow_yy': 2,
+    'sow_mm': 3,  # sowing or Greenup month
+    'sow_dd': 4,  # sowing day
+    'len_grow_stage_ini': 5,  # Lini. length of initial crop growth stage
+    'len_dev_stage': 6,  # Ldev: length of development stage
+    'len_mid_stage': 7,  # Lmid: length of mid-season stage
+    'len_end_stage': 8,  # Lend: length of late season stage
+    'kcb_ini': 9,  # basal crop coefficient at initial stage
+    'kcb_mid': 10,  # basal crop coefficient at mid season stage
+    'kcb_end': 11,  # basal crop coefficient at late season stage
+    'max_LAI': 12,  # maximum leaf area index
+    'mu': 13,  # light use efficiency
+    'max_height': 14,  # maximum crop height
+    'max_root_depth': 15,  # [m]
+    'p_tab': 16,  # depletable theta before water stress
+    'k_sat_z2z3': 17,  # saturated conductivity of the second layer
+    'CN2_A': 18,  # curve number of moisture condition II
+    'CN2_B': 19,
+    'CN2_C': 20,
+    'CN2_D': 21
+}
+
+
+def readCropTable(path='croptable.tbl'):
+    """
+    :param path: PCRaster matrix table
+    :return: dict with sorted landuse codes and a (codes x columns) value matrix
+    """
+    with open(path, 'r') as f:
+        rows = [line.split() for line in f if line.strip()]
+    header = [int(round(float(col))) for col in rows[0][1:]]
+    codes = np.array([float(row[0]) for row in rows[1:]])
+    values = np.array([[float(v) for v in row[1:]] for row in rows[1:]])
+
+    order = np.argsort(codes)
+    return {'codes': codes[order],
+            'values': values[order],
+            'columns': dict((col, i) for i, col in enumerate(header))}
+
+
+def buildCropMaps(table, fields_arr):
+    codes = table['codes']
+    pos = np.clip(np.searchsorted(codes, fields_arr), 0, len(codes) - 1)
+    # Cells whose code is not in the table are missing values, as with lookupscalar()
+    found = np.isfinite(fields_arr) & (codes[pos] == fields_arr)
+
+    maps = dict()
+    for name, col in crop_columns.items():
+        column = table['values'][:, table['columns'][col]]
+        cell_values = np.where(found, column[pos], np.nan)
+        maps[name] = numpy2pcr(Scalar, cell_values, np.nan)
+    return maps
+
+
+def getCropParams(model, fields):
+    """
+    :param fields: landuse class map (timeinputscalar of landuse.tss), or its numpy array
+    :return: dictionary of crop parameter maps, keyed as in crop_columns
+    """
+    try:
+        model.crop_table
+    except AttributeError:
+        model.crop_table = readCropTable('croptable.tbl')
+
+    if isinstance(fields, np.ndarray):
+        fields_arr = fields
+    else:
+        fields_arr = pcr2numpy(fields, np.nan)
+    cache = getattr(model, 'crop_cache', None)
+    if cache is not None and np.array_equal(cache['fields'], fields_arr, equal_nan=True):
+        return cache['maps']
+
+    maps = buildCropMaps(model.crop_table, fields_arr)
+    model.crop_cache = {'fields': fields_arr, 'maps': maps}
+    return maps
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+import multiprocessing as mp
+import numpy as np
+import shutil
+import os
+
+from mlhs_v15 import get_hydro_groups
+from trajectory import hasTrajectory
+
+"""
+Parallel Monte Carlo runner
+
+Each LHS row is handed to a worker process. The worker runs a one-sample
+MonteCarloFramework inside its own working directory (inputs are linked, not copied)
+and the resulting "1/" folder is moved back as "<sample>/", i.e. the same layout
+MonteCarloFramework(dynamicModel, samples) produces when run serially.
+Sample n always reads row n-1 of the LHS matrix.
+A restart (resume, '{sample}' -> n) and a spin-up checkpoint are read from the base directory.
+
+With trajectory='auto' (trajectory.py) the samples are scheduled by hydrology group
+(mlhs_v15.get_hydro_groups): one sample of each group solves and records the water model,
+the others run once its trajectory is complete and replay it. If the recorder leaves no
+trajectory (aborted by the objective bounds), the next sample of the group records, so
+there is never more than one recorder per group. The trajectories folder is shared by
+the worker directories.
+"""
+
+# Inputs linked into each worker directory
+input_ext = ('.map', '.tss', '.tbl', '.csv', '.txt', '.dat', '.json')  # .dat/.json: landscape cache
+shared_dirs = ('trajectories',)  # Folders linked into each worker directory
+
+
+def prepareWorkDir(base_dir, sample):
+    work_dir = os.path.join(base_dir, '_work', str(sample))
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+
+    for name in os.listdir(base_dir):
+        if not name.endswith(input_ext) and name not in shared_dirs:
+            continue
+        src = os.path.join(base_dir, name)
+        dst = os.path.join(work_dir, name)
+        try:
+            os.symlink(src, dst)
+        except (OSError, AttributeError):  # No symlinks (e.g. Windows w/o privileges)
+            shutil.copy(src, dst)
+    return work_dir
+
+
+def getSampleVector(sample, param_values, test=False):
+    """
+    :param sample: Monte Carlo sample number (1-based)
+    :param param_values: numpy LHS matrix (or a single vector if test)
+    :return: a 1-row matrix holding the parameters of this sample
+    """
+    if test:
+        return param_values  # Test vector, same for all samples
+    return np.atleast_2d(param_values[sample - 1])
+
+
+def getSampleCheckpoints(job):
+    """
+    :return: resume & spinup paths of the sample (absolute, the worker runs in its own directory)
+    """
+    resume = job.get('resume')
+    if resume is not None:
+        resume = os.path.join(job['base_dir'], resume.format(sample=job['sample']))
+    spinup = job.get('spinup')
+    if spinup is not None:
+        spinup = os.path.join(job['base_dir'], spinup)
+    return resume, spinup
+
+
+def runSample(job):
+    model_class = job['model_class']
+    base_dir = job['base_dir']
+    sample = job['sample']
+    resume, spinup = getSampleCheckpoints(job)
+
+    work_dir = prepareWorkDir(base_dir, sample)
+    os.chdir(work_dir)
+    try:
+        vector = getSampleVector(sample, job['param_values'], test=job['test'])
+        model = model_class(job['clone'], job['names'], vector, job['upper'],
+                            staticDT50=job['staticDT50'], test=job['test'], trajectory=job['trajectory'],
+                            resume=resume, spinup=spinup)
+        dynamicModel = DynamicFramework(model, lastTimeStep=job['last'], firstTimestep=job['first'])
+        mcModel = MonteCarloFramework(dynamicModel, 1)
+        mcModel.run()
+        complete = hasTrajectory(model)
+    finally:
+        os.chdir(base_dir)
+
+    # Merge: <work>/1/ -> <base>/<sample>/
+    out_dir = os.path.join(base_dir, str(sample))
+    if resume is not None and os.path.isdir(out_dir):
+        # Keep the earlier checkpoints of the sample, the new files replace the old ones
+        for name in os.listdir(os.path.join(work_dir, '1')):
+            if os.path.exists(os.path.join(out_dir, name)):
+                os.remove(os.path.join(out_dir, name))
+            shutil.move(os.path.join(work_dir, '1', name), os.path.join(out_dir, name))
+    else:
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        shutil.move(os.path.join(work_dir, '1'), out_dir)
+    shutil.rmtree(work_dir)
+    return sample, complete
+
+
+def getSampleGroups(names, param_values, samples, test=False):
+    """
+    :return: samples of each hydrology group
+    """
+    if test:  # Same test vector for all samples
+        return [list(range(1, samples + 1))]
+    return [[row + 1 for row in rows] for rows in get_hydro_groups(param_values[:samples], names)]
+
+
+def getNextWave(groups, ready):
+    """
+    Removes the samples of the next wave from groups: all samples of the groups with a
+    trajectory (ready), one recorder of each other group
+    """
+    wave = []
+    for i in range(len(groups)):
+        if ready[i]:
+            wave += groups[i]
+            groups[i] = []
+        elif groups[i]:
+            wave.append(groups[i].pop(0))
+    return sorted(wave)
+
+
+def runEnsemble(model_class, clone, names, param_values, upper, samples,
+                first, last, workers=None, staticDT50=False, test=False, trajectory='off',
+                resume=None, spinup=None):
+    """
+    :param model_class: BeachModel (must be importable by the worker processes)
+    :param samples: number of Monte Carlo samples, sample n <- row n-1
+    :param workers: number of processes, defaults to all cores
+    :param trajectory: trajectory mode of the samples ('off' or 'auto': one water solution per hydrology group)
+    :param resume: checkpoint of each sample, e.g. '{sample}/checkpoint_200.npz' (relative to the base directory)
+    :param spinup: shared spin-up checkpoint
+    :return: list of completed sample numbers
+    """
+    base_dir = os.getcwd()
+    if workers is None:
+        workers = mp.cpu_count()
+    workers = max(1, min(int(workers), int(samples)))
+
+    if trajectory == 'off':
+        groups = [list(range(1, samples + 1))]
+        ready = [True]
+    else:
+        if resume is not None and '{sample}' in resume:  # Own initial state -> own trajectory (getHydroKey)
+            groups = [[sample] for sample in range(1, samples + 1)]
+        else:
+            groups = getSampleGroups(names, param_values, samples, test=test)
+        ready = [False] * len(groups)
+        if not os.path.isdir(os.path.join(base_dir, 'trajectories')):
+            os.makedirs(os.path.join(base_dir, 'trajectories'))
+        print("Hydrology groups: " + str(len(groups)) + " of " + str(samples) + " samples")
+    group_of = dict((sample, i) for i in range(len(groups)) for sample in groups[i])
+
+    done = []
+    pool = mp.Pool(processes=workers)
+    try:
+        while any(groups):
+            wave = getNextWave(groups, ready)
+            jobs = []
+            for sample in wave:
+                jobs.append({'model_class': model_class, 'clone': clone, 'names': names,
+                             'param_values': param_values, 'upper': upper,
+                             'staticDT50': staticDT50, 'test': test, 'trajectory': trajectory,
+                             'first': first, 'last': last, 'resume': resume, 'spinup': spinup,
+                             'base_dir': base_dir, 'sample': sample})
+            for sample, complete in pool.imap_unordered(runSample, jobs):
+                if complete:
+                    ready[group_of[sample]] = True
+                done.append(sample)
+                print("Finished sample " + str(sample) + " (" + str(len(done)) + "/" + str(samples) + ")")
+    finally:
+        pool.close()
+        pool.join()
+
+    work_root = os.path.join(base_dir, '_work')
+    if os.path.isdir(work_root) and not os.listdir(work_root):
+        os.rmdir(work_root)
+    return sorted(done)
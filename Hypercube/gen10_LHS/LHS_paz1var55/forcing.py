@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+from pcraster import pcr2numpy, numpy2pcr, Scalar
+import numpy as np
+import os
+
+"""
+Forcing store
+
+timeinputscalar('x.tss', idmap) re-scans the file on every time step to find the row.
+Here each driver file is parsed once into a (time steps x columns) numpy array; the map
+of a time step is then a row slice indexed by the id map (landuse, clone_nom or outlet_v3),
+i.e. the same cell values timeinputscalar() returns.
+The arrays are read-only and can be shared by all Monte Carlo samples.
+"""
+
+# name: (file, id map). Id map None -> column 1 for all cells (timeinputscalar(file, 1))
+forcing_files = {
+    'landuse': ('landuse.tss', 'landuse'),
+    'thetaSat_agr': ('thetaSat_agr.tss', 'landuse'),
+    'thetaFC_agr': ('thetaFC_agr.tss', 'landuse'),
+    'p_b_agr': ('p_b_agr.tss', 'landuse'),
+    'cover_frac': ('cover_frac.tss', 'landuse'),
+    'ksats': ('ksats.tss', 'landuse'),
+    'height': ('height.tss', 'landuse'),
+    'rain': ('rain.tss', None),
+    'ET0': ('ET0.tss', None),
+    'U2': ('U2.tss', None),
+    'RHmin': ('RHmin.tss', None),
+    'T_bare': ('T_bare.tss', 'clone_nom'),
+    'airTemp': ('airTemp.tss', 'clone_nom'),
+    'q_obs_m3day': ('q_obs_m3day.tss', 'outlet_v3'),
+    'Conc_ugL': ('Conc_ugL.tss', 'outlet_v3')
+}
+
+
+def isNumericRow(row):
+    try:
+        [float(v) for v in row]
+    except ValueError:
+        return False
+    return True
+
+
+def readTss(path):
+    """
+    :param path: PCRaster timeseries, with or without header (title, nr. of columns, column names)
+    :return: (first time step, values matrix without the time column)
+    """
+    with open(path, 'r') as f:
+        rows = [line.split() for line in f if line.strip()]
+    start = 0
+    if not isNumericRow(rows[0]):
+        start = 2 + int(float(rows[1][0]))
+    data = np.array([[float(v) for v in row] for row in rows[start:]])
+    data[np.abs(data) >= 1e30] = np.nan  # PCRaster missing value (1e31)
+
+    # Rows must be consecutive time steps, so that row = step - first
+    steps = data[:, 0]
+    if not np.all(np.diff(steps) == 1):
+        raise ValueError(path + ": time steps are not consecutive")
+    values = np.ascontiguousarray(data[:, 1:])
+    values.setflags(write=False)
+    return int(steps[0]), values
+
+
+def getIdColumns(id_map):
+    """
+    :param id_map: nominal map with the column number of each cell
+    :return: (0-based column index, valid cell mask)
+    """
+    ids = pcr2numpy(nominal(id_map), 0).astype(np.int64)
+    return ids - 1, ids >= 1
+
+
+def loadForcing(model):
+    """
+    Parses all driver files once (premcloop). Files missing in the directory are skipped.
+    """
+    id_maps = {'landuse': model.landuse,
+               'clone_nom': readmap('clone_nom'),
+               'outlet_v3': readmap('outlet_v3')}
+    id_columns = dict()
+
+    model.forcing = dict()
+    for name, (path, id_name) in forcing_files.items():
+        if not os.path.exists(path):
+            continue
+        first, values = readTss(path)
+        if id_name is not None and id_name not in id_columns:
+            id_columns[id_name] = getIdColumns(id_maps[id_name])
+        cols = None
+        if id_name is not None:
+            col, valid = id_columns[id_name]
+            # Ids beyond the number of columns -> missing value, as timeinputscalar()
+            valid = valid & (col < values.shape[1])
+            cols = (np.where(valid, col, 0), valid)
+        model.forcing[name] = {'first': first, 'values': values, 'cols': cols}
+
+
+def getForcingRow(model, name, step=None):
+    store = model.forcing[name]
+    if step is None:
+        step = model.currentTimeStep()
+    row = step - store['first']
+    if row < 0 or row >= store['values'].shape[0]:
+        raise ValueError(name + ": no record for time step " + str(step))
+    return store['values'][row]
+
+
+def isDry(model, name='rain', step=None):
+    """
+    :return: True if the series is exactly 0 at the time step, in every column read by the model
+    """
+    row = getForcingRow(model, name, step)
+    cols = model.forcing[name]['cols']
+    if cols is None:
+        return bool(row[0] == 0)
+    col, valid = cols
+    return bool(np.all(row[col][valid] == 0))
+
+
+def getForcingArray(model, name, step=None):
+    """
+    :return: numpy array of the cell values (NaN = missing value), or a float if
+    the series has a single column for all cells
+    """
+    row = getForcingRow(model, name, step)
+    cols = model.forcing[name]['cols']
+    if cols is None:
+        return float(row[0])
+    col, valid = cols
+    return np.where(valid, row[col], np.nan)
+
+
+def getForcing(model, name, step=None):
+    """
+    :return: map of the current time step, equivalent to timeinputscalar()
+    """
+    values = getForcingArray(model, name, step)
+    if model.forcing[name]['cols'] is None:
+        return scalar(values)
+    return numpy2pcr(Scalar, values, np.nan)
@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+from pcraster import pcr2numpy, numpy2pcr, Scalar
+import numpy as np
+
+import hydro_v3
+from checks import checkState
+from compact import isCompact, getCellIndex, compressCells, toMap, getArrayRouting
+from routing import upstreamTotal, downstreamValue, accuFlux, accuFractionFlux, accuCapacityFlux
+from trajectory import isReplaying, recordHydro, replayHydro
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+"""
+Array backend for the vertical (cell-wise) water balance of hydro_v3
+
+getTopLayerInfil(), runoff_SCS(), getPercolation(), getArtificialDrainage(),
+getActualEvap(), getActualTransp() and getLayerTemp() only use cell-wise map algebra.
+Here each process is a single kernel on float32 numpy arrays (the cell type of PCRaster scalar maps),
+so a layer is computed without the intermediate PCRaster fields of every operator.
+getLateralFlow() and getLateralFlow_Manfreda() run on the precomputed ldd order of routing.py.
+
+Backends (model.hydro_backend, set in premcloop):
+ - 'pcraster': hydro_v3 functions (default)
+ - 'numpy': kernels below
+ - 'numba': kernels below compiled with numba.njit (if installed), float32 as 'numpy' up to the
+   rounding of the compiled operations (selfcheck.checkHydroArrays)
+If model.hydro_compare is True both backends are run, the PCRaster result is used and
+differences are collected in model.hydro_diff (see compareResults()).
+With model.compact the arrays only hold the catchment cells, as 1-D vectors (compact.py);
+the results are scattered back to raster maps for the fate (pesti_v4.py), which is not compacted.
+
+Usage: runHydro(self, getPercolation, layer, k_sat[layer], isPermeable=permeable)
+"""
+
+
+def asArray(model, x):
+    """
+    :param x: PCRaster map (spatial or not) or number
+    :return: float32 array, NaN = missing value. Maps are converted once per time step.
+    With model.compact: (cells,) vector of the active cells (compact.py)
+    """
+    if isinstance(x, (int, float, np.number)):
+        return np.float32(x)
+    if isinstance(x, np.ndarray):
+        return x
+
+    step = model.currentTimeStep()
+    cache = getattr(model, 'np_cache', None)
+    if cache is None or cache['step'] != step:
+        cache = {'step': step, 'maps': dict()}
+        model.np_cache = cache
+    key = id(x)
+    if key in cache['maps']:
+        return cache['maps'][key][1]
+    arr = pcr2numpy(spatial(scalar(x)), np.nan).astype(np.float32, copy=False)
+    if isCompact(model):
+        arr = compressCells(getCellIndex(model), arr)
+    cache['maps'][key] = (x, arr)  # Keeps x alive, so its id cannot be reused during the step
+    return arr
+
+
+def asMap(model, arr):
+    if isCompact(model):
+        return toMap(getCellIndex(model), np.where(np.isnan(asArray(model, model.mask)), np.nan, arr))
+    arr = np.where(np.isnan(asArray(model, model.mask)), np.nan, arr)  # MV outside the catchment
+    return numpy2pcr(Scalar, arr.astype(np.float32, copy=False), np.nan)
+
+
+# Kernels (numpy only, so that they can also be compiled by numba).
+# Constants are float32: numba promotes float32 scalars with Python ints to float64 (numpy keeps float32)
+def runoffKernel(rain, CN2, slope, SFC, SS, SW):
+    CN3 = CN2 * np.exp(np.float32(0.00673) * (np.float32(100) - CN2))
+    CN2s = (CN3 - CN2) / np.float32(3) * (np.float32(1) - np.float32(2) * np.exp(np.float32(-13.86) * slope)) + CN2
+    CN1 = CN2s - (np.float32(20) * (np.float32(100) - CN2s)) / (
+        np.float32(100) - CN2s + np.exp(np.float32(2.533) - np.float32(0.0636) * (np.float32(100) - CN2s)))
+    CN3 = CN2s * np.exp(np.float32(0.00673) * (np.float32(100) - CN2s))
+
+    S3 = np.float32(254) * (np.float32(100) / CN3 - np.float32(1))
+    Smax = np.float32(254) * (np.float32(100) / CN1 - np.float32(1))
+
+    w2 = (np.log(SFC / (np.float32(1) - (S3 / Smax)) - SFC) -
+          np.log(SS / (np.float32(1) - (np.float32(2.54) / Smax)) - SS)) / (SS - SFC)
+    w1 = np.log(SFC / (np.float32(1) - (S3 / Smax)) - SFC) + w2 * SFC
+    S = Smax * (np.float32(1) - (SW / (SW + np.exp(w1 - w2 * SW))))
+
+    return np.where(rain > np.float32(0.2) * S,
+                    ((rain - np.float32(0.2) * S) ** 2) / (rain + np.float32(0.8) * S), np.float32(0))
+
+
+def topLayerInfilKernel(roff, precip, theta0, theta1, sat0, sat1, depth0, depth1):
+    infil = precip - roff
+    satex_mm = np.maximum(np.float32(0), theta0 * depth0 + infil - sat0 * depth0)
+    infil_z0 = np.maximum(infil - satex_mm, np.float32(0))
+
+    satex_below_mm = np.maximum(np.float32(0), theta1 * depth1 + satex_mm - sat1 * depth1)
+    infil_z1 = np.maximum(satex_mm - satex_below_mm, np.float32(0))
+    return infil_z0, infil_z1, roff + satex_below_mm
+
+
+def percolationKernel(theta, fc, sat, depth, gamma, k_sat):
+    tau = np.maximum(np.float32(0), np.minimum(np.float32(0.0866) * np.exp(gamma * np.log10(k_sat)), np.float32(1)))
+    return np.where(theta > fc,
+                    tau * depth * (sat - fc) *
+                    ((np.exp(theta - fc) - np.float32(1)) / (np.exp(sat - fc) - np.float32(1))), np.float32(0))
+
+
+def bottomExceedKernel(theta_b, sat_b, depth_b, percolation):
+    return np.maximum(theta_b * depth_b + percolation - sat_b * depth_b, np.float32(0))
+
+
+def drainageKernel(c_adr, theta, fc, depth):
+    return np.maximum(c_adr * (depth * theta - depth * fc), np.float32(0))
+
+
+def transpKernel(theta, wp, fc, depth, root_depth_tot, root_depth, pot_transpir, depletable_water):
+    pot_transpir_layer = np.where(root_depth_tot > np.float32(0),
+                                  pot_transpir * np.float32(2) *
+                                  (np.float32(1) - (root_depth * np.float32(0.5)) / root_depth_tot) *
+                                  (root_depth / root_depth_tot), np.float32(0))
+    theta_critical_layer = wp + (np.float32(1) - depletable_water) * (fc - wp)
+    ks_layer = np.maximum(np.float32(0), np.minimum(np.float32(1), (theta - wp) / (theta_critical_layer - wp)))
+    act_transpir_layer = ks_layer * pot_transpir_layer
+    SW = theta * depth
+    return np.where(act_transpir_layer > SW, SW * np.float32(0.9), act_transpir_layer)
+
+
+def evapKernel(theta, wp, fc, depth, f_layer, pot_evapor):
+    kr_layer = np.maximum(np.float32(0),
+                          np.minimum(np.float32(1), (theta - np.float32(0.5) * wp) / (fc - np.float32(0.5) * wp)))
+    kr_layer = kr_layer * f_layer
+    return np.where((theta * depth) < (kr_layer * pot_evapor),
+                    np.maximum((theta * depth - (np.float32(0.5) * wp * depth)), np.float32(0)),
+                    kr_layer * pot_evapor)
+
+
+def layerTempKernel(theta, depth, p_b, tot_depth, dd_max, lag, temp_fin, temp_ave_air, temp_at_surf):
+    phi_layer = (theta * depth) / ((np.float32(0.356) - np.float32(0.144) * p_b) * tot_depth)
+    dd_layer = dd_max * np.exp(np.log(np.float32(500) / dd_max) *
+                               ((np.float32(1) - phi_layer) / (np.float32(1) + phi_layer)) ** 2)
+    zd_layer = (depth * np.float32(0.5)) / dd_layer
+    df_layer = zd_layer / (zd_layer + np.exp(np.float32(-0.867) - np.float32(2.708) * zd_layer))
+    return lag * temp_fin + (np.float32(1) - lag) * (df_layer * (temp_ave_air - temp_at_surf) + temp_at_surf)
+
+
+kernels = {'runoff': runoffKernel,
+           'infil': topLayerInfilKernel,
+           'percolation': percolationKernel,
+           'exceed': bottomExceedKernel,
+           'drainage': drainageKernel,
+           'transp': transpKernel,
+           'evap': evapKernel,
+           'temp': layerTempKernel}
+compiled_kernels = dict()
+
+
+def getKernel(model, name):
+    if model.hydro_backend != 'numba':
+        return kernels[name]
+    if njit is None:
+        raise ImportError("hydro_backend = 'numba' requires numba, use 'numpy' instead")
+    if name not in compiled_kernels:
+        compiled_kernels[name] = njit(kernels[name])
+    return compiled_kernels[name]
+
+
+# Array versions of the hydro_v3 functions, same arguments, outputs as arrays.
+# State maps may also be numpy arrays, e.g. (samples, rows, cols) in batch.py.
+def runoff_SCS_np(model, rain, CN2, crop_type,
+                  jd_sim, jd_dev, jd_mid, jd_end,
+                  len_dev_stage, num_layers_scs=2):
+    a = lambda x: asArray(model, x)
+    SFC = np.float32(0)
+    SS = np.float32(0)
+    SW = np.float32(0)
+    for layer in range(num_layers_scs):
+        depth = a(model.layer_depth[layer])
+        SFC = SFC + a(model.theta_fc[layer]) * depth
+        SS = SS + a(model.theta_sat[layer]) * depth
+        SW = SW + (a(model.theta[layer]) - a(model.theta_wp[layer])) * depth
+    return getKernel(model, 'runoff')(a(rain), a(CN2), a(model.slope), SFC, SS, SW)
+
+
+def getTopLayerInfil_np(model, precip, CN2, crop_type,
+                        jd_sim, jd_dev, jd_mid, jd_end, len_dev_stage):
+    a = lambda x: asArray(model, x)
+    roff = runoff_SCS_np(model, precip, CN2, crop_type, jd_sim, jd_dev, jd_mid, jd_end, len_dev_stage)
+    infil_z0, infil_z1, roff_z0 = getKernel(model, 'infil')(
+        roff, a(precip), a(model.theta[0]), a(model.theta[1]), a(model.theta_sat[0]), a(model.theta_sat[1]),
+        a(model.layer_depth[0]), a(model.layer_depth[1]))
+    return {"infil_z0": infil_z0, "infil_z1": infil_z1, "roff": roff_z0}
+
+
+def getPercolation_np(model, layer, k_sat, isPermeable=True):
+    a = lambda x: asArray(model, x)
+    percolation = getKernel(model, 'percolation')(a(model.theta[layer]), a(model.theta_fc[layer]),
+                                                  a(model.theta_sat[layer]), a(model.layer_depth[layer]),
+                                                  a(model.gamma[layer]), a(k_sat))
+
+    if layer < (len(model.layer_depth) - 1):
+        # Check bottom capacity, as hydro_v3.getPercolation()
+        exceed = getKernel(model, 'exceed')
+        below = (a(model.theta[layer + 1]), a(model.theta_sat[layer + 1]), a(model.layer_depth[layer + 1]))
+        percolation = np.maximum(np.float32(0), percolation - exceed(*(below + (percolation,))))
+
+        exceed2_mm = exceed(*(below + (percolation,)))
+        if np.nanmax(exceed2_mm) > 0:
+            percolation = percolation - (exceed2_mm * np.float32(1.01))
+            exceed3_mm = exceed(*(below + (percolation,)))
+            checkState(model, 'PERC', 'SAT excess', exceed3_mm / below[2], layer + 1, upper=0., tol=1e-06)
+    elif not isPermeable:
+        return np.zeros_like(percolation)
+
+    return percolation
+
+
+def getArtificialDrainage_np(model, adr_layer):
+    a = lambda x: asArray(model, x)
+    return getKernel(model, 'drainage')(a(model.c_adr), a(model.theta[adr_layer]),
+                                        a(model.theta_fc[adr_layer]), a(model.layer_depth[adr_layer]))
+
+
+def anyCell(model, mask):
+    """
+    Branch test of a map (mapmaximum(...) > 0): a bool, or one test per sample for the
+    stacked state of batch.py (model.batched), as a (samples, 1, ...) array
+    """
+    if not getattr(model, 'batched', False):
+        return bool(np.any(mask))
+    return np.any(mask.reshape(mask.shape[0], -1), axis=1).reshape((-1,) + (1,) * (mask.ndim - 1))
+
+
+def cellMaxima(model, x, shape):
+    """
+    mapmaximum(x) as anyCell(): a float, or (samples, 1, ...) maxima of x broadcast to shape
+    """
+    x = np.broadcast_to(x, shape)
+    if not getattr(model, 'batched', False):
+        return np.nanmax(x)
+    return np.nanmax(x.reshape(x.shape[0], -1), axis=1).reshape((-1,) + (1,) * (x.ndim - 1))
+
+
+def clampTheta(model, layer, theta, theta_sat):
+    """
+    0 <= theta <= theta_sat before the lateral flow, as hydro_v3: violations are recorded (checks.py),
+    theta is only corrected (and written back to model.theta) if a cell exceeds theta_sat
+    """
+    checkState(model, 'LF', 'theta', theta, layer, upper=theta_sat)
+    with np.errstate(invalid='ignore'):
+        exceeded = anyCell(model, theta > theta_sat)
+    if np.any(exceeded):
+        theta = np.where(exceeded, np.minimum(np.maximum(theta, np.float32(0)), theta_sat), theta)
+        model.theta[layer] = theta if isinstance(model.theta[layer], np.ndarray) else asMap(model, theta)
+    return theta
+
+
+def getLateralFlow_np(model, layer, run=True):
+    a = lambda x: asArray(model, x)
+    routing = getArrayRouting(model)
+    depth = a(model.layer_depth[layer])
+    c = a(model.c_lf[layer])
+    theta = a(model.theta[layer])
+    theta_sat = a(model.theta_sat[layer])
+
+    theta = clampTheta(model, layer, theta, theta_sat)
+
+    if not run:
+        return {"cell_outflow": np.zeros_like(theta), "new_moisture": theta}
+
+    SW = theta * depth
+    SW_space = np.maximum(depth * theta_sat - depth * theta, np.float32(0))
+    f_pot = c * np.maximum(theta - a(model.theta_fc[layer]), np.float32(0))
+
+    is_contributor = np.where(f_pot > 0, np.float32(1), np.float32(0))
+    sum_contributors = upstreamTotal(routing, is_contributor)
+
+    downstream_capacity = np.where(sum_contributors < 1, np.float32(0), SW_space / sum_contributors)
+    downstream_capacity = downstreamValue(routing, downstream_capacity)
+
+    fx1 = accuFractionFlux(routing, SW, f_pot)[0]
+    fx2 = accuCapacityFlux(routing, SW, downstream_capacity)[0]
+
+    # If upstream potential is less than downstream capacity,
+    # determine limit of downstream as == upstream potential flux.
+    downstream_capacity = np.where(fx1 < fx2, fx1, downstream_capacity)
+    fx, st = accuCapacityFlux(routing, SW, downstream_capacity)
+    new_moisture = st / depth
+
+    checkState(model, 'LF', 'new_moisture', new_moisture, layer, upper=theta_sat, tol=1e-06)
+    with np.errstate(invalid='ignore'):
+        exceeded = anyCell(model, new_moisture > theta_sat)
+    if np.any(exceeded):  # Negative values are only reported, as hydro_v3
+        new_moisture = np.where(exceeded, np.minimum(np.maximum(new_moisture, np.float32(0)), theta_sat),
+                                new_moisture)
+
+    return {"cell_outflow": fx, "new_moisture": new_moisture}
+
+
+def getUpstreamWetness(model):
+    """
+    accuflux(ldd_subs, wetness), static: computed on first use
+    """
+    try:
+        return model.upstream_wetness
+    except AttributeError:
+        model.upstream_wetness = accuFlux(getArrayRouting(model), asArray(model, model.wetness))
+        return model.upstream_wetness
+
+
+def getLateralFlow_Manfreda_np(model, layer, run=True, max_loops=20):
+    """
+    The overflow of a cell only depends on its own inflow, so the saturation loop of
+    hydro_v3.getLateralFlow_Manfreda() resolves each cell in one correction; the loop below
+    only absorbs the rounding and is bounded by max_loops. The upstream inflow is one
+    accumulation over the ldd order.
+    """
+    a = lambda x: asArray(model, x)
+    depth = a(model.layer_depth[layer])
+    c = a(model.c_lf[layer])
+    theta = a(model.theta[layer])
+    theta_sat = a(model.theta_sat[layer])
+
+    theta = clampTheta(model, layer, theta, theta_sat)
+
+    if not run:
+        return {"cell_outflow": np.zeros_like(theta), "upstream_cell_inflow": np.zeros_like(theta),
+                "new_moisture": theta}
+
+    wetness = a(model.wetness)
+    cell_sw_outflow = np.maximum(c * (depth * theta - depth * a(model.theta_fc[layer])), np.float32(0))  # [mm]
+    # Cell inflow (mm)  <- Subtract excess inflow
+    upstream_cell_inflow = wetness * accuFlux(getArrayRouting(model), cell_sw_outflow) / getUpstreamWetness(model)
+
+    check_lateral_flow_layer = np.zeros_like(theta)
+    overflow = np.zeros_like(theta)
+    looping = True  # Per sample in batch.py: a sample stops once its own overflow is solved
+    loops = 0
+    while loops < max_loops:
+        loops += 1
+        lateral = upstream_cell_inflow - cell_sw_outflow  # [mm]
+        theta_check_layer = theta + lateral / depth
+        excess = np.where(theta_check_layer > theta_sat, (theta_check_layer - theta_sat) * depth, np.float32(0))
+        check_lateral_flow_layer = np.where(looping, lateral, check_lateral_flow_layer)
+        overflow = np.where(looping, excess, overflow)
+        looping = looping & anyCell(model, overflow > 1e-06)
+        if not np.any(looping):
+            break
+        # If overflow (i.e. if at saturation), cell can only accept what it looses.
+        upstream_cell_inflow = upstream_cell_inflow - np.where(looping, overflow, np.float32(0))
+
+    new_moisture = (theta * depth + check_lateral_flow_layer) / depth
+
+    checkState(model, 'LF', 'overflow', overflow, layer, upper=0., tol=0.001)
+
+    return {"cell_outflow": cell_sw_outflow, "upstream_cell_inflow": check_lateral_flow_layer + cell_sw_outflow,
+            "new_moisture": new_moisture}
+
+
+def getActualTransp_np(model, layer, root_depth_tot, root_depth, pot_transpir,
+                       depletable_water, run=True):
+    a = lambda x: asArray(model, x)
+    if not run:
+        return np.zeros_like(a(model.theta[layer]))
+    return getKernel(model, 'transp')(a(model.theta[layer]), a(model.theta_wp[layer]),
+                                      a(model.theta_fc[layer]), a(model.layer_depth[layer]),
+                                      a(root_depth_tot), a(root_depth), a(pot_transpir),
+                                      a(depletable_water))
+
+
+def getActualEvap_np(model, layer, pot_evapor, run=True):
+    assert layer < 2  # No evaporation in deeper layers
+    a = lambda x: asArray(model, x)
+    if not run:
+        return np.zeros_like(a(model.theta[layer]))
+    depth = a(model.layer_depth[layer])
+    f_evap = a(model.f_evap)
+    if layer == 1:
+        depth = depth * np.float32(0.5)  # Act only on fraction of the second layer.
+        f_evap = 1 - f_evap
+    return getKernel(model, 'evap')(a(model.theta[layer]), a(model.theta_wp[layer]),
+                                    a(model.theta_fc[layer]), depth, f_evap, a(pot_evapor))
+
+
+def getLayerTemp_np(model, layer, temp_bare_soil):
+    a = lambda x: asArray(model, x)
+    p_b = model.p_bAgr if layer < 2 else model.p_bZ
+    if layer == 0:
+        cover_frac = a(model.cover_frac)
+        temp_at_surf = cover_frac * a(model.temp_surf_fin) + (1 - cover_frac) * a(temp_bare_soil)
+    else:
+        temp_at_surf = a(model.temp_surf_fin)
+    temp_layer = getKernel(model, 'temp')(a(model.theta[layer]), a(model.layer_depth[layer]), a(p_b),
+                                          a(model.tot_depth), a(model.dd_max), a(model.lag),
+                                          a(model.temp_fin[layer]), a(model.temp_ave_air), temp_at_surf)
+    return {"temp_layer": temp_layer, "temp_surface": temp_at_surf}
+
+
+array_functions = {hydro_v3.runoff_SCS: runoff_SCS_np,
+                   hydro_v3.getTopLayerInfil: getTopLayerInfil_np,
+                   hydro_v3.getPercolation: getPercolation_np,
+                   hydro_v3.getArtificialDrainage: getArtificialDrainage_np,
+                   hydro_v3.getLateralFlow: getLateralFlow_np,
+                   hydro_v3.getLateralFlow_Manfreda: getLateralFlow_Manfreda_np,
+                   hydro_v3.getActualTransp: getActualTransp_np,
+                   hydro_v3.getActualEvap: getActualEvap_np,
+                   hydro_v3.getLayerTemp: getLayerTemp_np}
+
+
+def compareResults(model, name, ref, res):
+    """
+    Bit-for-bit comparison of the PCRaster (ref) and array (res) outputs.
+    One record per output map is kept in model.hydro_diff:
+    (time step, function, output, nr. of differing cells, max. abs. difference)
+    """
+    if isinstance(ref, dict):
+        for key in ref:
+            compareResults(model, name + ':' + key, ref[key], res[key])
+        return
+    a = pcr2numpy(spatial(scalar(ref)), np.nan)
+    b = pcr2numpy(spatial(scalar(res)), np.nan)
+    same = (a == b) | (np.isnan(a) & np.isnan(b))
+    n_diff = int(np.sum(~same))
+    max_diff = float(np.nanmax(np.abs(a - b))) if n_diff > 0 else 0.
+    model.hydro_diff.append((model.currentTimeStep(), name, n_diff, max_diff))
+    if n_diff > 0 and getattr(model, 'DEBUG', False):
+        print("Hydro backend diff, " + name + ': ' + str(n_diff) + ' cells, max ' + str(max_diff))
+
+
+def runHydro(model, fn, *args, **kwargs):
+    """
+    Runs a hydro_v3 function with the backend selected in model.hydro_backend,
+    or replays its recorded result (trajectory.py)
+    """
+    if isReplaying(model):
+        return replayHydro(model, fn)
+    res = solveHydro(model, fn, *args, **kwargs)
+    recordHydro(model, fn, res)
+    return res
+
+
+def solveHydro(model, fn, *args, **kwargs):
+    backend = getattr(model, 'hydro_backend', 'pcraster')
+    if backend == 'pcraster' or fn not in array_functions:
+        return fn(model, *args, **kwargs)
+
+    with np.errstate(all='ignore'):  # ln/log10/division of MV or invalid cells -> NaN, as PCRaster MV
+        res = array_functions[fn](model, *args, **kwargs)
+    if isinstance(res, dict):
+        res = dict((key, asMap(model, value)) for key, value in res.items())
+    else:
+        res = asMap(model, res)
+
+    if getattr(model, 'hydro_compare', False):
+        if not hasattr(model, 'hydro_diff'):
+            model.hydro_diff = []
+        ref = fn(model, *args, **kwargs)
+        compareResults(model, fn.__name__, ref, res)
+        return ref
+    return res
+
+
+def reportHydroDiff(model, path='hydro_diff.csv'):
+    with open(path, 'w') as f:
+        f.write('step,function,cells_diff,max_abs_diff\n')
+        for step, name, n_diff, max_diff in getattr(model, 'hydro_diff', []):
+            f.write(str(step) + ',' + name + ',' + str(n_diff) + ',' + repr(max_diff) + '\n')
@@ -3,6 +3,7 @@ from pcraster._pcraster import *
 from pcraster.framework import *
 from copy import deepcopy
 from test_suite import *
+from checks import checkState, cellMax
 
 # import os
 # import time
@@ -178,11 +179,8 @@ def getPercolation(model, layer, k_sat, isPermeable=True):
             sw_check3 = model.theta[layer + 1] * model.layer_depth[layer + 1] + percolation
             exceed3_mm = max(sw_check3 - model.theta_sat[layer + 1] * model.layer_depth[layer + 1], scalar(0))
 
-            if mapmaximum(exceed3_mm) > 0:
-                val = float(mapmaximum(exceed3_mm/model.layer_depth[layer + 1]))
-                if val > float(1e-06):
-                    model.report(exceed3_mm, 'inEXz' + str(layer + 1))
-                    print("Error at fn = Percolation(), SAT exceeded, layer " + str(layer + 1) + ' by ' + str(val))
+            checkState(model, 'PERC', 'SAT excess', exceed3_mm / model.layer_depth[layer + 1], layer + 1,
+                       upper=0., tol=1e-06)
 
     else:  # Basement layer
         if not isPermeable:
@@ -200,7 +198,7 @@ def getArtificialDrainage(model, adr_layer):
     return cell_drainge_outflow
 
 
-def getLateralFlow_Manfreda(model, layer, run=True):
+def getLateralFlow_Manfreda(model, layer, run=True, max_loops=20):
     depth = model.layer_depth[layer]
     c = model.c_lf[layer]
 
@@ -225,20 +223,13 @@ def getLateralFlow_Manfreda(model, layer, run=True):
     """
 
     # Cell outflow (mm)
-    if mapminimum(model.theta[layer]) < 0:
-        print("Error Negative Theta, before LF layer" + str(layer))
-
-    exceedLi = max(model.theta[layer] - model.theta_sat[layer], scalar(0))
-    if mapmaximum(exceedLi) > 0:
-        val = float(mapmaximum(exceedLi))
-        model.theta[layer] = ifthenelse(model.theta[layer] < 0, scalar(0), model.theta[layer])
-        model.theta[layer] = ifthenelse(model.theta[layer] > model.theta_sat[layer], model.theta_sat[layer],
-                                        model.theta[layer])
-        if float(val) > float(1e-06):
-            print("Corrected sig. error before getLateralFlow(), SAT exceeded, layer " + str(layer) + ' by ' + str(val))
+    checkState(model, 'LF', 'theta', model.theta[layer], layer, upper=model.theta_sat[layer])
+    if cellMax(model.theta[layer] - model.theta_sat[layer]) > 0:  # Negative theta only corrected with SAT excess
+        model.theta[layer] = min(max(model.theta[layer], scalar(0)), model.theta_sat[layer])
 
     if not run:
         cell_sw_outflow = scalar(0)
+        cell_inflow = scalar(0)
         new_moisture = model.theta[layer]
     else:
         cell_sw_outflow = max(c * (depth * model.theta[layer] - depth * model.theta_fc[layer]), scalar(0))  # [mm]
@@ -249,7 +240,7 @@ def getLateralFlow_Manfreda(model, layer, run=True):
         check_lateral_flow_layer = deepcopy(model.zero_map)
         overflow = deepcopy(model.theta_sat[layer])
         loops = 0
-        while mapmaximum(overflow) > 1e-06:
+        while mapmaximum(overflow) > 1e-06 and loops < max_loops:
             loops += 1
             # print('layer z' + str(layer) + 'loop: ' + str(loops))
             # Cell inflow - cell outflow
@@ -265,16 +256,12 @@ def getLateralFlow_Manfreda(model, layer, run=True):
 
         SW = model.theta[layer] * depth + check_lateral_flow_layer  # mm
         new_moisture = SW / depth
+        cell_inflow = check_lateral_flow_layer + cell_sw_outflow  # Inflow accepted by the cell (mm)
 
-        if mapmaximum(overflow) > 0.001:
-            print('layer z' + str(layer) + ' loops: ' + str(loops))
-            print("Satex reached on Lateral Flow!, layer: z" + str(layer))
-            model.report(overflow, 'aOFz' + str(layer))  # m3
-            model.report(upstream_cell_inflow, 'mmInz' + str(layer))
-            model.report(cell_sw_outflow, 'mmOutz' + str(layer))
+        checkState(model, 'LF', 'overflow', overflow, layer, upper=0., tol=0.001)
 
     return {"cell_outflow": cell_sw_outflow,
-            # "upstream_cell_inflow": resultflux,  # upstream_cell_inflow, # mm
+            "upstream_cell_inflow": cell_inflow,  # mm, moves the pesticide (pesti_v4.getLatMassFluxManfredaPair)
             # "lateral_flow_layer": check_lateral_flow_layer,
             "new_moisture": new_moisture}
 
@@ -292,17 +279,9 @@ def getLateralFlow(model, layer, run=True):
     # model.wetness = W index = (4m2*number of upstream cells)/slope
 
     # Cell outflow (mm)
-    if mapminimum(model.theta[layer]) < 0:
-        print("Error Negative Theta, before LF layer" + str(layer))
-
-    exceedLi = max(model.theta[layer] - model.theta_sat[layer], scalar(0))
-    if mapmaximum(exceedLi) > 0:
-        val = float(mapmaximum(exceedLi))
-        if float(val) > float(1e-06):
-            print("Error before getLateralFlow(), SAT exceeded, layer " + str(layer) + ' by ' + str(val))
-        model.theta[layer] = ifthenelse(model.theta[layer] < 0, scalar(0), model.theta[layer])
-        model.theta[layer] = ifthenelse(model.theta[layer] > model.theta_sat[layer], model.theta_sat[layer],
-                                        model.theta[layer])
+    checkState(model, 'LF', 'theta', model.theta[layer], layer, upper=model.theta_sat[layer])
+    if cellMax(model.theta[layer] - model.theta_sat[layer]) > 0:  # Negative theta only corrected with SAT excess
+        model.theta[layer] = min(max(model.theta[layer], scalar(0)), model.theta_sat[layer])
 
     if not run:
         flux_mm = scalar(0)
@@ -368,30 +347,9 @@ def getLateralFlow(model, layer, run=True):
         #
 
         #
-        if mapminimum(new_moisture) < 0:
-            print("Error on new moisture fn = getLateralFlow(), Negative Theta layer" + str(layer))
-        exceedLi = max(new_moisture - model.theta_sat[layer], scalar(0))
-        if mapmaximum(exceedLi) > 0:
-            val = float(mapmaximum(exceedLi))
-            new_moisture = max(new_moisture, scalar(0))
-            new_moisture = min(new_moisture, model.theta_sat[layer])
-
-            if float(val) > float(1e-06):
-                print("Error on new moisture fn = getLateralFlow(), SAT exceeded, layer " + str(layer) + ' by ' + str(val))
-                error = ifthenelse(new_moisture > model.theta_sat[layer], scalar(1), scalar(0))
-                model.report(error, 'ErrZ' + str(layer))
-                model.report(f_pot, 'fpotz' + str(layer))
-                model.report(is_contributor, 'IsUpZ' + str(layer))
-                model.report(sum_contributors, 'SumUpZ' + str(layer))
-                model.report(downstream_capacity, 'DWNa' + str(layer))
-                model.report(downstream_capacity, 'DWNb' + str(layer))
-                model.report(fx1, 'fx1z' + str(layer))
-                model.report(fx2, 'fx2z' + str(layer))
-                model.report(downstream_capacity, 'DWNc' + str(layer))
-                model.report(SW_cap, 'CAPiniz' + str(layer))
-                model.report(st, 'STz' + str(layer))
-                model.report(SW, 'SWz' + str(layer))
-                model.report(fx, 'fxz' + str(layer))
+        checkState(model, 'LF', 'new_moisture', new_moisture, layer, upper=model.theta_sat[layer], tol=1e-06)
+        if cellMax(new_moisture - model.theta_sat[layer]) > 0:  # Negative values are only reported
+            new_moisture = min(max(new_moisture, scalar(0)), model.theta_sat[layer])
 
         # aguila --scenarios='{2}' --timesteps=[2,300,2]  ErrZ0 thEndZ0 f_potZ0 f_finZ0 CapZ0 SumUpZ0
         # aguila --scenarios='{2}' --timesteps=[2,300,2]  ErrZ3 thEndZ3 f_potZ0 f_finZ0 CapZ0 SumUpZ0
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+from pcraster import pcr2numpy, numpy2pcr, Boolean, Nominal, Ordinal, Scalar, Directional, Ldd
+from applications_v3b import getApplications
+from output_soils import importPlotMaps
+import numpy as np
+import json
+import os
+
+"""
+Static landscape cache
+
+The landscape products do not depend on the LHS parameters: the masks, the ldd, the plot maps,
+the Topographical Wetness Index (accuflux of the ldd) and the application maps.
+They are computed once (buildLandscape), stacked in a memory-mapped file and every sample
+or worker process attaches to it instead of reading and recomputing the maps.
+
+landscape.dat: float64 (maps x rows x cols), NaN = missing value
+landscape.json: map name -> (layer, value scale), and the modification time and size of each
+input map file (and the clone). A cache whose inputs changed since it was built is stale:
+attachLandscape() rejects it (the sample computes its maps) and buildLandscape() rebuilds it.
+"""
+
+landscape_file = 'landscape.dat'
+landscape_index = 'landscape.json'
+
+value_scales = [Boolean, Nominal, Ordinal, Scalar, Directional, Ldd]
+int_mv = np.iinfo(np.int32).min  # Missing value of nominal & ordinal maps
+
+# Attributes set by setLandscape(); 'plot_maps' (dict) and 'apps' (list) are stored per item
+static_maps = ['dem', 'datum_depth', 'is_catchment', 'is_north', 'is_valley', 'is_south',
+               'ldd_subs', 'zero_map', 'mask', 'outlet_multi', 'is_outlet', 'landuse',
+               'up_area', 'slope', 'wetness', 'fa_cr', 'plot_codes']
+
+
+# Maps setLandscape() reads with readmap(), the others through model.readmap()
+direct_inputs = ['dem_ldd_burn3', 'norArea', 'valArea', 'souArea', 'ldd_subs_v3', 'farm_burn_v3', 'plot_code16']
+
+
+class Landscape(object):
+    """ Holder of the static maps, used to build the cache outside the model. Records the maps it reads. """
+    def __init__(self):
+        self.inputs = list(direct_inputs)
+
+    def readmap(self, name):
+        self.inputs.append(name)
+        return readmap(name)
+
+
+def setLandscape(model):
+    """
+    Reads and computes the static maps (premcloop of BeachModel).
+    """
+    model.dem = model.readmap("dem_slope")  # 192 - 231 m a.s.l
+    model.datum_depth = (model.dem - mapminimum(model.dem)) * scalar(10 ** 3)  # mm
+
+    # model.dem_route = model.readmap("dem_ldd")  # To route surface run-off
+    # model.ldd_surf = lddcreate(model.dem_route, 1e31, 1e31, 1e31, 1e31)  # To route runoff
+    out_burn = readmap("dem_ldd_burn3")
+    model.is_catchment = defined(out_burn)
+    model.is_north = defined(readmap("norArea"))
+    model.is_valley = defined(readmap("valArea"))
+    model.is_south = defined(readmap("souArea"))
+
+    # model.ldd_subs = lddcreate(model.dem, 1e31, 1e31, 1e31, 1e31)  # To route lateral flow & build TWI
+    model.ldd_subs = readmap('ldd_subs_v3')  # To route lateral flow & build TWI
+
+    model.zero_map = out_burn - out_burn  # Zero map to generate scalar maps
+    model.mask = out_burn / out_burn
+
+    model.outlet_multi = model.readmap("out_multi_nom_v3")  # Multi-outlet with 0 or 2
+    model.is_outlet = boolean(model.outlet_multi == 1)
+
+    importPlotMaps(model)
+
+    model.landuse = model.readmap("landuse2016")
+
+    # Topographical Wetness Index
+    model.up_area = accuflux(model.ldd_subs, cellarea())
+    model.slope = sin(atan(max(slope(model.dem), 0.001)))  # Slope in radians
+    model.wetness = ln(model.up_area / tan(model.slope))
+
+    # Assign dosages based on Farmer-Crop combinations [g/m2]
+    model.fa_cr = readmap("farm_burn_v3")  # Contains codes to assign appropriate dosage
+    model.plot_codes = readmap("plot_code16")  # Contains codes to assign appropriate dosage
+    model.apps = getApplications(model, model.fa_cr, model.plot_codes, massunit='g')  # list of applied masses
+
+
+def getLandscapeItems(model):
+    items = [(name, getattr(model, name)) for name in static_maps]
+    for plot_map in sorted(model.plot_maps):
+        items.append(('plot_maps/' + plot_map, model.plot_maps[plot_map]))
+    for a in range(len(model.apps)):
+        items.append(('apps/' + str(a), model.apps[a]))
+    return items
+
+
+def getInputPath(name):
+    """ File of readmap(name): the name itself, or with the .map extension """
+    if not os.path.exists(name) and os.path.exists(name + '.map'):
+        return name + '.map'
+    return name
+
+
+def getInputStamps(names):
+    """
+    :return: file -> [modification time (ns), size], None if the file is missing
+    """
+    stamps = dict()
+    for name in names:
+        path = getInputPath(name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stamps[path] = [stat.st_mtime_ns, stat.st_size]
+        else:
+            stamps[path] = None
+    return stamps
+
+
+def isCurrent(index):
+    """
+    :param index: content of landscape.json
+    :return: True if the cache is of the current clone and its inputs did not change
+    """
+    if tuple(index['shape']) != (clone().nrRows(), clone().nrCols()) or 'inputs' not in index:
+        return False
+    return getInputStamps(index['inputs']) == index['inputs']
+
+
+def saveLandscape(model, path=landscape_file, index_path=landscape_index, inputs=()):
+    items = getLandscapeItems(model)
+    first = pcr2numpy(scalar(items[0][1]), np.nan)
+    stack = np.memmap(path, dtype=np.float64, mode='w+', shape=(len(items),) + first.shape)
+    index = dict()
+    for layer in range(len(items)):
+        name, value = items[layer]
+        stack[layer] = pcr2numpy(scalar(value), np.nan)
+        index[name] = (layer, value_scales.index(value.dataType()))
+    stack.flush()
+    del stack
+
+    with open(index_path, 'w') as f:
+        json.dump({'shape': list(first.shape), 'maps': index, 'inputs': getInputStamps(inputs)}, f)
+
+
+def buildLandscape(clone, path=landscape_file, index_path=landscape_index):
+    """
+    Computes the static maps once and writes the cache (before the Monte Carlo loop).
+    A cache that is still current is kept.
+    """
+    setclone(clone)
+    if os.path.exists(path) and os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            if isCurrent(json.load(f)):
+                return
+    land = Landscape()
+    setLandscape(land)
+    saveLandscape(land, path, index_path, inputs=land.inputs + [clone])
+
+
+def toMap(arr, value_scale):
+    if value_scale in (Scalar, Directional):
+        return numpy2pcr(value_scale, arr, np.nan)
+    if value_scale in (Boolean, Ldd):
+        return numpy2pcr(value_scale, np.where(np.isnan(arr), 255, arr).astype(np.uint8), 255)
+    return numpy2pcr(value_scale, np.where(np.isnan(arr), int_mv, arr).astype(np.int32), int_mv)
+
+
+def attachLandscape(model, path=landscape_file, index_path=landscape_index):
+    """
+    Sets the static maps of the model from the cache.
+    :return: False if there is no cache, or it is stale (another clone, input maps changed)
+    """
+    if not (os.path.exists(path) and os.path.exists(index_path)):
+        return False
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+    if not isCurrent(index):
+        print("Landscape cache " + path + " is stale, the static maps are computed")
+        return False
+    shape = tuple(index['shape'])
+
+    stack = np.memmap(path, dtype=np.float64, mode='r', shape=(len(index['maps']),) + shape)
+    model.plot_maps = dict()
+    apps = dict()
+    for name, (layer, vs) in index['maps'].items():
+        value = toMap(np.asarray(stack[layer]), value_scales[vs])
+        if name.startswith('plot_maps/'):
+            model.plot_maps[name.split('/', 1)[1]] = value
+        elif name.startswith('apps/'):
+            apps[int(name.split('/', 1)[1])] = value
+        else:
+            setattr(model, name, value)
+    model.apps = [apps[a] for a in sorted(apps)]
+    return True
@@ -1,4 +1,4 @@
-# from SALib.sample import latin
+from SALib.sample import latin
 from SALib.analyze import delta
 import numpy as np
 
@@ -36,8 +36,10 @@ def get_upper(bounds):
     return upper
 
 
-def saveLHSmatrix(param_values):
+def saveLHSmatrix(param_values, names=None):
     np.savetxt("lhs_vectors.txt", param_values)
+    if names is not None:  # Hydrology group of each row (one water solution per group)
+        np.savetxt("lhs_groups.txt", get_hydro_group_ids(param_values, names), fmt='%d')
 
 
 def get_runs(params):
@@ -46,6 +48,144 @@ def get_runs(params):
     return runs
 
 
+# Parameters of the water & temperature model, the others only act on the pesticide (trajectory.py)
+hydro_names = ['z3_factor', 'cZ0Z1', 'cZ', 'c_adr', 'k_g', 'gamma01', 'gammaZ', 'f_transp', 'f_evap']
+
+
+def split_vector(vector, names):
+    """
+    :return: hydrology sub-vector (hydro_names order), fate sub-vector (names order)
+    """
+    hydro = [vector[names.index(name)] for name in hydro_names if name in names]
+    fate = [vector[i] for i in range(len(names)) if names[i] not in hydro_names]
+    return hydro, fate
+
+
+def get_hydro_groups(param_values, names):
+    """
+    Rows sharing a hydrology sub-vector need one water solution (trajectory.py)
+    :param param_values: LHS matrix (rows = samples)
+    :return: list of groups (row indices), in order of first appearance
+    """
+    groups = []
+    lookup = dict()
+    for row, vector in enumerate(np.atleast_2d(param_values)):
+        key = tuple(split_vector(vector, names)[0])
+        if key not in lookup:
+            lookup[key] = len(groups)
+            groups.append([])
+        groups[lookup[key]].append(row)
+    return groups
+
+
+def get_hydro_group_ids(param_values, names):
+    ids = np.zeros(len(np.atleast_2d(param_values)), dtype=int)
+    for group, rows in enumerate(get_hydro_groups(param_values, names)):
+        ids[rows] = group
+    return ids
+
+
+def get_sub_problem(problem, sub_names):
+    index = [problem['names'].index(name) for name in sub_names]
+    sub_problem = {'num_vars': len(index),
+                   'names': list(sub_names),
+                   'bounds': [problem['bounds'][i] for i in index]}
+    if 'upper' in problem:
+        sub_problem['upper'] = [problem['upper'][i] for i in index]
+    return sub_problem
+
+
+# Ordering constraints of the parameters (first >= second), see get_ordered_latin()
+ordered_pairs = [('cZ0Z1', 'cZ'), ('gamma01', 'gammaZ')]
+
+
+def get_unit_latin(n, d, rng):
+    """
+    :return: (n, d) Latin hypercube on [0, 1): one point per stratum 1/n of each column
+    """
+    strata = rng.permuted(np.broadcast_to(np.arange(n), (d, n)), axis=1).T  # A random permutation per column
+    return (strata + rng.random((n, d))) / n
+
+
+def get_ordered_pair(u, v, bounds_a, bounds_b):
+    """
+    Maps (u, v) in [0, 1)^2 to (a, b) uniform on {a in bounds_a, b in bounds_b, a >= b}
+    (Rosenblatt transform): a = F_a^-1(u), F_a the marginal of a on the feasible region,
+    b = F_b|a^-1(v), uniform on [lb, min(a, ub)].
+    u stratified -> a stratified in its marginal, v stratified -> b stratified given a.
+    """
+    la, ua = bounds_a
+    lb, ub = bounds_b
+    if ua <= lb:
+        raise ValueError("Empty ordered region: " + str(bounds_a) + " >= " + str(bounds_b))
+
+    # Integral of the feasible length of b, (min(a, ub) - lb), from lb to a
+    def integral(a):
+        return (min(a, ub) - lb) ** 2 / 2. + max(a - ub, 0.) * (ub - lb)
+
+    a0 = max(la, lb)
+    target = integral(a0) + u * (integral(ua) - integral(a0))
+    corner = (ub - lb) ** 2 / 2.  # Integral at a = ub
+    a = np.where(target <= corner, lb + np.sqrt(2 * target),
+                 ub + (target - corner) / max(ub - lb, 1e-300))
+    b = lb + v * (np.minimum(a, ub) - lb)
+    return a, b
+
+
+def get_ordered_latin(problem, n, pairs=None, seed=None):
+    """
+    Latin hypercube inside the ordering constraints (pairs: first >= second, on the parameter values,
+    i.e. scaled bounds x problem['upper']), without rejection: every column keeps n strata.
+    :return: (n, num_vars) matrix in the (scaled) bounds of problem, as latin.sample()
+    """
+    names = problem['names']
+    bounds = np.asarray(problem['bounds'], dtype=float)
+    upper = np.asarray(problem.get('upper', np.ones(len(names))), dtype=float)
+    if pairs is None:
+        pairs = [pair for pair in ordered_pairs if pair[0] in names and pair[1] in names]
+
+    rng = np.random.default_rng(seed)
+    unit = get_unit_latin(n, len(names), rng)
+    values = bounds[:, 0] + unit * (bounds[:, 1] - bounds[:, 0])
+    for name_a, name_b in pairs:
+        ia, ib = names.index(name_a), names.index(name_b)
+        a, b = get_ordered_pair(unit[:, ia], unit[:, ib], bounds[ia] * upper[ia], bounds[ib] * upper[ib])
+        values[:, ia] = a / upper[ia]
+        values[:, ib] = b / upper[ib]
+    return values
+
+
+def get_nested_matrix(problem, n_hydro, n_fate, design='cross', hydro_values=None):
+    """
+    Fate samples nested in hydrology samples, rows grouped by hydrology sub-vector
+    :param design: 'cross' -> one fate LHS (n_fate rows) crossed with every hydrology row,
+                   'stratified' -> a new fate LHS (n_fate rows) for each hydrology row
+    :param hydro_values: hydrology rows (hydro_names order), default: LHS of n_hydro rows
+    :return: matrix of n_hydro x n_fate rows, columns in problem['names'] order
+    """
+    if design not in ('cross', 'stratified'):
+        raise ValueError("Unknown nested design: " + str(design))
+    names = problem['names']
+    sub_hydro = [name for name in hydro_names if name in names]
+    sub_fate = [name for name in names if name not in hydro_names]
+    if hydro_values is None:
+        hydro_values = get_ordered_latin(get_sub_problem(problem, sub_hydro), n_hydro)
+    hydro_values = np.atleast_2d(hydro_values)
+
+    fate_problem = get_sub_problem(problem, sub_fate)
+    fate_values = latin.sample(fate_problem, n_fate)
+    matrix = np.empty((len(hydro_values) * n_fate, len(names)))
+    for h in range(len(hydro_values)):
+        if design == 'stratified' and h > 0:
+            fate_values = latin.sample(fate_problem, n_fate)
+        rows = slice(h * n_fate, (h + 1) * n_fate)
+        for i, name in enumerate(sub_hydro):
+            matrix[rows, names.index(name)] = hydro_values[h, i]
+        for i, name in enumerate(sub_fate):
+            matrix[rows, names.index(name)] = fate_values[:, i]
+    return matrix
+
+
 def get_problem(Mini_TEST=False):
     if Mini_TEST:
         bounds = [[0.75, 0.99],
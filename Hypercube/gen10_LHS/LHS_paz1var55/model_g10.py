@@ -8,12 +8,24 @@ from datetime import datetime
 # from pcraster._pcraster import *
 # from pcraster.framework import *
 from SALib.sample import latin
-from random import randint
 
 from mlhs_v15 import *  # Defines the LHS sampling problem
 
 from applications_v3b import getApplications
+from crops import getCropParams
+from forcing import loadForcing, getForcing, getForcingArray, getForcingRow, isDry
 from hydro_v3 import *
+from hydro_np import runHydro, reportHydroDiff
+from routing import getOutletTotals, reportOutletDiff
+from landscape import setLandscape, attachLandscape, buildLandscape
+from series import flushSeries, loadPriorSeries, mergeSeries, npzToTss
+from zonal import buildZoneIndex, zoneValue, divideValues
+from checks import checkState, checkMasses, checkTheta, reportChecks, cellMax, cellMin
+from activeset import initActiveSet, isActive, markActive, spreadActive
+from profiling import StageTimer, writeTiming, mergeTiming
+from checkpoint import saveCheckpoint, loadCheckpoint, getCheckpointStep, physical_state
+from trajectory import openTrajectory, closeTrajectory
+from nash import defineObjectives, updateObjectives, writeObjectives
 from pesti_v4 import *
 from output_soils import *
 from output import *
@@ -22,21 +34,12 @@ from test_suite import *
 
 print(os.getcwd())
 
-global state
-state = -1
-
 """
 Gen9:
  - Distribution factor (f_evap) for evaporation between top two layers
  - Burned initial soil temperatures.
 """
 
-def get_state(old_state):
-    new_state = old_state + 1
-    global state
-    state = new_state
-    return state
-
 
 def start_jday():
     start_sim = 166  # 213 # 166
@@ -59,7 +62,8 @@ class BeachModel(DynamicModel, MonteCarloModel):
     def setDebug(self):
         pass
 
-    def __init__(self, cloneMap, names, params, upper, staticDT50=False, test=False):
+    def __init__(self, cloneMap, names, params, upper, staticDT50=False, test=False,
+                 resume=None, spinup=None, trajectory='off'):
         DynamicModel.__init__(self)
         MonteCarloModel.__init__(self)
         setclone(cloneMap)
@@ -69,6 +73,11 @@ class BeachModel(DynamicModel, MonteCarloModel):
         self.upper = upper  # Parameter upper bounds
         self.fixed_dt50 = staticDT50
         self.TEST = test
+        # Checkpoints (checkpoint.py)
+        self.resume_path = resume  # Restart of each sample, e.g. '{sample}/checkpoint_200.npz'
+        self.spinup_path = spinup  # Shared spin-up, only the physical state is restored
+        # Hydrology trajectories (trajectory.py): 'off', 'record', 'replay' or 'auto' (replay if recorded, else record)
+        self.trajectory_mode = trajectory
 
     def premcloop(self):
         self.DEBUG = False
@@ -79,10 +88,43 @@ class BeachModel(DynamicModel, MonteCarloModel):
         self.TEST_theta = False
         self.TEST_IR = False
         self.TEST_PERC = False
+        # State checks (checks.py): 'off', 'sampled' (every check_every steps), 'full' or 'strict' (raise)
+        self.check_level = 'full'
+        self.check_every = 10
+        # Stage timing of dynamic() -> <sample>/timing.csv (profiling.py)
+        self.profile = False
+        self.timer = StageTimer(self.profile)
 
         # Hydro
         self.LF = True
+        self.DRY_DAYS = True  # Skip run-off (SCS, run-off mass, routing) on days without rain & saturation excess
+        self.LF_scheme = 'capacity'  # Lateral flow: 'capacity' (accucapacityflux) or 'manfreda' (Manfreda et al., 2005)
         self.ETP = True
+        # Water balance (vertical & lateral flow): 'pcraster', 'numpy' or 'numba' (hydro_np.py, routing.py)
+        self.hydro_backend = 'pcraster'
+        # Array backend (hydro_backend 'numpy'/'numba') on the catchment cells only, as 1-D vectors (compact.py).
+        # The pesticide fate always runs on the full rasters
+        self.compact = False
+        self.hydro_compare = False  # Runs both backends, differences -> <sample>/hydro_diff.csv
+        self.outlet_record = False  # Outlet discharge terms of each time step -> self.outlet_terms (batch.compareBatch)
+        self.outlet_terms = []
+        # Time series output: 'tss' -> one .tss per series (read by Analysis/); 'npz' -> buffered, one
+        # <sample>/series.npz (series.py), converted back to .tss at the end of __main__. Only the npz
+        # series of a resumed run hold the steps before the restart
+        self.series_backend = 'tss'
+        # Outlet totals (routing.py): 'pcraster', 'index' -> outlet index, 'route' -> one ldd traversal
+        # 'index' and 'route' are not yet validated on the dataset (multi-cell outlet zone, see routing.py):
+        # run them with outlet_check first
+        self.outlet_backend = 'pcraster'
+        # Verification mode: compares the outlet totals with accuflux & areatotal -> <sample>/outlet_check.csv
+        self.outlet_check = False
+        # Catchment & outlet totals as float64 values (zonal.zoneValue), False -> areatotal maps
+        self.scalar_lane = True
+        self.checkpoint_every = 0  # Save the state every N time steps -> <sample>/checkpoint_<step>.npz (0 = off)
+        # Early termination (nash.py): abort a sample once its best reachable NSE is below the bound, e.g. {'q': 0.}
+        # Only 'q': resNash_outConc_ugL uses the simulated variance and can't be bounded (see nash.py)
+        self.objective_bounds = dict()
+        self.trajectory_dir = 'trajectories'  # One <key>.bin & <key>.json per unique set of hydrology parameters
 
         self.PEST = True
         self.TRANSPORT = True
@@ -92,6 +134,9 @@ class BeachModel(DynamicModel, MonteCarloModel):
         self.ADRM = True
         self.LFM = True
         self.DEG = True
+        # Fate kernels only on layers holding mass beyond the background, else closed-form decay (activeset.py)
+        self.ACTIVE_SET = False
+        self.active_tol = 1e-03  # Fraction of the layer's background mass
 
         self.TEST_LCH = False
         self.TEST_LFM = False
@@ -116,36 +161,17 @@ class BeachModel(DynamicModel, MonteCarloModel):
         """
         Landscape Maps
         """
-        self.dem = self.readmap("dem_slope")  # 192 - 231 m a.s.l
-        self.datum_depth = (self.dem - mapminimum(self.dem)) * scalar(10 ** 3)  # mm
-
-        # self.dem_route = self.readmap("dem_ldd")  # To route surface run-off
-        # self.ldd_surf = lddcreate(self.dem_route, 1e31, 1e31, 1e31, 1e31)  # To route runoff
-        out_burn = readmap("dem_ldd_burn3")
-        self.is_catchment = defined(out_burn)
-        self.is_north = defined(readmap("norArea"))
-        self.is_valley = defined(readmap("valArea"))
-        self.is_south = defined(readmap("souArea"))
-
-        # self.ldd_subs = lddcreate(self.dem, 1e31, 1e31, 1e31, 1e31)  # To route lateral flow & build TWI
-        self.ldd_subs = readmap('ldd_subs_v3')  # To route lateral flow & build TWI
-
-        self.zero_map = out_burn - out_burn  # Zero map to generate scalar maps
-        self.mask = out_burn / out_burn
+        # Static maps & applications: attached from the cache built by the driver, or computed (landscape.py)
+        if not attachLandscape(self):
+            setLandscape(self)
         self.aging = deepcopy(self.zero_map)  # Cumulative days after application on each pixel
 
-        self.outlet_multi = self.readmap("out_multi_nom_v3")  # Multi-outlet with 0 or 2
-        self.is_outlet = boolean(self.outlet_multi == 1)
-
-        importPlotMaps(self)
-
-        self.landuse = self.readmap("landuse2016")
+        loadForcing(self)  # All .tss drivers parsed once (forcing.py)
+        buildZoneIndex(self)  # Cell -> zone index of the transect & plot reports (zonal.py)
 
-        # Topographical Wetness Index
-        self.up_area = accuflux(self.ldd_subs, cellarea())
-        self.slope = sin(atan(max(slope(self.dem), 0.001)))  # Slope in radians
-        self.wetness = ln(self.up_area / tan(self.slope))
+        self.defineOutputs()
 
+    def defineOutputs(self):
         """
         Output & Observations (tss and observation maps)
         """
@@ -173,8 +199,8 @@ class BeachModel(DynamicModel, MonteCarloModel):
         self.ADLF = True
         self.bioavail = True
 
-        # Morris_error tests
-        m_state = get_state(state)  # First run will return state = 0
+        # Sample 1 reads row 0 of the LHS matrix, sample 2 row 1, etc.
+        m_state = self.currentSampleNumber() - 1
 
         vector = getInputVector(m_state, self.params, test=self.TEST)
         print("Vector " + str(m_state) + ": " + str(vector))
@@ -281,7 +307,7 @@ class BeachModel(DynamicModel, MonteCarloModel):
         """
         Isotopes
         """
-        self.r_standard = scalar(self.ini_param.get("r_standard"))  # VPDB
+        self.r_standard = float(self.ini_param.get("r_standard"))  # VPDB
         epsilon_iso = -self.mask * vector[self.names.index('epsilon_iso')] * self.upper[self.names.index('epsilon_iso')]
         self.alpha_iso = epsilon_iso / 1000 + 1
 
@@ -400,16 +426,11 @@ class BeachModel(DynamicModel, MonteCarloModel):
             self.light_real.append(self.lightmass[layer] + self.light_aged[layer])
             self.heavy_real.append(self.heavymass[layer] + self.heavy_aged[layer])
 
-            if mapminimum(self.lightmass[layer]) < 0:
-                print("Err INI, light")
+            checkMasses(self, 'INI', layer)
 
-            if mapminimum(self.heavymass[layer]) < 0:
-                print("Err INI, heavy")
+        initActiveSet(self)
 
-        # Assign dosages based on Farmer-Crop combinations [g/m2]
-        self.fa_cr = readmap("farm_burn_v3")  # Contains codes to assign appropriate dosage
-        self.plot_codes = readmap("plot_code16")  # Contains codes to assign appropriate dosage
-        self.apps = getApplications(self, self.fa_cr, self.plot_codes, massunit='g')  # returns list of applied masses
+        # Applied masses (self.apps) are static, set in premcloop (landscape.py)
 
         # Applications delta
         # Use map algebra to produce a initial signature map,
@@ -479,26 +500,7 @@ class BeachModel(DynamicModel, MonteCarloModel):
         # The damping depth (dd) is calculated daily and is a function of max. damping depth (dd_max), (mm):
         self.dd_max = (scalar(2500) * self.p_bZ) / (self.p_bZ + 686 * exp(-5.63 * self.p_bZ))
 
-        """
-        Simulation start time
-        """
-        start_day = start_jday()  # Returns initial timestep
-        greg_date = self.time_dict[str(start_day)].split("/", 2)
-        print("Date: ", greg_date[0], greg_date[1], greg_date[2])
-        print("Sim Day: ", start_day)
-        yy = int(greg_date[2])
-        mm = int(greg_date[1])
-        dd = int(greg_date[0])
-
-        date_factor = 1
-        if (100 * yy + mm - 190002.5) < 0:
-            date_factor = -1
-
-        # simulation start time in JD (Julian Day)
-        self.jd_start = 367 * yy - rounddown(7 * (yy + rounddown((mm + 9) / 12)) / 4) + rounddown(
-            (275 * mm) / 9) + dd + 1721013.5 - 0.5 * date_factor
-        self.jd_cum = 0
-        self.jd_dt = 1  # Time step size (days)
+        self.setSimulationStart()
 
         # Analysis
         self.water_balance = []  # mm
@@ -544,41 +546,76 @@ class BeachModel(DynamicModel, MonteCarloModel):
         # Need initial states to compute change in storage after each run
         self.theta_ini = deepcopy(self.theta)
 
-    def dynamic(self):
+        if self.spinup_path is not None:
+            loadCheckpoint(self, self.spinup_path, names=physical_state)
+        if self.resume_path is not None:
+            resume_path = self.resume_path.format(sample=self.currentSampleNumber())
+            loadCheckpoint(self, resume_path)
+            # Series of the steps before the restart, written with the checkpoint
+            loadPriorSeries(self, os.path.join(os.path.dirname(resume_path), 'series.npz'))
 
-        jd_sim = self.jd_start + self.jd_cum
-        if self.PEST:
-            self.aged_days += scalar(1)
+        defineObjectives(self)  # Streaming NSE of model.objective_bounds (nash.py)
+
+        # Recorded or replayed hydrology of the sample (trajectory.py)
+        if openTrajectory(self, vector) == 'replay':
+            print("Replaying hydrology: " + self.trajectory['path'])
+
+    def setSimulationStart(self):
+        """
+        Simulation start time
+        """
+        start_day = start_jday()  # Returns initial timestep
+        greg_date = self.time_dict[str(start_day)].split("/", 2)
+        print("Date: ", greg_date[0], greg_date[1], greg_date[2])
+        print("Sim Day: ", start_day)
+        yy = int(greg_date[2])
+        mm = int(greg_date[1])
+        dd = int(greg_date[0])
+
+        date_factor = 1
+        if (100 * yy + mm - 190002.5) < 0:
+            date_factor = -1
+
+        # simulation start time in JD (Julian Day)
+        self.jd_start = 367 * yy - rounddown(7 * (yy + rounddown((mm + 9) / 12)) / 4) + rounddown(
+            (275 * mm) / 9) + dd + 1721013.5 - 0.5 * date_factor
+        self.jd_cum = 0
+        self.jd_dt = 1  # Time step size (days)
+
+    def getDrivers(self, jd_sim):
+        """
+        Crop, soil and weather inputs of the time step.
+        These do not depend on the LHS parameters, i.e. are the same for all samples (see batch.py).
+        """
         # timeinputscalar() gets the TSS's cell value of row (timestep) and TSS's column indexed by the landuse-map.
         # In other words, the value of the landuse-map pixel == column to to look for in landuse.tss
         # So currently becasue landuse does not change value in the year, this step is redundant
         # and we could simply use the landuse map to map the fields to the "Crop Parameters" below.
         # Mapping "landuse.map" to -> "fields map" (i.e. the latter is a dyanmic-landuse equivalent).
-        fields = timeinputscalar('landuse.tss', nominal(self.landuse))  #
+        fields = getForcingArray(self, 'landuse')  # == timeinputscalar('landuse.tss', nominal(self.landuse))
         # Note that the number of columns could still be reduced to 9 as, only 9 classes are considered in 2016.
 
         " Crop Parameters "
-        # SEE: http://pcraster.geo.uu.nl/pcraster/4.1.0/doc/manual/op_lookup.html?highlight=lookupscalar
-        setglobaloption('matrixtable')  # allows lookupscalar to read more than 1 expressions.
-        crop_type = lookupscalar('croptable.tbl', 1, fields)  # (table, col-value in crop table, column-value in fields)
-        sow_yy = lookupscalar('croptable.tbl', 2, fields)
-        sow_mm = lookupscalar('croptable.tbl', 3, fields)  # sowing or Greenup month
-        sow_dd = lookupscalar('croptable.tbl', 4, fields)  # sowing day
+        # Parsed once from croptable.tbl (matrix table), maps only rebuilt if "fields" changes (crops.py)
+        crop = getCropParams(self, fields)
+        crop_type = crop['crop_type']
+        sow_yy = crop['sow_yy']
+        sow_mm = crop['sow_mm']  # sowing or Greenup month
+        sow_dd = crop['sow_dd']  # sowing day
         sow_dd = ifthenelse(self.fa_cr == 1111, sow_dd - 15,  # Beet Friess
                             sow_dd)
-        len_grow_stage_ini = lookupscalar('croptable.tbl', 5,
-                                          fields)  # old: Lini. length of initial crop growth stage
-        len_dev_stage = lookupscalar('croptable.tbl', 6, fields)  # Ldev: length of development stage
-        len_mid_stage = lookupscalar('croptable.tbl', 7, fields)  # Lmid: length of mid-season stage
-        len_end_stage = lookupscalar('croptable.tbl', 8, fields)  # Lend: length of late season stage
-        kcb_ini = lookupscalar('croptable.tbl', 9, fields)  # basal crop coefficient at initial stage
-        kcb_mid = lookupscalar('croptable.tbl', 10, fields)  # basal crop coefficient at mid season stage
-        kcb_end = lookupscalar('croptable.tbl', 11, fields)  # basal crop coefficient at late season stage
-        max_LAI = lookupscalar('croptable.tbl', 12, fields)  # maximum leaf area index
-        mu = lookupscalar('croptable.tbl', 13, fields)  # light use efficiency
-        max_height = lookupscalar('croptable.tbl', 14, fields)  # maximum crop height
-
-        max_root_depth = lookupscalar('croptable.tbl', 15, fields) * 1000  # max root depth converting from m to mm
+        len_grow_stage_ini = crop['len_grow_stage_ini']  # old: Lini. length of initial crop growth stage
+        len_dev_stage = crop['len_dev_stage']  # Ldev: length of development stage
+        len_mid_stage = crop['len_mid_stage']  # Lmid: length of mid-season stage
+        len_end_stage = crop['len_end_stage']  # Lend: length of late season stage
+        kcb_ini = crop['kcb_ini']  # basal crop coefficient at initial stage
+        kcb_mid = crop['kcb_mid']  # basal crop coefficient at mid season stage
+        kcb_end = crop['kcb_end']  # basal crop coefficient at late season stage
+        max_LAI = crop['max_LAI']  # maximum leaf area index
+        mu = crop['mu']  # light use efficiency
+        max_height = crop['max_height']  # maximum crop height
+
+        max_root_depth = crop['max_root_depth'] * 1000  # max root depth converting from m to mm
         min_root_depth = scalar(150)  # Seeding depth [mm], Allen advices: 0.15 to 0.20 m
 
         # Max RD (m) according to Allen 1998, Table 22 (now using FAO source)
@@ -590,7 +627,7 @@ class BeachModel(DynamicModel, MonteCarloModel):
         # Apple trees = 2.0-1.0
 
         # depletable theta before water stress (Allen1998, Table no.22)
-        p_tab = lookupscalar('croptable.tbl', 16, fields)
+        p_tab = crop['p_tab']
         # Sugar beet = 0.55
         # Corn = 0.55
         # Grazing Pasture = 0.6
@@ -601,25 +638,15 @@ class BeachModel(DynamicModel, MonteCarloModel):
         """ Soil physical parameters
         """
         # Basement layers defined under initial()
-        self.theta_sat[0] = timeinputscalar('thetaSat_agr.tss', nominal(self.landuse))  # saturated moisture # [-]
+        self.timer.lap('crops')
+        self.theta_sat[0] = getForcing(self, 'thetaSat_agr')  # saturated moisture # [-]
         self.theta_sat[1] = deepcopy(self.theta_sat[0])
-        self.theta_fc[0] = timeinputscalar('thetaFC_agr.tss', nominal(self.landuse))  # * self.fc_adj  # field capacity
+        self.theta_fc[0] = getForcing(self, 'thetaFC_agr')  # * self.fc_adj  # field capacity
         self.theta_fc[1] = deepcopy(self.theta_fc[0])
-
-        # print(self.currentTimeStep())
-        excess_z0 = ifthenelse(self.theta[0] > self.theta_sat[0], self.theta[0] - self.theta_sat[0], scalar(0))
-        excess_z1 = ifthenelse(self.theta[1] > self.theta_sat[1], self.theta[1] - self.theta_sat[1], scalar(0))
-        self.theta[0] = ifthenelse(self.theta[0] > self.theta_sat[0], self.theta_sat[0], self.theta[0])
-        self.theta[1] = ifthenelse(self.theta[1] > self.theta_sat[1], self.theta_sat[1], self.theta[1])
-
-        if self.TEST_thProp:
-            checkMoistureProps(self, self.theta_sat, 'aSATz')
-            checkMoistureProps(self, self.theta_fc, 'aFCz')
-
-        self.p_bAgr = timeinputscalar('p_b_agr.tss', nominal(self.landuse))
-        self.cover_frac = timeinputscalar('cover_frac.tss', nominal(self.landuse))
-        k_sat_z0z1 = timeinputscalar('ksats.tss', nominal(self.landuse))
-        k_sat_z2z3 = lookupscalar('croptable.tbl', 17, fields)  # saturated conductivity of the second layer
+        self.p_bAgr = getForcing(self, 'p_b_agr')
+        self.cover_frac = getForcing(self, 'cover_frac')
+        k_sat_z0z1 = getForcing(self, 'ksats')
+        k_sat_z2z3 = crop['k_sat_z2z3']  # saturated conductivity of the second layer
         k_sat = []
         for i in range(self.num_layers):
             if i < 2:
@@ -627,28 +654,27 @@ class BeachModel(DynamicModel, MonteCarloModel):
             else:
                 k_sat.append(deepcopy(k_sat_z2z3))
 
-        CN2_A = lookupscalar('croptable.tbl', 18, fields)  # curve number of moisture condition II
-        CN2_B = lookupscalar('croptable.tbl', 19, fields)  # curve number of moisture condition II
-        CN2_C = lookupscalar('croptable.tbl', 20, fields)  # curve number of moisture condition II
-        CN2_D = lookupscalar('croptable.tbl', 21, fields)  # curve number of moisture condition II
+        CN2_A = crop['CN2_A']  # curve number of moisture condition II
+        CN2_B = crop['CN2_B']  # curve number of moisture condition II
+        CN2_C = crop['CN2_C']  # curve number of moisture condition II
+        CN2_D = crop['CN2_D']  # curve number of moisture condition II
 
-        if self.TEST_Ksat:
-            reportKsatEvolution(self, k_sat)
 
         """
         Time-series data to spatial location,
         map is implicitly defined as the clonemap.
         """
-        precip = timeinputscalar('rain.tss', 1)  # daily precipitation data as time series (mm)
+        precip = getForcing(self, 'rain')  # daily precipitation data as time series (mm)
         # Precipitation total
         rain_m3 = self.mask * precip * cellarea() / 1000  # m3
-        tot_rain_m3 = areatotal(rain_m3, self.is_catchment)
-
-        temp_bare_soil = timeinputscalar('T_bare.tss', nominal('clone_nom'))  # SWAT, Neitsch2009, p.43.
-        self.temp_air = timeinputscalar('airTemp.tss', nominal('clone_nom'))
-        et0 = timeinputscalar('ET0.tss', 1)  # daily ref. ETP at Zorn station (mm)
-        wind = timeinputscalar('U2.tss', 1)  # wind speed time-series at 1 meters height
-        humid = timeinputscalar('RHmin.tss', 1)  # minimum relative humidity time-series # PA: (-)
+        tot_rain_m3 = zoneValue(self, rain_m3)
+
+        temp_bare_soil = getForcing(self, 'T_bare')  # SWAT, Neitsch2009, p.43.
+        self.temp_air = getForcing(self, 'airTemp')
+        et0 = getForcing(self, 'ET0')  # daily ref. ETP at Zorn station (mm)
+        wind = getForcing(self, 'U2')  # wind speed time-series at 1 meters height
+        humid = getForcing(self, 'RHmin')  # minimum relative humidity time-series # PA: (-)
+        self.timer.lap('forcing')
         # precipVol = precip * cellarea() / 1000  # m3
 
         ################
@@ -682,7 +708,7 @@ class BeachModel(DynamicModel, MonteCarloModel):
         jd_end = jd_late + len_end_stage
         LAIful = max_LAI + 0.5
 
-        height = timeinputscalar('height.tss', nominal(self.landuse))
+        height = getForcing(self, 'height')
         # root_depth_tot2 = timeinputscalar('height.tss', nominal(self.landuse)) * self.root_adj
         # root_depth_tot2 *= 10 ** 3  # Convert to mm
 
@@ -693,6 +719,87 @@ class BeachModel(DynamicModel, MonteCarloModel):
                                                scalar(0)))  # Before planting
         # self.report(root_depth_tot, 'RDtot1')
 
+
+        # calculation of fraction of soil covered by vegetation
+        # frac_soil_cover = 2 - exp(-mu * LAI)
+        # \mu is a light-use efficiency parameter that
+        # depends on land-use characteristics
+        # (i.e. Grass: 0.35; Crops: 0.45; Trees: 0.5-0.77; cite: Larcher, 1975).
+
+        # TODO: Check "f" definition by Allan et al., 1998 against previous (above)
+        # fraction of soil cover is calculated inside the "getPotET" function.
+        # frac_soil_cover = ((Kcb - Kcmin)/(Kcmax - Kcmin))**(2+0.5*mean_height)
+        # self.fTss.sample(frac_soil_cover)
+
+        # Get potential evapotranspiration for all layers
+        etp_dict = getPotET(self, sow_yy, sow_mm, sow_dd, root_depth_tot, min_root_depth,
+                            jd_sim,
+                            wind, humid,
+                            et0,
+                            kcb_ini, kcb_mid, kcb_end,
+                            height,
+                            len_grow_stage_ini, len_dev_stage, len_mid_stage, len_end_stage,
+                            p_tab)
+        pot_transpir = etp_dict["Tp"]
+        pot_evapor = etp_dict["Ep"]
+        depletable_water = etp_dict["P"]
+        self.timer.lap('etp')
+
+        # Not in use for water balance, but used to estimate surface temp due to bio-cover.
+        frac_soil_cover = etp_dict["f"]
+        # self.report(frac_soil_cover, 'aFracCV')
+
+        # bio_cover = getBiomassCover(self, frac_soil_cover)
+        # bcv should range 0 (bare soil) to 2 (complete cover)
+        # self.report(bio_cover, 'aBCV')
+
+        return {"crop_type": crop_type, "k_sat": k_sat, "CN2": CN2, "precip": precip, "tot_rain_m3": tot_rain_m3,
+                "jd_dev": jd_dev, "jd_mid": jd_mid, "jd_end": jd_end, "len_dev_stage": len_dev_stage,
+                "temp_bare_soil": temp_bare_soil, "root_depth_tot": root_depth_tot,
+                "pot_transpir": pot_transpir, "pot_evapor": pot_evapor, "depletable_water": depletable_water,
+                "frac_soil_cover": frac_soil_cover}
+
+    def dynamic(self):
+        if self.aborted is not None:  # Objectives out of reach (nash.py), the remaining time steps are skipped
+            return
+        self.timer.start(self.currentTimeStep())
+
+        jd_sim = self.jd_start + self.jd_cum
+        if self.PEST:
+            self.aged_days += scalar(1)
+
+        drivers = self.getDrivers(jd_sim)
+        crop_type = drivers["crop_type"]
+        k_sat = drivers["k_sat"]
+        CN2 = drivers["CN2"]
+        precip = drivers["precip"]
+        tot_rain_m3 = drivers["tot_rain_m3"]
+        jd_dev, jd_mid, jd_end = drivers["jd_dev"], drivers["jd_mid"], drivers["jd_end"]
+        len_dev_stage = drivers["len_dev_stage"]
+        temp_bare_soil = drivers["temp_bare_soil"]
+        root_depth_tot = drivers["root_depth_tot"]
+        pot_transpir = drivers["pot_transpir"]
+        pot_evapor = drivers["pot_evapor"]
+        depletable_water = drivers["depletable_water"]
+
+        # print(self.currentTimeStep())
+        excess_z0 = ifthenelse(self.theta[0] > self.theta_sat[0], self.theta[0] - self.theta_sat[0], scalar(0))
+        excess_z1 = ifthenelse(self.theta[1] > self.theta_sat[1], self.theta[1] - self.theta_sat[1], scalar(0))
+        self.theta[0] = ifthenelse(self.theta[0] > self.theta_sat[0], self.theta_sat[0], self.theta[0])
+        self.theta[1] = ifthenelse(self.theta[1] > self.theta_sat[1], self.theta_sat[1], self.theta[1])
+
+        # Dry day: no rain and no saturation excess -> no run-off, run-off mass or run-off routing
+        # theta >= theta_wp in z0 & z1: SCS retention S >= 0, no run-off from getTopLayerInfil either
+        dry = (self.DRY_DAYS and isDry(self, 'rain') and float(mapmaximum(excess_z0 + excess_z1)) <= 0 and
+               cellMin(self.theta[0] - self.theta_wp[0]) >= 0 and cellMin(self.theta[1] - self.theta_wp[1]) >= 0)
+
+        if self.TEST_thProp:
+            checkMoistureProps(self, self.theta_sat, 'aSATz')
+            checkMoistureProps(self, self.theta_fc, 'aFCz')
+
+        if self.TEST_Ksat:
+            reportKsatEvolution(self, k_sat)
+
         root_depth = []
         for layer in range(self.num_layers):
             if layer == 0:
@@ -726,40 +833,9 @@ class BeachModel(DynamicModel, MonteCarloModel):
 
         if self.TEST_roots:
             checkRootDepths(self, root_depth)
+        self.timer.lap('crops')
 
 
-        # calculation of fraction of soil covered by vegetation
-        # frac_soil_cover = 2 - exp(-mu * LAI)
-        # \mu is a light-use efficiency parameter that
-        # depends on land-use characteristics
-        # (i.e. Grass: 0.35; Crops: 0.45; Trees: 0.5-0.77; cite: Larcher, 1975).
-
-        # TODO: Check "f" definition by Allan et al., 1998 against previous (above)
-        # fraction of soil cover is calculated inside the "getPotET" function.
-        # frac_soil_cover = ((Kcb - Kcmin)/(Kcmax - Kcmin))**(2+0.5*mean_height)
-        # self.fTss.sample(frac_soil_cover)
-
-        # Get potential evapotranspiration for all layers
-        etp_dict = getPotET(self, sow_yy, sow_mm, sow_dd, root_depth_tot, min_root_depth,
-                            jd_sim,
-                            wind, humid,
-                            et0,
-                            kcb_ini, kcb_mid, kcb_end,
-                            height,
-                            len_grow_stage_ini, len_dev_stage, len_mid_stage, len_end_stage,
-                            p_tab)
-        pot_transpir = etp_dict["Tp"]
-        pot_evapor = etp_dict["Ep"]
-        depletable_water = etp_dict["P"]
-
-        # Not in use for water balance, but used to estimate surface temp due to bio-cover.
-        frac_soil_cover = etp_dict["f"]
-        # self.report(frac_soil_cover, 'aFracCV')
-
-        # bio_cover = getBiomassCover(self, frac_soil_cover)
-        # bcv should range 0 (bare soil) to 2 (complete cover)
-        # self.report(bio_cover, 'aBCV')
-
         # Applications
         mass_applied = deepcopy(self.zero_map)
         light_applied = deepcopy(self.zero_map)
@@ -781,36 +857,30 @@ class BeachModel(DynamicModel, MonteCarloModel):
             self.heavymass[0] += heavy_applied
             self.cum_appZ0_g += light_applied + heavy_applied
             self.aged_days = ifthenelse(mass_applied > 0, scalar(0), self.aged_days)
+            markActive(self, 0, mass_applied)
 
-            if mapminimum(self.lightmass[0]) < 0:
-                print("Err APP, light")
+            checkMasses(self, 'APP', 0)
 
-            if mapminimum(self.heavymass[0]) < 0:
-                print("Err APP, heavy")
+        self.timer.lap('applications')
 
         # Mass volatilized (on application days and +4 days after (120h after))
         if self.volat_days > 0:
             layer = 0
-            light_volat = getVolatileMass(self, self.temp_fin[layer], self.lightmass[layer],  # "LL",
-                                          rel_diff_model='option-2', sorption_model="linear",
-                                          gas=True, run=self.PEST)
-            heavy_volat = getVolatileMass(self, self.temp_fin[layer], self.heavymass[layer],  # "HH",
-                                          rel_diff_model='option-2', sorption_model="linear",
-                                          gas=True, run=self.PEST)
+            light_volat, heavy_volat = getVolatileMassPair(self, self.temp_fin[layer],
+                                                           self.lightmass[layer], self.heavymass[layer],
+                                                           rel_diff_model='option-2', sorption_model="linear",
+                                                           gas=True, run=self.PEST and isActive(self, layer))
 
             self.lightmass[layer] -= light_volat
             self.heavymass[layer] -= heavy_volat
-            if mapminimum(self.lightmass[layer]) < 0:
-                print("Err Volat, light")
-                self.report(self.lightmass[layer], 'VOL_Mz0')
-
-            if mapminimum(self.heavymass[layer]) < 0:
-                print("Err Volat, heavy")
+            checkMasses(self, 'VOL', layer)
 
             self.volat_days += 1
             if self.volat_days > self.max_volat_days:
                 self.volat_days = 0
 
+        self.timer.lap('volatilisation')
+
         """
         Infiltration, runoff, & percolation (all layers)
         """
@@ -823,15 +893,16 @@ class BeachModel(DynamicModel, MonteCarloModel):
         permeable = True
         for layer in range(self.num_layers):
             if layer == 0:  # Layer 0
-                if mapminimum(self.lightmass[layer]) < 0:
-                    print("Err Start, light")
-                if mapminimum(self.heavymass[layer]) < 0:
-                    print("Err Start, heavy")
+                checkMasses(self, 'Start', layer)
 
                 # Excess due to changes in saturation capacities
                 precip += (excess_z0 + excess_z1)  # One approach to distribute excess moisture
-                z0_IRO = getTopLayerInfil(self, precip, CN2, crop_type,
-                                          jd_sim, jd_dev, jd_mid, jd_end, len_dev_stage)
+                if dry:  # theta_wp <= theta <= theta_sat in z0 & z1 (above): no infiltration, no satex
+                    z0_IRO = {"roff": deepcopy(self.zero_map), "infil_z0": deepcopy(self.zero_map),
+                              "infil_z1": deepcopy(self.zero_map)}
+                else:
+                    z0_IRO = runHydro(self, getTopLayerInfil, precip, CN2, crop_type,
+                                      jd_sim, jd_dev, jd_mid, jd_end, len_dev_stage)
                 runoff_z0 = z0_IRO.get("roff")  # [mm]
                 # Partition infiltration
                 infil_z0 = z0_IRO.get("infil_z0")  # [mm]
@@ -845,83 +916,53 @@ class BeachModel(DynamicModel, MonteCarloModel):
                 SW1 = self.theta[layer + 1] * self.layer_depth[layer + 1] + infil_z1
                 self.theta[layer + 1] = SW1 / self.layer_depth[layer + 1]  # [-]
 
-                excess = max(self.theta[layer] - self.theta_sat[layer], scalar(0))
-                if mapmaximum(excess) > 0:
-                    val = float(mapmaximum(excess))
-                    self.theta[layer] = ifthenelse(self.theta[layer] > self.theta_sat[layer], self.theta_sat[layer],
-                                                   self.theta[layer])
-                    if float(val) > float(1e-02):
-                        print("Corrected Percolation(), SAT was exceeded, layer " + str(layer) + ' by ' + str(val))
-
-                excessLj = max(self.theta[layer + 1] - self.theta_sat[layer + 1], scalar(0))
-                if mapmaximum(excessLj) > 0:
-                    val = float(mapmaximum(excessLj))
-                    self.theta[layer + 1] = ifthenelse(self.theta[layer + 1] > self.theta_sat[layer + 1],
-                                                       self.theta_sat[layer + 1],
-                                                       self.theta[layer + 1])
-                    if float(val) > float(1e-02):
-                        print("Corrected Percolation(), SAT exceeded, layer " + str(layer + 1) + ' by ' + str(val))
+                # SAT excess after infiltration: recorded (checks.py), corrected in every cell
+                checkTheta(self, 'INF', layer, tol=1e-02)
+                self.theta[layer] = min(self.theta[layer], self.theta_sat[layer])
+                checkTheta(self, 'INF', layer + 1, tol=1e-02)
+                self.theta[layer + 1] = min(self.theta[layer + 1], self.theta_sat[layer + 1])
 
                 # infil_z1 is not added here because already added to the layer below, See above: SW1
-                percolation.append(getPercolation(self, layer, k_sat[layer], isPermeable=permeable))  # [mm]
+                percolation.append(runHydro(self, getPercolation, layer, k_sat[layer], isPermeable=permeable))  # [mm]
                 water_flux_z0 = infil_z1 + percolation[0]
 
-                light_leached.append(getLeachedMass(self, layer, water_flux_z0, self.lightmass[layer],
-                                                    sorption_model="linear", leach_model="mcgrath", gas=True,
-                                                    debug=self.DEBUG, run=self.LCH))
-                heavy_leached.append(getLeachedMass(self, layer, water_flux_z0, self.heavymass[layer],
-                                                    sorption_model="linear", leach_model="mcgrath", gas=True,
-                                                    debug=self.DEBUG, run=self.LCH))
+                light_lch, heavy_lch = getLeachedMassPair(self, layer, water_flux_z0,
+                                                          self.lightmass[layer], self.heavymass[layer],
+                                                          sorption_model="linear", leach_model="mcgrath", gas=True,
+                                                          debug=self.DEBUG, run=self.LCH and isActive(self, layer))
+                light_leached.append(light_lch)
+                heavy_leached.append(heavy_lch)
 
                 SW1b = self.theta[layer] * self.layer_depth[layer] - percolation[layer]
                 self.theta[layer] = SW1b / self.layer_depth[layer]
                 self.lightmass[layer] -= light_leached[layer]
                 self.heavymass[layer] -= heavy_leached[layer]
 
-                if mapminimum(self.lightmass[layer]) < 0:
-                    print("Err LCH, light")
-                if mapminimum(self.heavymass[layer]) < 0:
-                    print("Err LCH, heavy")
+                checkMasses(self, 'LCH', layer)
 
                 # RunOff Mass
                 # Mass & delta run-off (RO)
-                mass_runoff.append(getRunOffMass(self, precip, runoff_z0, self.lightmass[layer],
-                                                 transfer_model="nu-mlm-ro", sorption_model="linear",
-                                                 gas=True, run=self.ROM))
-                mass_runoff.append(getRunOffMass(self, precip, runoff_z0, self.heavymass[layer],
-                                                 transfer_model="nu-mlm-ro", sorption_model="linear",
-                                                 gas=True, run=self.ROM))
+                mass_runoff.extend(getRunOffMassPair(self, precip, runoff_z0,
+                                                     self.lightmass[layer], self.heavymass[layer],
+                                                     transfer_model="nu-mlm-ro", sorption_model="linear",
+                                                     gas=True,  # [light, heavy]
+                                                     run=self.ROM and not dry and isActive(self, layer)))
                 self.lightmass[layer] -= mass_runoff[0]  # light
                 self.heavymass[layer] -= mass_runoff[1]  # heavy
-                if mapminimum(self.lightmass[layer]) < 0:
-                    print("Err RO, light")
+                checkMasses(self, 'RO', layer)
 
-                if mapminimum(self.heavymass[layer]) < 0:
-                    print("Err RO, heavy")
-
-                # Discharge due to runoff at the outlet
-                runoff_m3 = runoff_z0 * cellarea() / 1000  # m3
-                accu_runoff_m3 = accuflux(self.ldd_subs, runoff_m3)
-                out_runoff_m3 = areatotal(accu_runoff_m3, self.outlet_multi)
+                # Discharge due to runoff at the outlet (None: not routed, zero)
+                runoff_m3 = None if dry else runoff_z0 * cellarea() / 1000  # m3
 
             else:  # Layers 1, 2, 3 & 4
 
                 if layer == (self.num_layers - 1):
                     permeable = self.bsmntIsPermeable
 
-                if mapminimum(self.lightmass[layer]) < 0:
-                    print("Err Startz1, light")
-                if mapminimum(self.heavymass[layer]) < 0:
-                    print("Err Startz1, heavy")
+                checkMasses(self, 'Start', layer)
 
-                excess = ifthenelse(self.theta[layer] > self.theta_sat[layer],
-                                    self.theta[layer] - self.theta_sat[layer], scalar(0))
-                if mapmaximum(excess) > scalar(0):
-                    val = float(mapmaximum(excess))
-                    if float(val) > float(1e-06):
-                        print("Error at right before Percolation(), layer > 0, SAT exceeded at layer " + str(layer))
-                    self.theta[layer] = ifthenelse(self.theta[layer] > self.theta_sat[layer], self.theta_sat[layer],
-                                                   self.theta[layer])
+                checkTheta(self, 'PERC', layer, tol=1e-06)
+                self.theta[layer] = min(self.theta[layer], self.theta_sat[layer])
 
                 SW2 = self.theta[layer] * self.layer_depth[layer] + percolation[layer - 1]
                 self.theta[layer] = SW2 / self.layer_depth[layer]
@@ -935,45 +976,34 @@ class BeachModel(DynamicModel, MonteCarloModel):
 
                 self.lightmass[layer] += light_leached[layer - 1]
                 self.heavymass[layer] += heavy_leached[layer - 1]
+                markActive(self, layer, light_leached[layer - 1] + heavy_leached[layer - 1],
+                           source=self.active[layer - 1])
 
-                excess = ifthenelse(self.theta[layer] > self.theta_sat[layer],
-                                    self.theta[layer] - self.theta_sat[layer], scalar(0))
-                if mapmaximum(excess) > scalar(0):
-                    val = float(mapmaximum(excess))
-                    if val > float(1e-06):
-                        print("Error at Percolation() layers: 1, 2, 3, "
-                              "SAT exceeded, layer " + str(layer) + ' by ' + str(val))
-                    self.theta[layer] = ifthenelse(self.theta[layer] > self.theta_sat[layer], self.theta_sat[layer],
-                                                   self.theta[layer])
+                checkTheta(self, 'PERC', layer, tol=1e-06)
+                self.theta[layer] = min(self.theta[layer], self.theta_sat[layer])
 
-                percolation.append(getPercolation(self, layer, k_sat[layer], isPermeable=permeable))
+                percolation.append(runHydro(self, getPercolation, layer, k_sat[layer], isPermeable=permeable))
 
                 if layer < (len(self.layer_depth) - 1):  # layers: 1,2,3
                     sw_check_bottom = self.theta[layer + 1] * self.layer_depth[layer + 1] + percolation[layer]
-                    exceed_mm = max(sw_check_bottom - self.theta_sat[layer + 1] * self.layer_depth[layer + 1],
-                                    scalar(0))
-                    if float(mapmaximum(exceed_mm)) > float(1e-03):
-                        self.report(exceed_mm, 'outEXz' + str(layer + 1))
-
-                light_leached.append(getLeachedMass(self, layer, percolation[layer], self.lightmass[layer],
-                                                    sorption_model="linear", leach_model="mcgrath", gas=True,
-                                                    debug=self.DEBUG, run=self.LCH))
-                heavy_leached.append(getLeachedMass(self, layer, percolation[layer], self.heavymass[layer],
-                                                    sorption_model="linear", leach_model="mcgrath", gas=True,
-                                                    debug=self.DEBUG, run=self.LCH))
+                    checkState(self, 'PERC', 'SW below', sw_check_bottom, layer + 1,
+                               upper=self.theta_sat[layer + 1] * self.layer_depth[layer + 1], tol=1e-03)
+
+                light_lch, heavy_lch = getLeachedMassPair(self, layer, percolation[layer],
+                                                          self.lightmass[layer], self.heavymass[layer],
+                                                          sorption_model="linear", leach_model="mcgrath", gas=True,
+                                                          debug=self.DEBUG, run=self.LCH and isActive(self, layer))
+                light_leached.append(light_lch)
+                heavy_leached.append(heavy_lch)
 
                 SW3 = self.theta[layer] * self.layer_depth[layer] - percolation[layer]
                 self.theta[layer] = SW3 / self.layer_depth[layer]
 
                 self.lightmass[layer] -= light_leached[layer]
                 self.heavymass[layer] -= heavy_leached[layer]
-                if mapminimum(self.lightmass[layer]) < 0:
-                    print("Err LCHz1, light")
-                if mapminimum(self.heavymass[layer]) < 0:
-                    print("Err LCHz1, heavy")
+                checkMasses(self, 'LCH', layer)
 
-            if mapminimum(self.theta[layer]) < 0:
-                print('Error at Percolation, Layer ' + str(layer))
+            checkTheta(self, 'Percolation', layer, tol=1e-06)
 
             if self.TEST_LCH:
                 recordLCH(self, light_leached[layer], layer)
@@ -990,38 +1020,34 @@ class BeachModel(DynamicModel, MonteCarloModel):
 
         water_flux_z0_m3 = water_flux_z0 * cellarea() / 1000  # m3
         water_flux_z1_m3 = percolation[1] * cellarea() / 1000  # m3
-        water_flux_z0_m3 = areatotal(water_flux_z0_m3, self.is_catchment)
-        water_flux_z1_m3 = areatotal(water_flux_z1_m3, self.is_catchment)
+        water_flux_z0_m3 = zoneValue(self, water_flux_z0_m3)
+        water_flux_z1_m3 = zoneValue(self, water_flux_z1_m3)
         self.resW_accDPz0_m3_tss.sample(water_flux_z0_m3)
         self.resW_accDPz1_m3_tss.sample(water_flux_z1_m3)
 
+        self.timer.lap('infiltration')
+
         # Artificial drainage (relevant layer)
         drained_layers = [n for n, x in enumerate(self.drainage_layers) if x is True]  # <- list of indexes
         adr_layer = int(drained_layers[0])  # <- 13.05.2018, implements only one layer (i.e. z2)!
         assert adr_layer == 2
-        cell_drainge_outflow = getArtificialDrainage(self, adr_layer)  # mm
-        light_drained = getDrainMassFlux(self, adr_layer, self.lightmass[adr_layer], run=self.ADRM)  #
-        heavy_drained = getDrainMassFlux(self, adr_layer, self.heavymass[adr_layer], run=self.ADRM)  #
+        cell_drainge_outflow = runHydro(self, getArtificialDrainage, adr_layer)  # mm
+        light_drained, heavy_drained = getDrainMassFluxPair(self, adr_layer, self.lightmass[adr_layer],
+                                                            self.heavymass[adr_layer],
+                                                            run=self.ADRM and isActive(self, adr_layer))
         self.lightmass[adr_layer] -= light_drained
         self.heavymass[adr_layer] -= heavy_drained
 
         SW4 = self.theta[adr_layer] * self.layer_depth[adr_layer] - cell_drainge_outflow
         self.theta[adr_layer] = SW4 / self.layer_depth[adr_layer]
 
-        if mapminimum(self.theta[adr_layer]) < 0:
-            print('Error at ADR, Layer ' + str(adr_layer))
-
-        if mapminimum(self.lightmass[adr_layer]) < 0:
-            print("Err DR, light")
-            self.report(self.lightmass[adr_layer], 'ADR_Mz')
-
-        if mapminimum(self.heavymass[adr_layer]) < 0:
-            print("Err DR, heavy")
+        checkTheta(self, 'ADR', adr_layer, tol=1e-06)
+        checkMasses(self, 'ADR', adr_layer)
 
         # Artificial drainage (Outlet discharge)
         cell_drain_z2_m3 = cell_drainge_outflow * cellarea() / 1000  # m3
-        accu_drain_m3 = accuflux(self.ldd_subs, cell_drain_z2_m3)  # m3
-        out_drain_m3 = areatotal(accu_drain_m3, self.outlet_multi)
+
+        self.timer.lap('drainage')
 
         # Lateral flow
         latflow_net = []  # every cell
@@ -1033,11 +1059,12 @@ class BeachModel(DynamicModel, MonteCarloModel):
         latflow_cell_mm = []
         ligth_latflow = []
         heavy_latflow = []
+        lateral_flow = getLateralFlow_Manfreda if self.LF_scheme == 'manfreda' else getLateralFlow
         for layer in range(self.num_layers):
             # if layer < (self.num_layers - 1):
 
             # Get lateral flow upstream cells
-            latflow_dict = getLateralFlow(self, layer, run=self.LF)
+            latflow_dict = runHydro(self, lateral_flow, layer, run=self.LF)
             latflow_cell_mm.append(latflow_dict['cell_outflow'])  # flux map
             self.theta[layer] = latflow_dict['new_moisture']  # state map
 
@@ -1046,38 +1073,41 @@ class BeachModel(DynamicModel, MonteCarloModel):
             # latflow_outlet_mm.append(outlet_flux1_mm + outlet_flux2_mm)
             latflow_outlet_mm.append(outlet_flux2_mm)
 
-            if mapmaximum(self.theta[layer]) > mapmaximum(self.theta_sat[layer]):
-                val = mapmaximum(self.theta[layer]) - mapmaximum(self.theta_sat[layer])
-                self.theta[layer] = ifthenelse(self.theta[layer] > self.theta_sat[layer], self.theta_sat[layer],
-                                               self.theta[layer])
-                if float(val) > float(1e-06):
-                    print("getLateralFlow(), Corrected SAT excess, layer " + str(layer) + ' by ' + str(val))
+            checkTheta(self, 'LF_SAT', layer, tol=1e-06)
+            if cellMax(self.theta[layer]) > cellMax(self.theta_sat[layer]):  # Catchment maximum only
+                self.theta[layer] = min(self.theta[layer], self.theta_sat[layer])
 
             # else:  # Basement layer
             #     latflow_outlet_mm.append(deepcopy(self.zero_map))
             #     latflow_cell_mm.append(deepcopy(self.zero_map))
 
-            ligth_latflow_dict = getLatMassFlux(self, layer, self.lightmass[layer], latflow_cell_mm[layer],
-                                                debug=self.TEST_LFM, run=self.LFM)
-            heavy_latflow_dict = getLatMassFlux(self, layer, self.heavymass[layer], latflow_cell_mm[layer],
-                                                debug=self.TEST_LFM, run=self.LFM)
+            if self.LF_scheme == 'manfreda':
+                ligth_latflow_dict, heavy_latflow_dict = getLatMassFluxManfredaPair(
+                    self, layer, self.lightmass[layer], self.heavymass[layer],
+                    latflow_cell_mm[layer], latflow_dict['upstream_cell_inflow'],
+                    debug=self.TEST_LFM, run=self.LFM and isActive(self, layer))
+            else:
+                ligth_latflow_dict, heavy_latflow_dict = getLatMassFluxPair(self, layer, self.lightmass[layer],
+                                                                            self.heavymass[layer],
+                                                                            latflow_cell_mm[layer],
+                                                                            debug=self.TEST_LFM,
+                                                                            run=self.LFM and isActive(self, layer))
             ligth_latflow.append(ligth_latflow_dict['mass_loss'])
             heavy_latflow.append(heavy_latflow_dict['mass_loss'])
 
             self.lightmass[layer] = ligth_latflow_dict['new_mass']
             self.heavymass[layer] = heavy_latflow_dict['new_mass']
+            if self.LFM:
+                spreadActive(self, layer)
             cell_lat_outflow_m3 += latflow_outlet_mm[layer] * cellarea() / 1000  # m3, only out!
 
-            if mapminimum(self.theta[layer]) < 0:
-                print('Error at LF, Layer ' + str(layer))
-            if mapminimum(self.lightmass[layer]) < 0:
-                print("Err LF, light")
-                self.report(self.lightmass[layer], 'LFM_Mz' + str(layer))
-            if mapminimum(self.heavymass[layer]) < 0:
-                print("Err LF, heavy")
+            checkTheta(self, 'LF', layer, tol=1e-06)
+            checkMasses(self, 'LF', layer)
 
         # Lateral flow (Outlet discharge)
-        outlet_latflow_m3 = areatotal(cell_lat_outflow_m3, self.outlet_multi)  # Only outlet cells
+        outlet_latflow_m3 = zoneValue(self, cell_lat_outflow_m3, 'outlet_multi')  # Only outlet cells
+
+        self.timer.lap('lateral_flow')
 
         # Evapotranspiration
         etp = []
@@ -1091,10 +1121,10 @@ class BeachModel(DynamicModel, MonteCarloModel):
             act_evaporation_layer = deepcopy(self.zero_map)
             if layer < 2:
                 if layer == 0:
-                    act_evaporation_layer = getActualEvap(self, layer, pot_evapor, run=self.ETP)
+                    act_evaporation_layer = runHydro(self, getActualEvap, layer, pot_evapor, run=self.ETP)
                     pot_evapor = max(pot_evapor - act_evaporation_layer, scalar(0))
                 else:
-                    act_evaporation_layer = getActualEvap(self, layer, pot_evapor, run=self.ETP)
+                    act_evaporation_layer = runHydro(self, getActualEvap, layer, pot_evapor, run=self.ETP)
 
             # Evaporation
             SW5 = self.theta[layer] * self.layer_depth[layer] - act_evaporation_layer
@@ -1103,8 +1133,8 @@ class BeachModel(DynamicModel, MonteCarloModel):
             evap_m3 += evap[layer] * cellarea() / 1000  # m3
 
             # Transpiration
-            act_transpir_layer = getActualTransp(self, layer, root_depth_tot, root_depth[layer],
-                                                 pot_transpir, depletable_water, run=self.ETP)
+            act_transpir_layer = runHydro(self, getActualTransp, layer, root_depth_tot, root_depth[layer],
+                                          pot_transpir, depletable_water, run=self.ETP)
             act_transpir_layer *= self.f_transp
             SW6 = self.theta[layer] * self.layer_depth[layer] - act_transpir_layer
             self.theta[layer] = SW6 / self.layer_depth[layer]
@@ -1114,28 +1144,38 @@ class BeachModel(DynamicModel, MonteCarloModel):
             etp.append(act_transpir_layer + act_evaporation_layer)
             etp_m3 += etp[layer] * cellarea() / 1000  # m3
 
-            if mapminimum(self.theta[layer]) < 0:
-                print('Error at ETP, Layer ' + str(layer))
+            checkTheta(self, 'ETP', layer, tol=1e-06)
 
-        evap_m3 = areatotal(evap_m3, self.is_catchment)
-        transp_m3 = areatotal(transp_m3, self.is_catchment)
+        evap_m3 = zoneValue(self, evap_m3)
+        transp_m3 = zoneValue(self, transp_m3)
         self.resW_accEvap_m3_tss.sample(evap_m3)
         self.resW_accTransp_m3_tss.sample(transp_m3)
 
+        self.timer.lap('evapotranspiration')
+
         # Baseflow
         # Considering part of basement layer as completely saturated
         # baseflow_mm = (self.theta_sat[-2] * self.layer_depth[-2] * self.gw_factor) / self.k_g  # [mm/d]
         SWbsmt = self.theta[-1] * self.layer_depth[-1]
         baseflow_mm = SWbsmt / self.k_g  # [mm/d]
         SWbsmt -= baseflow_mm
-        if mapminimum(SWbsmt) < 0:
-            val = float(mapminimum(SWbsmt))
-            if val < float(-1e-06):
-                print("Negative Basement Soil Water by: " + str(val))
+        checkState(self, 'BF', 'SW', SWbsmt, self.num_layers - 1, tol=1e-06)
         self.theta[-1] = max(SWbsmt / self.layer_depth[-1], scalar(0))
 
-        accu_baseflow_m3 = accuflux(self.ldd_subs, baseflow_mm * cellarea() / 1000)
-        out_baseflow_m3 = areatotal(accu_baseflow_m3, self.outlet_multi)
+        # Change in storage - Moisture (theta is final from here on)
+        ch_storage = []
+        ch_storage_m3 = deepcopy(self.zero_map)
+        for layer in range(self.num_layers):
+            ch_storage.append((self.theta[layer] * self.layer_depth[layer] * cellarea() / 1000) -
+                              (self.theta_ini[layer] * self.layer_depth[layer] * cellarea() / 1000))
+            ch_storage_m3 += ch_storage[layer]  # Reservoir storage (m3)
+
+        # Outlet discharge (run-off, drainage, baseflow), ETP and change in storage, routed together
+        out_runoff_m3, out_drain_m3, out_baseflow_m3, out_etp_m3, accu_ch_storage_m3 = getOutletTotals(
+            self, [runoff_m3, cell_drain_z2_m3, baseflow_mm * cellarea() / 1000, etp_m3, ch_storage_m3],
+            scalars=self.scalar_lane)
+
+        self.timer.lap('baseflow')
 
         light_deg = []
         heavy_deg = []
@@ -1148,7 +1188,7 @@ class BeachModel(DynamicModel, MonteCarloModel):
         for layer in range(self.num_layers):
             # Temperature
             # temp_dict = getLayerTemp(self, layer, bio_cover, temp_bare_soil)
-            temp_dict = getLayerTemp(self, layer, temp_bare_soil)
+            temp_dict = runHydro(self, getLayerTemp, layer, temp_bare_soil)
             if layer == 0:
                 self.temp_surf_fin = temp_dict["temp_surface"]
             self.temp_fin[layer] = temp_dict["temp_layer"]
@@ -1170,16 +1210,19 @@ class BeachModel(DynamicModel, MonteCarloModel):
                 getTopSoilConditions(self, layer=2)
 
             # Degradation
-            deg_light_dict = getMassDegradation(self, layer, self.lightmass[layer], self.light_aged[layer],
-                                                frac="L", sor_deg_factor=1, fixed_dt50=self.fixed_dt50,
-                                                deg_method='macro',
-                                                bioavail=self.bioavail,
-                                                debug=self.TEST_DEG, run=self.DEG)
-            deg_heavy_dict = getMassDegradation(self, layer, self.heavymass[layer], self.heavy_aged[layer],
-                                                frac="H", sor_deg_factor=1, fixed_dt50=self.fixed_dt50,
-                                                deg_method='macro',
-                                                bioavail=self.bioavail,
-                                                debug=self.TEST_DEG, run=self.DEG)
+            if self.DEG and not isActive(self, layer):  # Background only
+                deg_light_dict, deg_heavy_dict = getBackgroundDecayPair(self, layer,
+                                                                        self.lightmass[layer], self.heavymass[layer],
+                                                                        self.light_aged[layer], self.heavy_aged[layer],
+                                                                        fixed_dt50=self.fixed_dt50, deg_method='macro')
+            else:
+                deg_light_dict, deg_heavy_dict = getMassDegradationPair(self, layer,
+                                                                        self.lightmass[layer], self.heavymass[layer],
+                                                                        self.light_aged[layer], self.heavy_aged[layer],
+                                                                        sor_deg_factor=1, fixed_dt50=self.fixed_dt50,
+                                                                        deg_method='macro',
+                                                                        bioavail=self.bioavail,
+                                                                        debug=self.TEST_DEG, run=self.DEG)
             # self.report(deg_light_dict["mass_tot_new"], 'LoutZ' + str(layer))
             # self.report(deg_heavy_dict["mass_tot_new"], 'HoutZ' + str(layer))
 
@@ -1201,13 +1244,7 @@ class BeachModel(DynamicModel, MonteCarloModel):
             self.light_real[layer] = self.lightmass[layer] + self.light_aged[layer]
             self.heavy_real[layer] = self.heavymass[layer] + self.heavy_aged[layer]
 
-            if mapminimum(self.lightmass[layer]) < 0:
-                print("Err DEG, light")
-                if layer == 0:
-                    self.report(self.lightmass[layer], 'DEG_Mz' + str(layer))
-
-            if mapminimum(self.heavymass[0]) < 0:
-                print("Err DEG, heavy")
+            checkMasses(self, 'DEG', layer)
 
             # Change in mass storage after degradation - Pesticide Mass
             ch_storage_light.append(self.lightmass[layer] -
@@ -1237,6 +1274,8 @@ class BeachModel(DynamicModel, MonteCarloModel):
             self.delta_aged[layer] = ((self.heavy_aged[layer] / self.light_aged[layer] - self.r_standard) /
                                       self.r_standard) * 1000  # [permille]
 
+        self.timer.lap('degradation')
+
         """ Layer analysis """
         if self.TEST_theta:
             for layer in range(self.num_layers):
@@ -1248,14 +1287,8 @@ class BeachModel(DynamicModel, MonteCarloModel):
                                      root_depth)
 
         # Update state variables
-        # Change in storage - Moisture
-        ch_storage = []
-        ch_storage_m3 = deepcopy(self.zero_map)
         for layer in range(self.num_layers):
-            ch_storage.append((self.theta[layer] * self.layer_depth[layer] * cellarea() / 1000) -
-                              (self.theta_ini[layer] * self.layer_depth[layer] * cellarea() / 1000))
             self.theta_ini[layer] = deepcopy(self.theta[layer])
-            ch_storage_m3 += ch_storage[layer]  # Reservoir storage (m3)
 
         if self.TEST_theta:
             getCatchmentStorage(self)
@@ -1266,49 +1299,40 @@ class BeachModel(DynamicModel, MonteCarloModel):
         # Observed conc. can reach 20 ug/g dry soil (on single plot on application)
 
         # Record soil concentrations and isotopes
+        soil_masses = None
         if self.PEST:
             # Bio-available fraction (only)
             cell_mass = self.lightmass[0] + self.heavymass[0]
             cell_massXdelta = cell_mass * self.delta[0]
-            reportSoilTSS(self, cell_mass, cell_massXdelta, 'north', type='bioavail')
-            reportSoilTSS(self, cell_mass, cell_massXdelta, 'valley', type='bioavail')
-            reportSoilTSS(self, cell_mass, cell_massXdelta, 'south', type='bioavail')
 
             # Aged fraction only
             cell_mass_aged = self.light_aged[0] + self.heavy_aged[0]
             cell_massXdelta_aged = cell_mass_aged * self.delta_aged[0]
-            reportSoilTSS(self, cell_mass_aged, cell_massXdelta_aged, 'north', type='aged')
-            reportSoilTSS(self, cell_mass_aged, cell_massXdelta_aged, 'valley', type='aged')
-            reportSoilTSS(self, cell_mass_aged, cell_massXdelta_aged, 'south', type='aged')
 
             # Bio-available and aged fractions
             cell_mass_real = self.light_real[0] + self.heavy_real[0]
             cell_massXdelta_real = cell_mass_real * self.delta_real[0]
-            soils_north = reportSoilTSS(self, cell_mass_real, cell_massXdelta_real, 'north', type='real')
-            soils_valley = reportSoilTSS(self, cell_mass_real, cell_massXdelta_real, 'valley', type='real')
-            soils_south = reportSoilTSS(self, cell_mass_real, cell_massXdelta_real, 'south', type='real')
+
+            # Transect & plot series, sampled with the sinks below (reportZonalTSS)
+            soil_masses = {'bioavail': (cell_mass, cell_massXdelta),
+                           'aged': (cell_mass_aged, cell_massXdelta_aged),
+                           'real': (cell_mass_real, cell_massXdelta_real)}
 
             # Real mass catchment z0 and z+
-            catch_light_real_z0 = areatotal(self.light_real[0], self.is_catchment)
-            catch_heavy_real_z0 = areatotal(self.heavy_real[0], self.is_catchment)
+            catch_light_real_z0 = zoneValue(self, self.light_real[0])
+            catch_heavy_real_z0 = zoneValue(self, self.heavy_real[0])
             nor_real_z0 = areatotal(self.light_real[0] + self.heavy_real[0], self.is_north)
             val_real_z0 = areatotal(self.light_real[0] + self.heavy_real[0], self.is_valley)
             sou_real_z0 = areatotal(self.light_real[0] + self.heavy_real[0], self.is_south)
 
-            catch_light_real_zX = deepcopy(self.zero_map)
-            catch_heavy_real_zX = deepcopy(self.zero_map)
+            catch_light_real_zX = sum(zoneValue(self, self.light_real[layer]) for layer in range(1, self.num_layers))
+            catch_heavy_real_zX = sum(zoneValue(self, self.heavy_real[layer]) for layer in range(1, self.num_layers))
 
             # Aged mass catchment z0 and z+
-            catch_light_aged_z0 = areatotal(self.light_aged[0], self.is_catchment)
-            catch_heavy_aged_z0 = areatotal(self.heavy_aged[0], self.is_catchment)
-            catch_light_aged_zX = deepcopy(self.zero_map)
-            catch_heavy_aged_zX = deepcopy(self.zero_map)
-
-            for layer in range(1, self.num_layers):
-                catch_light_real_zX += areatotal(self.light_real[layer], self.is_catchment)
-                catch_heavy_real_zX += areatotal(self.heavy_real[layer], self.is_catchment)
-                catch_light_aged_zX += areatotal(self.light_aged[layer], self.is_catchment)
-                catch_heavy_aged_zX += areatotal(self.heavy_aged[layer], self.is_catchment)
+            catch_light_aged_z0 = zoneValue(self, self.light_aged[0])
+            catch_heavy_aged_z0 = zoneValue(self, self.heavy_aged[0])
+            catch_light_aged_zX = sum(zoneValue(self, self.light_aged[layer]) for layer in range(1, self.num_layers))
+            catch_heavy_aged_zX = sum(zoneValue(self, self.heavy_aged[layer]) for layer in range(1, self.num_layers))
 
             # Real (z0, zX, heavy and light)
             reportSoilMass(self, "resM_light_real_z0", catch_light_real_z0)
@@ -1334,7 +1358,10 @@ class BeachModel(DynamicModel, MonteCarloModel):
         ###################
         # Water Balance  ##
         ###################
-        q_obs = timeinputscalar('q_obs_m3day.tss', nominal("outlet_v3"))
+        if self.scalar_lane:
+            q_obs = float(getForcingRow(self, 'q_obs_m3day')[0])  # Outlet
+        else:
+            q_obs = getForcing(self, 'q_obs_m3day')
         # conc_outlet_obs = timeinputscalar('Conc_ugL.tss', nominal("outlet_v3"))
         # iso_outlet_obs = timeinputscalar('Delta_out.tss', nominal("outlet_v3"))
 
@@ -1343,6 +1370,9 @@ class BeachModel(DynamicModel, MonteCarloModel):
                                              outlet_latflow_m3,
                                              out_drain_m3, baseflow=out_baseflow_m3)
         self.resW_accQ_m3_tss.sample(tot_vol_disch_m3)
+        if self.outlet_record:
+            self.outlet_terms.append([float(x) for x in (tot_vol_disch_m3, out_runoff_m3, outlet_latflow_m3,
+                                                         out_drain_m3, out_baseflow_m3, out_etp_m3)])
 
         # Percolation Z0 and z1
 
@@ -1350,14 +1380,6 @@ class BeachModel(DynamicModel, MonteCarloModel):
         # out_percol_m3 = accuflux(self.ldd_subs, percol_basement_m3)
         # out_percol_m3 = areatotal(out_percol_m3, self.outlet_multi)
 
-        # Evapotranspiration
-        out_etp_m3 = accuflux(self.ldd_subs, etp_m3)
-        out_etp_m3 = areatotal(out_etp_m3, self.outlet_multi)
-
-        # Change in storage
-        accu_ch_storage_m3 = accuflux(self.ldd_subs, ch_storage_m3)
-        accu_ch_storage_m3 = areatotal(accu_ch_storage_m3, self.outlet_multi)
-
         # Cumulative
         # reportCumHydro(self, q_obs, out_runoff_m3, out_drain_m3, tot_rain_m3,
         #               out_etp_m3, outlet_latflow_m3, out_percol_m3=None)
@@ -1374,11 +1396,8 @@ class BeachModel(DynamicModel, MonteCarloModel):
         # Pesticide Balance ##
         ######################
         # Applied mass on catchment
-        catch_app = areatotal(light_applied + heavy_applied, self.is_catchment)  #
+        catch_app = zoneValue(self, light_applied + heavy_applied)  #
         self.resM_accAPP_g_tss.sample(catch_app)
-        reportTransectSinkTSS(self, 'APP_mass', self.cum_appZ0_g, 'north')
-        reportTransectSinkTSS(self, 'APP_mass', self.cum_appZ0_g, 'valley')
-        reportTransectSinkTSS(self, 'APP_mass', self.cum_appZ0_g, 'south')
 
         # Degradation
         light_deg_tot = deepcopy(self.zero_map)
@@ -1387,21 +1406,18 @@ class BeachModel(DynamicModel, MonteCarloModel):
             light_deg_tot += light_deg[layer]
             heavy_deg_tot += heavy_deg[layer]
 
-        z0_deg_catch = areatotal(light_deg[0] + heavy_deg[0], self.is_catchment)
+        z0_deg_catch = zoneValue(self, light_deg[0] + heavy_deg[0])
         z0_deg_nor = areatotal(light_deg[0] + heavy_deg[0], self.is_north)
         z0_deg_val = areatotal(light_deg[0] + heavy_deg[0], self.is_valley)
         z0_deg_sou = areatotal(light_deg[0] + heavy_deg[0], self.is_south)
 
-        zX_deg_catch = areatotal(light_deg_tot + heavy_deg_tot, self.is_catchment)
+        zX_deg_catch = zoneValue(self, light_deg_tot + heavy_deg_tot)
 
         self.resM_accDEGzX_tss.sample(zX_deg_catch)
         self.resM_accDEGz0_tss.sample(z0_deg_catch)
         self.resM_accDEGz0nor_tss.sample(z0_deg_nor)
         self.resM_accDEGz0val_tss.sample(z0_deg_val)
         self.resM_accDEGz0sou_tss.sample(z0_deg_sou)
-        reportTransectSinkTSS(self, 'DEG_mass', light_deg[0] + heavy_deg[0], 'north')
-        reportTransectSinkTSS(self, 'DEG_mass', light_deg[0] + heavy_deg[0], 'valley')
-        reportTransectSinkTSS(self, 'DEG_mass', light_deg[0] + heavy_deg[0], 'south')
 
         # self.cum_degZ0_g += z0_deg_catch
         # self.cum_degZ0_g_tss.sample(self.cum_degZ0_g)
@@ -1417,23 +1433,20 @@ class BeachModel(DynamicModel, MonteCarloModel):
             light_aged_deg_tot += light_aged_deg[layer]
             heavy_aged_deg_tot += heavy_aged_deg[layer]
 
-        z0_aged_catch = areatotal(self.light_aged[0] + self.heavy_aged[0], self.is_catchment)
-        zX_aged_catch = areatotal(light_aged_tot + heavy_aged_tot, self.is_catchment)
-        z0_aged_deg_catch = areatotal(light_aged_deg[0] + heavy_aged_deg[0], self.is_catchment)
-        zX_aged_deg_catch = areatotal(light_aged_deg_tot + heavy_aged_deg_tot, self.is_catchment)
+        z0_aged_catch = zoneValue(self, self.light_aged[0] + self.heavy_aged[0])
+        zX_aged_catch = zoneValue(self, light_aged_tot + heavy_aged_tot)
+        z0_aged_deg_catch = zoneValue(self, light_aged_deg[0] + heavy_aged_deg[0])
+        zX_aged_deg_catch = zoneValue(self, light_aged_deg_tot + heavy_aged_deg_tot)
 
         self.resM_accAGEDz0_tss.sample(z0_aged_catch)
         self.resM_accAGEDzX_tss.sample(zX_aged_catch)
         self.resM_accAGED_DEGz0_tss.sample(z0_aged_deg_catch)
         self.resM_accAGED_DEGzX_tss.sample(zX_aged_deg_catch)
-        reportTransectSinkTSS(self, 'AGE_mass', self.light_aged[0] + self.heavy_aged[0], 'north')
-        reportTransectSinkTSS(self, 'AGE_mass', self.light_aged[0] + self.heavy_aged[0], 'valley')
-        reportTransectSinkTSS(self, 'AGE_mass', self.light_aged[0] + self.heavy_aged[0], 'south')
         # self.cum_aged_deg_L_g += catch_aged_deg_light
         # self.cum_aged_deg_L_g_tss.sample(self.cum_aged_deg_L_g)
 
         # Volatilized
-        catch_volat = areatotal(light_volat + heavy_volat, self.is_catchment)
+        catch_volat = zoneValue(self, light_volat + heavy_volat)
         z0_volat_nor = areatotal(light_volat + heavy_volat, self.is_north)
         z0_volat_val = areatotal(light_volat + heavy_volat, self.is_valley)
         z0_volat_sou = areatotal(light_volat + heavy_volat, self.is_south)
@@ -1442,14 +1455,11 @@ class BeachModel(DynamicModel, MonteCarloModel):
         self.resM_accVOLATz0nor_tss.sample(z0_volat_nor)
         self.resM_accVOLATz0val_tss.sample(z0_volat_val)
         self.resM_accVOLATz0sou_tss.sample(z0_volat_sou)
-        reportTransectSinkTSS(self, 'VOLA_mass', light_volat + heavy_volat, 'north')
-        reportTransectSinkTSS(self, 'VOLA_mass', light_volat + heavy_volat, 'valley')
-        reportTransectSinkTSS(self, 'VOLA_mass', light_volat + heavy_volat, 'south')
 
         # Mass loss to run-off
         # Index: 0 <- light, Index: 2 <- heavy
-        catch_runoff_light = areatotal(mass_runoff[0], self.is_catchment)
-        catch_runoff_heavy = areatotal(mass_runoff[1], self.is_catchment)
+        catch_runoff_light = zoneValue(self, mass_runoff[0])
+        catch_runoff_heavy = zoneValue(self, mass_runoff[1])
         catch_runoff_mass = catch_runoff_light + catch_runoff_heavy
         nor_runoff = areatotal(mass_runoff[0] + mass_runoff[1], self.is_north)
         val_runoff = areatotal(mass_runoff[0] + mass_runoff[1], self.is_valley)
@@ -1459,13 +1469,10 @@ class BeachModel(DynamicModel, MonteCarloModel):
         self.resM_accROz0nor_tss.sample(nor_runoff)
         self.resM_accROz0val_tss.sample(val_runoff)
         self.resM_accROz0sou_tss.sample(sou_runoff)
-        reportTransectSinkTSS(self, 'ROFF_mass', mass_runoff[0] + mass_runoff[1], 'north')
-        reportTransectSinkTSS(self, 'ROFF_mass', mass_runoff[0] + mass_runoff[1], 'valley')
-        reportTransectSinkTSS(self, 'ROFF_mass', mass_runoff[0] + mass_runoff[1], 'south')
 
         # z0-mass leached
-        catch_leach_light_z0 = areatotal(light_leached[0], self.is_catchment)
-        catch_leach_heavy_z0 = areatotal(heavy_leached[0], self.is_catchment)
+        catch_leach_light_z0 = zoneValue(self, light_leached[0])
+        catch_leach_heavy_z0 = zoneValue(self, heavy_leached[0])
         z0_catch_leach = catch_leach_light_z0 + catch_leach_heavy_z0
 
         nor_leach_z0 = areatotal(light_leached[0] + heavy_leached[0], self.is_north)
@@ -1477,14 +1484,20 @@ class BeachModel(DynamicModel, MonteCarloModel):
         self.resM_accLCHz0val_tss.sample(val_leach_z0)
         self.resM_accLCHz0sou_tss.sample(sou_leach_z0)
 
-        reportTransectSinkTSS(self, 'LCH_mass', light_leached[0] + heavy_leached[0], 'north')
-        reportTransectSinkTSS(self, 'LCH_mass', light_leached[0] + heavy_leached[0], 'valley')
-        reportTransectSinkTSS(self, 'LCH_mass', light_leached[0] + heavy_leached[0], 'south')
         # self.cum_lchZ0_L_g += catch_leach_light_z0
         # self.resM_cumLCHz0_L_g_tss.sample(self.cum_lchZ0_L_g)
 
+        # Transect sinks & soil series: zone totals of all variables in one pass (zonal.py)
+        reportZonalTSS(self, soil_masses,
+                       sinks={'APP_mass': self.cum_appZ0_g,
+                              'DEG_mass': light_deg[0] + heavy_deg[0],
+                              'AGE_mass': self.light_aged[0] + self.heavy_aged[0],
+                              'VOLA_mass': light_volat + heavy_volat,
+                              'ROFF_mass': mass_runoff[0] + mass_runoff[1],
+                              'LCH_mass': light_leached[0] + heavy_leached[0]})
+
         # z1-mass leached
-        catch_leach_light_z1 = areatotal(light_leached[1] + heavy_leached[1], self.is_catchment)
+        catch_leach_light_z1 = zoneValue(self, light_leached[1] + heavy_leached[1])
         self.resM_accLCHz1_tss.sample(catch_leach_light_z1)
 
         # Basement-mass leached = zero, if no basement percolation
@@ -1492,8 +1505,8 @@ class BeachModel(DynamicModel, MonteCarloModel):
         # self.resM_accDP_L_tss.sample(catch_leach_light_Bsmt)
 
         # Artificial drained mass (layer z2)
-        catch_drain_light = areatotal(light_drained, self.is_catchment)
-        catch_drain_heavy = areatotal(heavy_drained, self.is_catchment)
+        catch_drain_light = zoneValue(self, light_drained)
+        catch_drain_heavy = zoneValue(self, heavy_drained)
         # catch_drain_heavy = areatotal(heavy_drained, self.is_catchment)
         self.resM_accADR_tss.sample(catch_drain_light + catch_drain_heavy)
         # catch_drain_heavy = areatotal(z1_heavy_drain, self.is_catchment)
@@ -1516,12 +1529,12 @@ class BeachModel(DynamicModel, MonteCarloModel):
             latflux_light_catch += ligth_latflow[layer]
             latflux_heavy_catch += heavy_latflow[layer]
 
-        catch_latflux_light = areatotal(latflux_light_catch, self.outlet_multi)  # Needed for MB
-        catch_latflux_heavy = areatotal(latflux_heavy_catch, self.outlet_multi)  # Needed for MB
+        catch_latflux_light = zoneValue(self, latflux_light_catch, 'outlet_multi')  # Needed for MB
+        catch_latflux_heavy = zoneValue(self, latflux_heavy_catch, 'outlet_multi')  # Needed for MB
         self.resM_accLF_tss.sample(catch_latflux_light + catch_latflux_heavy)  # Reports the outlet-only loss
 
         # For mass balance Z0 layer
-        z0_latflux = areatotal(ligth_latflow[0] + heavy_latflow[0], self.outlet_multi)
+        z0_latflux = zoneValue(self, ligth_latflow[0] + heavy_latflow[0], 'outlet_multi')
 
         # Baseflow flux
         # out_baseflow_light = areatotal(baseflow_light, self.is_catchment)
@@ -1533,8 +1546,8 @@ class BeachModel(DynamicModel, MonteCarloModel):
             ch_storage_light_catch += ch_storage_light[layer]
 
         # catch_ch_storage_light = areatotal(ch_storage_light_catch, self.is_catchment)
-        z0_ch_storage_light = areatotal(ch_storage_light[0], self.is_catchment)
-        z0_ch_storage_heavy = areatotal(ch_storage_heavy[0], self.is_catchment)
+        z0_ch_storage_light = zoneValue(self, ch_storage_light[0])
+        z0_ch_storage_heavy = zoneValue(self, ch_storage_heavy[0])
         z0_ch_storage = z0_ch_storage_light + z0_ch_storage_heavy
         # self.resM_accCHS_L_tss.sample(catch_ch_storage_light)
 
@@ -1544,7 +1557,7 @@ class BeachModel(DynamicModel, MonteCarloModel):
         #     ch_storage_light_aged_catch += ch_storage_light_aged[layer]
         #     ch_storage_heavy_aged_catch += ch_storage_heavy_aged[layer]
 
-        z0_ch_storage_aged = areatotal(ch_storage_light_aged[0] + ch_storage_heavy_aged[0], self.is_catchment)
+        z0_ch_storage_aged = zoneValue(self, ch_storage_light_aged[0] + ch_storage_heavy_aged[0])
         # catch_ch_storage_light_aged = areatotal(ch_storage_light_aged_catch, self.is_catchment)
         # self.resM_accCHS_AGED_L_tss.sample(catch_ch_storage_light_aged)
 
@@ -1557,10 +1570,10 @@ class BeachModel(DynamicModel, MonteCarloModel):
         self.resM_EXP_light_g_tss.sample(outlet_light_export)  # grams
         self.resM_EXP_heavy_g_tss.sample(outlet_heavy_export)  # grams
 
-        conc_ugL = (outlet_light_export + outlet_heavy_export) * 1e6 / (tot_vol_disch_m3 * 1e3)
-        conc_ROFF_ug_L = (catch_runoff_light + catch_runoff_heavy) * 1e6 / (tot_vol_disch_m3 * 1e3)
-        conc_LF_ug_L = (catch_latflux_light + catch_latflux_heavy) * 1e6 / (tot_vol_disch_m3 * 1e3)
-        conc_ADR_ug_L = (catch_drain_light + catch_drain_heavy) * 1e6 / (tot_vol_disch_m3 * 1e3)
+        conc_ugL = divideValues((outlet_light_export + outlet_heavy_export) * 1e6, tot_vol_disch_m3 * 1e3)
+        conc_ROFF_ug_L = divideValues((catch_runoff_light + catch_runoff_heavy) * 1e6, tot_vol_disch_m3 * 1e3)
+        conc_LF_ug_L = divideValues((catch_latflux_light + catch_latflux_heavy) * 1e6, tot_vol_disch_m3 * 1e3)
+        conc_ADR_ug_L = divideValues((catch_drain_light + catch_drain_heavy) * 1e6, tot_vol_disch_m3 * 1e3)
 
         self.resM_oCONC_ugL_tss.sample(conc_ugL)  # ug/L
         self.resM_oCONC_ROFF_ugL_tss.sample(conc_ROFF_ug_L)  # ug/L
@@ -1573,16 +1586,16 @@ class BeachModel(DynamicModel, MonteCarloModel):
         #               catch_volat_light, catch_deg_light)
 
         # Isotope signature - outlet
-        out_delta = ((outlet_heavy_export / outlet_light_export - self.r_standard) /
+        out_delta = ((divideValues(outlet_heavy_export, outlet_light_export) - self.r_standard) /
                      self.r_standard) * 1000  # [permille]
 
         self.resM_outISO_d13C_tss.sample(out_delta)
 
-        roff_delta = ((catch_runoff_heavy / catch_runoff_light - self.r_standard) /
+        roff_delta = ((divideValues(catch_runoff_heavy, catch_runoff_light) - self.r_standard) /
                       self.r_standard) * 1000  # [permille]
-        latflux_delta = ((catch_latflux_heavy / catch_latflux_light - self.r_standard) /
+        latflux_delta = ((divideValues(catch_latflux_heavy, catch_latflux_light) - self.r_standard) /
                          self.r_standard) * 1000  # [permille]
-        drain_delta = ((catch_drain_heavy / catch_drain_light - self.r_standard) /
+        drain_delta = ((divideValues(catch_drain_heavy, catch_drain_light) - self.r_standard) /
                        self.r_standard) * 1000  # [permille]
 
         self.resM_outISO_ROFF_d13C_tss.sample(roff_delta)
@@ -1602,8 +1615,46 @@ class BeachModel(DynamicModel, MonteCarloModel):
                                 z0_ch_storage_aged)
 
         # Total days with data (needed for mean calculations)
-        self.days_cum += ifthenelse(q_obs >= 0, scalar(1), scalar(0))
+        if self.scalar_lane:
+            self.days_cum += int(q_obs >= 0)
+        else:
+            self.days_cum += ifthenelse(q_obs >= 0, scalar(1), scalar(0))
 
+        self.timer.stop('reporting')
+        if self.objectives and updateObjectives(self, {'q': tot_vol_disch_m3}):
+            print("Sample " + str(self.currentSampleNumber()) + " aborted at step " + str(self.aborted) +
+                  ", objectives out of reach")
+
+        if self.checkpoint_every > 0 and self.aborted is None and self.currentTimeStep() % self.checkpoint_every == 0:
+            saveCheckpoint(self, os.path.join(str(self.currentSampleNumber()),
+                                              'checkpoint_' + str(self.currentTimeStep()) + '.npz'))
+            flushSeries(self, clear=False)  # Output up to the checkpoint survives a crash
+
+        if self.currentTimeStep() == self.nrTimeSteps() or self.aborted is not None:
+            self.finishSample()
+
+    def finishSample(self):
+        """
+        Outputs of the sample, at the last time step or when it is aborted (nash.py)
+        """
+        sample_dir = str(self.currentSampleNumber())
+        if self.profile:
+            writeTiming(self.timer, os.path.join(sample_dir, 'timing.csv'))
+
+        if self.check_level != 'off':
+            reportChecks(self, os.path.join(sample_dir, 'checks.csv'))
+
+        if self.hydro_compare:
+            reportHydroDiff(self, os.path.join(sample_dir, 'hydro_diff.csv'))
+
+        if self.outlet_check:
+            reportOutletDiff(self, os.path.join(sample_dir, 'outlet_check.csv'))
+
+        if self.objectives:
+            writeObjectives(self, os.path.join(sample_dir, 'objectives.csv'))
+
+        flushSeries(self)
+        closeTrajectory(self, complete=self.aborted is None)
 
     def postmcloop(self):
         pass
@@ -1617,65 +1668,99 @@ class BeachModel(DynamicModel, MonteCarloModel):
 
 # Define models to run
 def get_constrained_matrix(smps, on=True):
-    tot_len = 0
-    while tot_len < 1:
-        smps_values = latin.sample(problem, smps)
-        new_values = deepcopy(smps_values)
-        if on:
-            for row in range(len(smps_values))[::-1]:
-                v = smps_values[row]
-                if v[1] < v[2] or v[5] < v[6]:
-                    # print("Deleting: ", new_values[row])
-                    new_values = np.delete(new_values, row, axis=0)
-        tot_len = len(new_values)
-    return new_values
+    """
+    :param on: cZ0Z1 >= cZ and gamma01 >= gammaZ, sampled inside the constraints (mlhs_v15.get_ordered_latin)
+    """
+    if not on:
+        return latin.sample(problem, smps)
+    return get_ordered_latin(problem, smps)
 
 problem = get_problem()
 names = problem['names']
-test = True
-if test:
-    samples = 2
-    test_values = get_vector_test()  # Return a vector, with same values as names
-    upper = np.ones(len(test_values)).tolist()
-    # param_values = np.loadtxt('lhs_vectors.txt')
-else:
-    check_sampling = False
-    samples = 50
-    upper = problem['upper']
-    # Turned off to return to full Latin Hypercube
-    test_values = get_constrained_matrix(samples, on=check_sampling)
-    print("Before sampling, total samples:")
-    print(len(test_values))
-
-    # Add a random vector from the re-sampled hypercube
-    # until the desired number of samples meeting constraints are met.
-    while len(test_values) < samples:
-        resample = get_constrained_matrix(samples, on=check_sampling)
-        test_values = np.vstack([test_values, resample[randint(0, len(resample) - 1)]])
-
-    print("After re-sampling, total samples:")
-    print(len(test_values))
-    saveLHSmatrix(test_values)
-
-
-firstTimeStep = start_jday()  # 166 -> 14/03/2016
-nTimeSteps = 286  # 286, 360
-
-myAlteck16 = BeachModel("clone_nom.map", names, test_values, upper, staticDT50=False, test=test)
-dynamicModel = DynamicFramework(myAlteck16, lastTimeStep=nTimeSteps,
-                                firstTimestep=firstTimeStep)  # an instance of the Dynamic Framework
-mcModel = MonteCarloFramework(dynamicModel, samples)
-
-t0 = datetime.now()
-print(datetime.today().strftime('%Y-%m-%d %HH:%MM'))
-# dynamicModel.run()
-mcModel.run()
-t1 = datetime.now()
-
-
-duration = t1 - t0
-tot_min = duration.total_seconds() / 60.
-print("Total hrs: ", tot_min/60.)
-print("Minutes/monte carlo", tot_min / int(samples))
-print("Minutes/Yr: ", (duration.total_seconds() / 60.) / (nTimeSteps - firstTimeStep) * 365)
-print(datetime.today().strftime('%Y-%m-%d %HH:%MM'))
+
+if __name__ == "__main__":
+    test = True
+    parallel = False  # One worker process per LHS row (ensemble.py)
+    batch = False  # All LHS rows as one stacked-array hydrology run (batch.py)
+    batch_fate = True  # After the batch: the pesticide fate of each sample, replaying the batch hydrology
+    compare_batch = False  # First LHS row with batch.py & BeachModel, differences -> batch_diff.csv
+    workers = None  # None -> all cores
+    # Restart from a checkpoint (checkpoint.py): '{sample}/checkpoint_<step>.npz' per sample,
+    # or a spin-up file shared by all samples
+    resume = None
+    spinup = None
+    # Fate samples nested in hydrology samples (mlhs_v15.get_nested_matrix), e.g.
+    # {'hydro': 10, 'fate': 20, 'design': 'cross'}: one water solution per hydrology row (trajectory.py)
+    nested = None
+    trajectory = 'off'
+    if test:
+        samples = 2
+        test_values = get_vector_test()  # Return a vector, with same values as names
+        upper = np.ones(len(test_values)).tolist()
+        # param_values = np.loadtxt('lhs_vectors.txt')
+    elif nested is not None:
+        upper = problem['upper']
+        test_values = get_nested_matrix(problem, nested['hydro'], nested['fate'], design=nested['design'])
+        samples = len(test_values)
+        trajectory = 'auto'
+        saveLHSmatrix(test_values, names)
+    else:
+        check_sampling = False
+        samples = 50
+        upper = problem['upper']
+        # Turned off to return to full Latin Hypercube
+        test_values = get_constrained_matrix(samples, on=check_sampling)
+        print("Total samples:")
+        print(len(test_values))
+        saveLHSmatrix(test_values, names)
+
+    firstTimeStep = start_jday()  # 166 -> 14/03/2016
+    nTimeSteps = 286  # 286, 360
+    if resume is not None:
+        firstTimeStep = getCheckpointStep(resume.format(sample=1)) + 1
+    elif spinup is not None:
+        firstTimeStep = getCheckpointStep(spinup) + 1
+
+    t0 = datetime.now()
+    print(datetime.today().strftime('%Y-%m-%d %HH:%MM'))
+    buildLandscape("clone_nom.map")  # Static maps computed once, attached by all samples & workers
+    if batch and (resume is not None or spinup is not None):
+        raise ValueError("The batch runner does not restore checkpoints (resume, spinup)")
+    if batch and not compare_batch:
+        from batch import runBatch
+        runBatch(names, test_values, upper, samples, firstTimeStep, nTimeSteps, test=test,
+                 trajectory='record' if batch_fate else 'off')
+        trajectory = 'auto'  # Replays the hydrology recorded by the batch
+    run_samples = not compare_batch and (batch_fate or not batch)
+    if compare_batch:
+        from batch import compareBatch
+        compareBatch(names, test_values, upper, firstTimeStep, nTimeSteps, test=test)
+    elif not run_samples:
+        pass
+    elif parallel:
+        from ensemble import runEnsemble
+        runEnsemble(BeachModel, "clone_nom.map", names, test_values, upper, samples,
+                    firstTimeStep, nTimeSteps, workers=workers, staticDT50=False, test=test,
+                    trajectory=trajectory, resume=resume, spinup=spinup)
+    else:
+        myAlteck16 = BeachModel("clone_nom.map", names, test_values, upper, staticDT50=False, test=test,
+                                resume=resume, spinup=spinup, trajectory=trajectory)
+        dynamicModel = DynamicFramework(myAlteck16, lastTimeStep=nTimeSteps,
+                                        firstTimestep=firstTimeStep)  # an instance of the Dynamic Framework
+        mcModel = MonteCarloFramework(dynamicModel, samples)
+        # dynamicModel.run()
+        mcModel.run()
+    if run_samples:
+        mergeSeries(range(1, samples + 1))  # series_ensemble.npz (npz output backend)
+        for sample in range(1, samples + 1):  # .tss files of the npz backend, as the 'tss' backend
+            if os.path.exists(os.path.join(str(sample), 'series.npz')):
+                npzToTss(os.path.join(str(sample), 'series.npz'))
+        mergeTiming(range(1, samples + 1))  # timing_samples.csv (if profiled)
+    t1 = datetime.now()
+
+    duration = t1 - t0
+    tot_min = duration.total_seconds() / 60.
+    print("Total hrs: ", tot_min/60.)
+    print("Minutes/monte carlo", tot_min / int(samples))
+    print("Minutes/Yr: ", (duration.total_seconds() / 60.) / (nTimeSteps - firstTimeStep) * 365)
+    print(datetime.today().strftime('%Y-%m-%d %HH:%MM'))
@@ -1,19 +1,150 @@
 # -*- coding: utf-8 -*-
 from pcraster.framework import *
+from pcraster import pcr2numpy
+import numpy as np
+import os
+
+from series import getSeriesOutput
+from forcing import getForcingRow
+from zonal import isValue, divideValues
+
+"""
+Streaming objectives (early termination)
+
+NSE = 1 - SSE / SST, with SST = sum of (obs - mean)^2 over the days with observations.
+SST only depends on the observations (and the means of initial.csv, as the Nash maps below),
+so it is known for the whole run before it starts, while SSE can only grow. After each time step
+the best reachable NSE (a perfect fit on all remaining days) is 1 - SSE / SST.
+With model.objective_bounds = {name: lower bound}, a sample is aborted as soon as the best
+reachable value of an objective falls below its bound (behavioural threshold, GLUE):
+ - 'q': discharge at the outlet (q_obs_m3day.tss), the statistic of resNash_q_m3
+KGE has no such bound (the remaining days can still correct bias and variability), it can't abort.
+Neither can the outlet concentration: resNash_outConc_ugL (repNashOutConc) divides by the variance
+of the simulation around the observed mean, sum of (sim - mean)^2, which grows with the simulation
+and can't be bounded in advance. A bound on the standard NSE would abort samples whose reported
+value still passes, so 'conc' is not an objective.
+<sample>/objectives.csv: best reachable value of each objective, the step of the abort and the series
+with the reported statistic.
+"""
+
+# name: (observed series (forcing.py), mean (initial.csv), transforms (NSE averaged over them))
+objective_series = {'q': ('q_obs_m3day', 'ave_outlet_q_m3day', [None])}
+# name: reported Nash series, same statistic as the bound
+objective_reports = {'q': 'resNash_q_m3'}
+
+
+def isObserved(obs, transform):
+    """ Days with an observation: >= 0 (-1, -1e9: no data), > 0 for the ln-transform """
+    with np.errstate(invalid='ignore'):
+        if transform == 'ln':
+            return np.isfinite(obs) & (obs > 0)
+        return np.isfinite(obs) & (obs >= 0)
+
+
+def transformSeries(values, transform):
+    if transform == 'ln':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.log(values)
+    return values
+
+
+def defineObjectives(model):
+    """
+    SST of each objective in model.objective_bounds over the time steps of the run (initial)
+    """
+    model.objectives = dict()
+    model.aborted = None  # Time step of the abort
+    for name in getattr(model, 'objective_bounds', dict()):
+        if name not in objective_series:
+            raise ValueError("No bound on objective '" + name + "', abortable: " + ", ".join(objective_series))
+        series, mean_name, transforms = objective_series[name]
+        store = model.forcing[series]
+        first = model.firstTimeStep() - store['first']
+        obs = store['values'][max(first, 0):model.nrTimeSteps() - store['first'] + 1, 0]
+        terms = []
+        for transform in transforms:
+            mean = float(model.ini_param.get(mean_name))
+            dev = transformSeries(obs[isObserved(obs, transform)], transform) - mean
+            terms.append({'transform': transform, 'sst': float(np.sum(dev ** 2)), 'sse': 0.})
+        cell = np.flatnonzero(store['cols'][1])[0]  # Outlet cell of the series
+        model.objectives[name] = {'series': series, 'cell': cell, 'terms': terms, 'best': 1.,
+                                  'bound': float(model.objective_bounds[name])}
+
+
+def getBestReachable(objective):
+    """
+    :return: NSE if the simulation matched the observations on all remaining days
+    """
+    ratios = [term['sse'] / term['sst'] for term in objective['terms'] if term['sst'] > 0]
+    if not ratios:
+        return 1.
+    return 1. - sum(ratios) / len(ratios)
+
+
+def updateObjectives(model, simulated):
+    """
+    :param simulated: {objective name: map (or number) of the simulated value at the outlet}
+    :return: True if an objective can no longer reach its bound (model.aborted is set)
+    """
+    for name, objective in model.objectives.items():
+        obs = float(getForcingRow(model, objective['series'])[0])
+        if not isObserved(obs, None):
+            continue
+        if isValue(simulated[name]):
+            sim = float(simulated[name])
+        else:
+            sim = float(pcr2numpy(spatial(scalar(simulated[name])), np.nan).ravel()[objective['cell']])
+        for term in objective['terms']:
+            if not isObserved(obs, term['transform']):
+                continue
+            error = transformSeries(sim, term['transform']) - transformSeries(obs, term['transform'])
+            if np.isfinite(error):  # Missing value (e.g. ln of 0) -> not counted, as in the Nash maps
+                term['sse'] += float(error ** 2)
+        objective['best'] = getBestReachable(objective)
+        if objective['best'] < objective['bound'] and model.aborted is None:
+            model.aborted = model.currentTimeStep()
+    return model.aborted is not None
+
+
+def writeObjectives(model, path='objectives.csv'):
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(path, 'w') as f:
+        f.write('objective,best_reachable,bound,aborted_step,reported_series\n')
+        for name, objective in model.objectives.items():
+            f.write(name + ',' + repr(objective['best']) + ',' + repr(objective['bound']) + ',' +
+                    ('' if model.aborted is None else str(model.aborted)) + ',' +
+                    objective_reports[name] + '\n')
+
+
+def ifObserved(observed, value):
+    """
+    ifthenelse(observed, value, 0) of maps, or of the outlet values (model.scalar_lane)
+    """
+    if isValue(observed):
+        return value if observed else 0.
+    return ifthenelse(observed, value, 0)
+
+
+def lnValue(x):
+    if isValue(x):
+        return transformSeries(float(x), 'ln') if x > 0 else np.nan
+    return ln(x)
 
 
 def defineNashHydroTSS(model):
-    model.q_m3day_mean = scalar(model.ini_param.get("ave_outlet_q_m3day"))
-    model.conc_outlet_mean = scalar(model.ini_param.get("ave_outlet_conc_ugL"))
-    model.ln_conc_outlet_mean = scalar(model.ini_param.get("ave_outlet_lnconc_ugL"))
-    model.delta_outlet_mean = scalar(model.ini_param.get("ave_outlet_delta"))
-
-    model.nash_q_tss = TimeoutputTimeseries("resNash_q_m3", model, nominal("outlet_v3"),
-                                           noHeader=False)  # This is 'Nash_q' as time series.
-    model.nash_outlet_conc_tss = TimeoutputTimeseries("resNash_outConc_ugL", model, nominal("outlet_v3"),
-                                                     noHeader=False)
-    model.nash_outlet_iso_tss = TimeoutputTimeseries("resNash_outIso_delta", model, nominal("outlet_v3"),
-                                                    noHeader=False)
+    model.q_m3day_mean = float(model.ini_param.get("ave_outlet_q_m3day"))
+    model.conc_outlet_mean = float(model.ini_param.get("ave_outlet_conc_ugL"))
+    model.ln_conc_outlet_mean = float(model.ini_param.get("ave_outlet_lnconc_ugL"))
+    model.delta_outlet_mean = float(model.ini_param.get("ave_outlet_delta"))
+
+    model.nash_q_tss = getSeriesOutput("resNash_q_m3", model, nominal("outlet_v3"),
+                                      noHeader=False)  # This is 'Nash_q' as time series.
+    model.nash_outlet_conc_tss = getSeriesOutput("resNash_outConc_ugL", model, nominal("outlet_v3"),
+                                                noHeader=False)
+    model.nash_outlet_iso_tss = getSeriesOutput("resNash_outIso_delta", model, nominal("outlet_v3"),
+                                               noHeader=False)
 
 
 def defineNashPestiTSS(model):
@@ -26,27 +157,27 @@ def defineNashPestiTSS(model):
     
     # NASH composite soils
     # Single pixel value, grouping area total for each transect
-    model.resNash_NcompConc_L_tss = TimeoutputTimeseries("resNash_NcompConc_L", model, nominal("north_ave"),
-                                                         noHeader=False)
-    model.resNash_VcompConc_L_tss = TimeoutputTimeseries("resNash_VcompConc_L", model, nominal("valley_ave"),
-                                                         noHeader=False)
-    model.resNash_ScompConc_L_tss = TimeoutputTimeseries("resNash_ScompConc_L", model, nominal("south_ave"),
-                                                         noHeader=False)
-    model.resNash_NcompIso_tss = TimeoutputTimeseries("resNash_NcompIso", model, nominal("north_ave"),
-                                                      noHeader=False)
-    model.resNash_VcompIso_tss = TimeoutputTimeseries("resNash_VcompIso", model, nominal("valley_ave"),
-                                                      noHeader=False)
-    model.resNash_ScompIso_tss = TimeoutputTimeseries("resNash_ScompIso", model, nominal("south_ave"),
-                                                      noHeader=False)
+    model.resNash_NcompConc_L_tss = getSeriesOutput("resNash_NcompConc_L", model, nominal("north_ave"),
+                                                    noHeader=False)
+    model.resNash_VcompConc_L_tss = getSeriesOutput("resNash_VcompConc_L", model, nominal("valley_ave"),
+                                                    noHeader=False)
+    model.resNash_ScompConc_L_tss = getSeriesOutput("resNash_ScompConc_L", model, nominal("south_ave"),
+                                                    noHeader=False)
+    model.resNash_NcompIso_tss = getSeriesOutput("resNash_NcompIso", model, nominal("north_ave"),
+                                                 noHeader=False)
+    model.resNash_VcompIso_tss = getSeriesOutput("resNash_VcompIso", model, nominal("valley_ave"),
+                                                 noHeader=False)
+    model.resNash_ScompIso_tss = getSeriesOutput("resNash_ScompIso", model, nominal("south_ave"),
+                                                 noHeader=False)
 
 
 def reportNashHydro(model, q_obs, tot_vol_disch_m3):
     # Global ave discharge of data range = 260.07 m3/day
-    model.q_obs_cum += ifthenelse(q_obs >= 0, q_obs, 0)
-    model.q_sim_cum += ifthenelse(q_obs >= 0, tot_vol_disch_m3, 0)
-    model.q_diff += ifthenelse(q_obs >= 0, (tot_vol_disch_m3 - q_obs) ** 2, 0)
-    model.q_var += ifthenelse(q_obs >= 0, (q_obs - model.q_m3day_mean) ** 2, 0)
-    nash_q = 1 - (model.q_diff / model.q_var)
+    model.q_obs_cum += ifObserved(q_obs >= 0, q_obs)
+    model.q_sim_cum += ifObserved(q_obs >= 0, tot_vol_disch_m3)
+    model.q_diff += ifObserved(q_obs >= 0, (tot_vol_disch_m3 - q_obs) ** 2)
+    model.q_var += ifObserved(q_obs >= 0, (q_obs - model.q_m3day_mean) ** 2)
+    nash_q = 1 - divideValues(model.q_diff, model.q_var)
     model.nash_q_tss.sample(nash_q)
 
     model.q_obs_cum_tss.sample(model.q_obs_cum)
@@ -61,12 +192,14 @@ def reportNashHydro(model, q_obs, tot_vol_disch_m3):
 def repNashOutConc(model, conc_outlet_obs, conc_ugL):
     # Nash computation consider normal and ln-transformed concentrations,
     # with the latter accounting for variance at low concentration ranges
-    model.out_conc_diff += ifthenelse(conc_outlet_obs >= 0, (conc_ugL - conc_outlet_obs) ** 2, 0)
-    model.out_conc_var += ifthenelse(conc_outlet_obs >= 0, (conc_ugL - model.conc_outlet_mean) ** 2, 0)
-    model.out_lnconc_diff += ifthenelse(conc_outlet_obs >= 0, (ln(conc_ugL) - ln(conc_outlet_obs)) ** 2, 0)
-    model.out_lnconc_var += ifthenelse(conc_outlet_obs >= 0, (ln(conc_ugL) - model.ln_conc_outlet_mean) ** 2, 0)
-    normal_term = model.out_conc_diff / model.out_conc_var
-    ln_term = model.out_lnconc_diff / model.out_lnconc_var
+    # The variance terms are of the simulation, not the observations (standard NSE):
+    # it can't be bounded during the run, no early termination on it (see module docstring)
+    model.out_conc_diff += ifObserved(conc_outlet_obs >= 0, (conc_ugL - conc_outlet_obs) ** 2)
+    model.out_conc_var += ifObserved(conc_outlet_obs >= 0, (conc_ugL - model.conc_outlet_mean) ** 2)
+    model.out_lnconc_diff += ifObserved(conc_outlet_obs >= 0, (lnValue(conc_ugL) - lnValue(conc_outlet_obs)) ** 2)
+    model.out_lnconc_var += ifObserved(conc_outlet_obs >= 0, (lnValue(conc_ugL) - model.ln_conc_outlet_mean) ** 2)
+    normal_term = divideValues(model.out_conc_diff, model.out_conc_var)
+    ln_term = divideValues(model.out_lnconc_diff, model.out_lnconc_var)
     nash_outlet_conc = 1 - 0.5 * (normal_term + ln_term)
     model.nash_outlet_conc_tss.sample(nash_outlet_conc)
 
@@ -74,9 +207,9 @@ def repNashOutConc(model, conc_outlet_obs, conc_ugL):
 def repNashOutIso(model, iso_outlet_obs, out_delta,
                   roff_delta, latflux_delta, drain_delta):
 
-    model.out_iso_diff += ifthenelse(iso_outlet_obs < 1e6, (out_delta - iso_outlet_obs) ** 2, 0)
-    model.out_iso_var += ifthenelse(iso_outlet_obs < 1e6, (out_delta - model.delta_outlet_mean) ** 2, 0)
-    nash_outlet_iso = 1 - (model.out_iso_diff / model.out_iso_var)
+    model.out_iso_diff += ifObserved(iso_outlet_obs < 1e6, (out_delta - iso_outlet_obs) ** 2)
+    model.out_iso_var += ifObserved(iso_outlet_obs < 1e6, (out_delta - model.delta_outlet_mean) ** 2)
+    nash_outlet_iso = 1 - divideValues(model.out_iso_diff, model.out_iso_var)
     model.nash_outlet_iso_tss.sample(nash_outlet_iso)
 
     model.resM_outISO_d13C_tss.sample(out_delta)
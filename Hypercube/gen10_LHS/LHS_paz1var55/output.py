@@ -1,77 +1,78 @@
 # -*- coding: utf-8 -*-
 from pcraster.framework import *
+from series import getSeriesOutput
 from copy import deepcopy
 
 
 # HYDRO
 def defineHydroTSS(model):
     # Rain
-    model.resW_accRain_m3_tss = TimeoutputTimeseries("resW_accRain_m3", model, nominal("outlet_v3"), noHeader=False)
+    model.resW_accRain_m3_tss = getSeriesOutput("resW_accRain_m3", model, nominal("outlet_v3"), noHeader=False)
     # Runoff
-    model.resW_accRunoff_m3_tss = TimeoutputTimeseries("resW_accRunoff_m3", model, nominal("outlet_v3"),
-                                                      noHeader=False)
+    model.resW_accRunoff_m3_tss = getSeriesOutput("resW_accRunoff_m3", model, nominal("outlet_v3"),
+                                                 noHeader=False)
     # z0 Percolation
-    model.resW_accDPz0_m3_tss = TimeoutputTimeseries("resW_accDPz0_m3", model, nominal("outlet_v3"),
-                                                      noHeader=False)
+    model.resW_accDPz0_m3_tss = getSeriesOutput("resW_accDPz0_m3", model, nominal("outlet_v3"),
+                                                 noHeader=False)
     # z1 Percolation
-    model.resW_accDPz1_m3_tss = TimeoutputTimeseries("resW_accDPz1_m3", model, nominal("outlet_v3"),
-                                                      noHeader=False)
+    model.resW_accDPz1_m3_tss = getSeriesOutput("resW_accDPz1_m3", model, nominal("outlet_v3"),
+                                                 noHeader=False)
 
-    model.tot_runoff_m3_tss = TimeoutputTimeseries("resW_totRunoff_m3", model, nominal("outlet_v3"), noHeader=False)
+    model.tot_runoff_m3_tss = getSeriesOutput("resW_totRunoff_m3", model, nominal("outlet_v3"), noHeader=False)
 
     # Percolation Basement
-    model.resW_accPercol_Bsmt_m3_tss = TimeoutputTimeseries("resW_accPercol_Bsmt_m3", model, nominal("outlet_v3"),
-                                                           noHeader=False)
+    model.resW_accPercol_Bsmt_m3_tss = getSeriesOutput("resW_accPercol_Bsmt_m3", model, nominal("outlet_v3"),
+                                                      noHeader=False)
     # Deep percolation Basement
-    model.tot_perc_z3_m3_tss = TimeoutputTimeseries("resW_totPercol_z3_m3", model, nominal("outlet_v3"),
-                                                   noHeader=False)
+    model.tot_perc_z3_m3_tss = getSeriesOutput("resW_totPercol_z3_m3", model, nominal("outlet_v3"),
+                                              noHeader=False)
     # ETP
-    model.resW_accEtp_m3_tss = TimeoutputTimeseries("resW_accEtp_m3", model, nominal("outlet_v3"), noHeader=False)
-    model.resW_accEvap_m3_tss = TimeoutputTimeseries("resW_accEvap_m3", model, nominal("outlet_v3"), noHeader=False)
-    model.resW_accTransp_m3_tss = TimeoutputTimeseries("resW_accTransp_m3", model, nominal("outlet_v3"),
-                                                      noHeader=False)
-    model.tot_etp_m3_tss = TimeoutputTimeseries("resW_totEtp_m3", model, nominal("outlet_v3"), noHeader=False)
+    model.resW_accEtp_m3_tss = getSeriesOutput("resW_accEtp_m3", model, nominal("outlet_v3"), noHeader=False)
+    model.resW_accEvap_m3_tss = getSeriesOutput("resW_accEvap_m3", model, nominal("outlet_v3"), noHeader=False)
+    model.resW_accTransp_m3_tss = getSeriesOutput("resW_accTransp_m3", model, nominal("outlet_v3"),
+                                                 noHeader=False)
+    model.tot_etp_m3_tss = getSeriesOutput("resW_totEtp_m3", model, nominal("outlet_v3"), noHeader=False)
     
     # Baseflow
-    model.out_baseflow_m3_tss = TimeoutputTimeseries("resW_accBaseflow_m3", model, nominal("outlet_v3"),
-                                                    noHeader=False)
+    model.out_baseflow_m3_tss = getSeriesOutput("resW_accBaseflow_m3", model, nominal("outlet_v3"),
+                                               noHeader=False)
     # model.tot_baseflow_m3_tss = TimeoutputTimeseries("resW_totBaseflow_m3", model, nominal("outlet_v3"),
     #                                                 noHeader=False)
     # LF Drainage
-    model.resW_accDrain_m3_tss = TimeoutputTimeseries("resW_accDrain_m3", model, nominal("outlet_v3"),
-                                                       noHeader=False)
-    model.resW_o_cumDrain_m3_tss = TimeoutputTimeseries("resW_o_cumDrain_m3", model, nominal("outlet_v3"),
-                                                      noHeader=False)  # Cumulative ADR
+    model.resW_accDrain_m3_tss = getSeriesOutput("resW_accDrain_m3", model, nominal("outlet_v3"),
+                                                  noHeader=False)
+    model.resW_o_cumDrain_m3_tss = getSeriesOutput("resW_o_cumDrain_m3", model, nominal("outlet_v3"),
+                                                 noHeader=False)  # Cumulative ADR
     # LF options
-    model.sat_accu_overflow_m3_tss = TimeoutputTimeseries("resW_of_accLatflow_m3", model, nominal("outlet_v3"),
-                                                         noHeader=False)
+    model.sat_accu_overflow_m3_tss = getSeriesOutput("resW_of_accLatflow_m3", model, nominal("outlet_v3"),
+                                                    noHeader=False)
     
-    model.tot_accu_of_latflow_m3_tss = TimeoutputTimeseries("resW_of_totLatflow_m3", model, nominal("outlet_v3"),
-                                                           noHeader=False)
+    model.tot_accu_of_latflow_m3_tss = getSeriesOutput("resW_of_totLatflow_m3", model, nominal("outlet_v3"),
+                                                      noHeader=False)
     # Inflow
-    model.out_cell_i_latflow_m3_tss = TimeoutputTimeseries("resW_i_cellLatflow_m3", model, nominal("outlet_v3"),
-                                                          noHeader=False)
-    model.out_accu_i_latflow_m3_tss = TimeoutputTimeseries("resW_i_accLatflow_m3", model, nominal("outlet_v3"),
-                                                          noHeader=False)
-    model.tot_accu_i_latflow_m3_tss = TimeoutputTimeseries("resW_i_totLatflow_m3", model, nominal("outlet_v3"),
-                                                          noHeader=False)
+    model.out_cell_i_latflow_m3_tss = getSeriesOutput("resW_i_cellLatflow_m3", model, nominal("outlet_v3"),
+                                                     noHeader=False)
+    model.out_accu_i_latflow_m3_tss = getSeriesOutput("resW_i_accLatflow_m3", model, nominal("outlet_v3"),
+                                                     noHeader=False)
+    model.tot_accu_i_latflow_m3_tss = getSeriesOutput("resW_i_totLatflow_m3", model, nominal("outlet_v3"),
+                                                     noHeader=False)
     # Outflow
-    model.resW_outLatflow_m3_tss = TimeoutputTimeseries("resW_outLatflow_m3", model, nominal("outlet_v3"),
-                                                          noHeader=False)  # Outlet LF
+    model.resW_outLatflow_m3_tss = getSeriesOutput("resW_outLatflow_m3", model, nominal("outlet_v3"),
+                                                     noHeader=False)  # Outlet LF
     # model.out_accu_o_latflow_m3_tss = TimeoutputTimeseries("resW_o_accLatflow_m3", model, nominal("outlet_v3"),
     #                                                       noHeader=False)
-    model.resW_o_cumLatflow_m3_tss = TimeoutputTimeseries("resW_o_cumLatflow_m3", model, nominal("outlet_v3"),
-                                                         noHeader=False)
+    model.resW_o_cumLatflow_m3_tss = getSeriesOutput("resW_o_cumLatflow_m3", model, nominal("outlet_v3"),
+                                                    noHeader=False)
     # model.out_accu_n_latflow_m3_tss = TimeoutputTimeseries("resW_n_accLatflow_m3", model, nominal("outlet_v3"),
     #                                                       noHeader=False)
     # model.tot_accu_n_latflow_m3_tss = TimeoutputTimeseries("resW_n_totLatflow_m3", model, nominal("outlet_v3"),
     #                                                       noHeader=False)
     
-    model.resW_accChStorage_m3_tss = TimeoutputTimeseries("resW_accChStorage_m3", model, nominal("outlet_v3"),
-                                                         noHeader=False)
-    model.global_mb_water_tss = TimeoutputTimeseries("resW_global_waterMB", model, nominal("outlet_v3"),
+    model.resW_accChStorage_m3_tss = getSeriesOutput("resW_accChStorage_m3", model, nominal("outlet_v3"),
                                                     noHeader=False)
-    model.storage_m3_tss = TimeoutputTimeseries("resW_accStorage_m3", model, nominal("outlet_v3"), noHeader=False)
+    model.global_mb_water_tss = getSeriesOutput("resW_global_waterMB", model, nominal("outlet_v3"),
+                                               noHeader=False)
+    model.storage_m3_tss = getSeriesOutput("resW_accStorage_m3", model, nominal("outlet_v3"), noHeader=False)
     
     # Basement layer analysis
     # model.resW_accBAL_z3_m3_tss = TimeoutputTimeseries("resW_accBAL_z3_m3", model, nominal("outlet_v3"),
@@ -83,133 +84,133 @@ def defineHydroTSS(model):
     # model.resW_accETP_z3_m3_tss = TimeoutputTimeseries("resW_accETP_z3_m3", model, nominal("outlet_v3"),
     #                                                   noHeader=False)
     
-    model.resW_accBAL_Bsmt_m3_tss = TimeoutputTimeseries("resW_accBAL_Bsmt_m3", model, nominal("outlet_v3"),
-                                                        noHeader=False)
-    model.resW_accInfil_Bsmt_m3_tss = TimeoutputTimeseries("resW_accInfil_Bsmt_m3", model, nominal("outlet_v3"),
-                                                          noHeader=False)
-    model.resW_accLF_Bsmt_m3_tss = TimeoutputTimeseries("resW_accLF_Bsmt_m3", model, nominal("outlet_v3"),
-                                                       noHeader=False)
-    model.resW_accETP_Bsmt_m3_tss = TimeoutputTimeseries("resW_accETP_Bsmt_m3", model, nominal("outlet_v3"),
-                                                        noHeader=False)
+    model.resW_accBAL_Bsmt_m3_tss = getSeriesOutput("resW_accBAL_Bsmt_m3", model, nominal("outlet_v3"),
+                                                   noHeader=False)
+    model.resW_accInfil_Bsmt_m3_tss = getSeriesOutput("resW_accInfil_Bsmt_m3", model, nominal("outlet_v3"),
+                                                     noHeader=False)
+    model.resW_accLF_Bsmt_m3_tss = getSeriesOutput("resW_accLF_Bsmt_m3", model, nominal("outlet_v3"),
+                                                  noHeader=False)
+    model.resW_accETP_Bsmt_m3_tss = getSeriesOutput("resW_accETP_Bsmt_m3", model, nominal("outlet_v3"),
+                                                   noHeader=False)
     
     # Storage
-    model.resW_accVOL_z0_m3_tss = TimeoutputTimeseries("resW_accVOL_z0_m3", model, nominal("outlet_v3"),
-                                                      noHeader=False)
-    model.resW_accVOL_z1_m3_tss = TimeoutputTimeseries("resW_accVOL_z1_m3", model, nominal("outlet_v3"),
-                                                      noHeader=False)
-    model.resW_accVOL_z2_m3_tss = TimeoutputTimeseries("resW_accVOL_z2_m3", model, nominal("outlet_v3"),
-                                                      noHeader=False)
-    model.resW_accVOL_z3_m3_tss = TimeoutputTimeseries("resW_accVOL_z3_m3", model, nominal("outlet_v3"),
-                                                      noHeader=False)
-    model.resW_accVOL_Bsmt_m3_tss = TimeoutputTimeseries("resW_accVOL_Bsmt_m3", model, nominal("outlet_v3"),
-                                                        noHeader=False)
+    model.resW_accVOL_z0_m3_tss = getSeriesOutput("resW_accVOL_z0_m3", model, nominal("outlet_v3"),
+                                                 noHeader=False)
+    model.resW_accVOL_z1_m3_tss = getSeriesOutput("resW_accVOL_z1_m3", model, nominal("outlet_v3"),
+                                                 noHeader=False)
+    model.resW_accVOL_z2_m3_tss = getSeriesOutput("resW_accVOL_z2_m3", model, nominal("outlet_v3"),
+                                                 noHeader=False)
+    model.resW_accVOL_z3_m3_tss = getSeriesOutput("resW_accVOL_z3_m3", model, nominal("outlet_v3"),
+                                                 noHeader=False)
+    model.resW_accVOL_Bsmt_m3_tss = getSeriesOutput("resW_accVOL_Bsmt_m3", model, nominal("outlet_v3"),
+                                                   noHeader=False)
 
     # Analysis
     # This is 'q' as time series.
-    model.i_Q_m3_tss = TimeoutputTimeseries("resW_i_accVol_m3", model, nominal("outlet_v3"), noHeader=False)
-    model.o_Q_m3_tss = TimeoutputTimeseries("resW_o_accVol_m3", model, nominal("outlet_v3"), noHeader=False)
-    model.resW_accQ_m3_tss = TimeoutputTimeseries("resW_accQ_m3", model, nominal("outlet_v3"), noHeader=False)
-    model.q_obs_cum_tss = TimeoutputTimeseries("resW_cum_q_obs_m3", model, nominal("outlet_v3"),
-                                              noHeader=False)  # Equivalent to net_Q
-    model.rain_obs_cum_tss = TimeoutputTimeseries("resW_cum_rain_obs_m3", model, nominal("outlet_v3"),
-                                                 noHeader=False)  # Equivalent to net_Q
-    model.rest_obs_tss = TimeoutputTimeseries("resW_q_restit_obs_m3", model, nominal("outlet_v3"),
-                                             noHeader=False)  # = rain/q_obs
-    model.q_sim_cum_tss = TimeoutputTimeseries("resW_cum_q_sim_m3", model, nominal("outlet_v3"),
-                                              noHeader=False)  # Sum sim discharge (if obs available).
-    model.q_sim_ave_tss = TimeoutputTimeseries("resW_q_sim_ave_m3", model, nominal("outlet_v3"),
-                                              noHeader=False)  # This is 'Nash_q' as time series.
+    model.i_Q_m3_tss = getSeriesOutput("resW_i_accVol_m3", model, nominal("outlet_v3"), noHeader=False)
+    model.o_Q_m3_tss = getSeriesOutput("resW_o_accVol_m3", model, nominal("outlet_v3"), noHeader=False)
+    model.resW_accQ_m3_tss = getSeriesOutput("resW_accQ_m3", model, nominal("outlet_v3"), noHeader=False)
+    model.q_obs_cum_tss = getSeriesOutput("resW_cum_q_obs_m3", model, nominal("outlet_v3"),
+                                         noHeader=False)  # Equivalent to net_Q
+    model.rain_obs_cum_tss = getSeriesOutput("resW_cum_rain_obs_m3", model, nominal("outlet_v3"),
+                                            noHeader=False)  # Equivalent to net_Q
+    model.rest_obs_tss = getSeriesOutput("resW_q_restit_obs_m3", model, nominal("outlet_v3"),
+                                        noHeader=False)  # = rain/q_obs
+    model.q_sim_cum_tss = getSeriesOutput("resW_cum_q_sim_m3", model, nominal("outlet_v3"),
+                                         noHeader=False)  # Sum sim discharge (if obs available).
+    model.q_sim_ave_tss = getSeriesOutput("resW_q_sim_ave_m3", model, nominal("outlet_v3"),
+                                         noHeader=False)  # This is 'Nash_q' as time series.
     
     
 def definePestTSS(model):
     # PESTI
     # Pesticide
-    model.global_mb_pest_tss = TimeoutputTimeseries("resM_global_mb_pest", model, nominal("outlet_v3"),
-                                                   noHeader=False)
-    model.resM_accAPP_g_tss = TimeoutputTimeseries("resM_accAPP", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accVOLATz0_tss = TimeoutputTimeseries("resM_accVOLATz0", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accVOLATz0nor_tss = TimeoutputTimeseries("resM_accVOLATz0nor", model, nominal("north_ave"), noHeader=False)
-    model.resM_accVOLATz0val_tss = TimeoutputTimeseries("resM_accVOLATz0val", model, nominal("valley_ave"), noHeader=False)
-    model.resM_accVOLATz0sou_tss = TimeoutputTimeseries("resM_accVOLATz0sou", model, nominal("south_ave"), noHeader=False)
-
-    model.resM_accROz0_tss = TimeoutputTimeseries("resM_accROz0", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accROz0nor_tss = TimeoutputTimeseries("resM_accROz0nor", model, nominal("north_ave"), noHeader=False)
-    model.resM_accROz0val_tss = TimeoutputTimeseries("resM_accROz0val", model, nominal("valley_ave"), noHeader=False)
-    model.resM_accROz0sou_tss = TimeoutputTimeseries("resM_accROz0sou", model, nominal("south_ave"), noHeader=False)
-
-    model.resM_accDEGz0_tss = TimeoutputTimeseries("resM_accDEGz0", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accDEGzX_tss = TimeoutputTimeseries("resM_accDEGzX", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accDEGz0nor_tss = TimeoutputTimeseries("resM_accDEGz0nor", model, nominal("north_ave"), noHeader=False)
-    model.resM_accDEGz0val_tss = TimeoutputTimeseries("resM_accDEGz0val", model, nominal("valley_ave"), noHeader=False)
-    model.resM_accDEGz0sou_tss = TimeoutputTimeseries("resM_accDEGz0sou", model, nominal("south_ave"), noHeader=False)
-
-
-    model.resM_accAGEDz0_tss = TimeoutputTimeseries("resM_accAGEDz0", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accAGEDzX_tss = TimeoutputTimeseries("resM_accAGEDzX", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accAGED_DEGz0_tss = TimeoutputTimeseries("resM_accAGED_DEGz0", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accAGED_DEGzX_tss = TimeoutputTimeseries("resM_accAGED_DEGzX", model, nominal("outlet_v3"), noHeader=False)
-
-    model.resM_accLCHz0_tss = TimeoutputTimeseries("resM_accLCHz0", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accLCHz0nor_tss = TimeoutputTimeseries("resM_accLCHz0nor", model, nominal("north_ave"), noHeader=False)
-    model.resM_accLCHz0val_tss = TimeoutputTimeseries("resM_accLCHz0val", model, nominal("valley_ave"), noHeader=False)
-    model.resM_accLCHz0sou_tss = TimeoutputTimeseries("resM_accLCHz0sou", model, nominal("south_ave"), noHeader=False)
-
-    model.resM_accLCHz1_tss = TimeoutputTimeseries("resM_accLCHz1", model, nominal("outlet_v3"), noHeader=False)
+    model.global_mb_pest_tss = getSeriesOutput("resM_global_mb_pest", model, nominal("outlet_v3"),
+                                              noHeader=False)
+    model.resM_accAPP_g_tss = getSeriesOutput("resM_accAPP", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accVOLATz0_tss = getSeriesOutput("resM_accVOLATz0", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accVOLATz0nor_tss = getSeriesOutput("resM_accVOLATz0nor", model, nominal("north_ave"), noHeader=False)
+    model.resM_accVOLATz0val_tss = getSeriesOutput("resM_accVOLATz0val", model, nominal("valley_ave"), noHeader=False)
+    model.resM_accVOLATz0sou_tss = getSeriesOutput("resM_accVOLATz0sou", model, nominal("south_ave"), noHeader=False)
+
+    model.resM_accROz0_tss = getSeriesOutput("resM_accROz0", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accROz0nor_tss = getSeriesOutput("resM_accROz0nor", model, nominal("north_ave"), noHeader=False)
+    model.resM_accROz0val_tss = getSeriesOutput("resM_accROz0val", model, nominal("valley_ave"), noHeader=False)
+    model.resM_accROz0sou_tss = getSeriesOutput("resM_accROz0sou", model, nominal("south_ave"), noHeader=False)
+
+    model.resM_accDEGz0_tss = getSeriesOutput("resM_accDEGz0", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accDEGzX_tss = getSeriesOutput("resM_accDEGzX", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accDEGz0nor_tss = getSeriesOutput("resM_accDEGz0nor", model, nominal("north_ave"), noHeader=False)
+    model.resM_accDEGz0val_tss = getSeriesOutput("resM_accDEGz0val", model, nominal("valley_ave"), noHeader=False)
+    model.resM_accDEGz0sou_tss = getSeriesOutput("resM_accDEGz0sou", model, nominal("south_ave"), noHeader=False)
+
+
+    model.resM_accAGEDz0_tss = getSeriesOutput("resM_accAGEDz0", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accAGEDzX_tss = getSeriesOutput("resM_accAGEDzX", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accAGED_DEGz0_tss = getSeriesOutput("resM_accAGED_DEGz0", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accAGED_DEGzX_tss = getSeriesOutput("resM_accAGED_DEGzX", model, nominal("outlet_v3"), noHeader=False)
+
+    model.resM_accLCHz0_tss = getSeriesOutput("resM_accLCHz0", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accLCHz0nor_tss = getSeriesOutput("resM_accLCHz0nor", model, nominal("north_ave"), noHeader=False)
+    model.resM_accLCHz0val_tss = getSeriesOutput("resM_accLCHz0val", model, nominal("valley_ave"), noHeader=False)
+    model.resM_accLCHz0sou_tss = getSeriesOutput("resM_accLCHz0sou", model, nominal("south_ave"), noHeader=False)
+
+    model.resM_accLCHz1_tss = getSeriesOutput("resM_accLCHz1", model, nominal("outlet_v3"), noHeader=False)
     
-    model.resM_accDP_tss = TimeoutputTimeseries("resM_accDP", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accADR_tss = TimeoutputTimeseries("resM_accADR", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accLF_tss = TimeoutputTimeseries("resM_accLF", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accBF_tss = TimeoutputTimeseries("resM_accBF", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accCHS_tss = TimeoutputTimeseries("resM_accCHS", model, nominal("outlet_v3"), noHeader=False)
-    model.resM_accCHS_AGED_tss = TimeoutputTimeseries("resM_accCHS_AGED", model, nominal("outlet_v3"),
-                                                       noHeader=False)
+    model.resM_accDP_tss = getSeriesOutput("resM_accDP", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accADR_tss = getSeriesOutput("resM_accADR", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accLF_tss = getSeriesOutput("resM_accLF", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accBF_tss = getSeriesOutput("resM_accBF", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accCHS_tss = getSeriesOutput("resM_accCHS", model, nominal("outlet_v3"), noHeader=False)
+    model.resM_accCHS_AGED_tss = getSeriesOutput("resM_accCHS_AGED", model, nominal("outlet_v3"),
+                                                  noHeader=False)
     
-    model.resM_EXP_light_g_tss = TimeoutputTimeseries("resM_EXP_light_g", model, nominal("outlet_v3"),
-                                                    noHeader=False)  # Total outlet mass (g) exports (light fraction only)
-    model.resM_EXP_heavy_g_tss = TimeoutputTimeseries("resM_EXP_heavy_g", model, nominal("outlet_v3"),
-                                                    noHeader=False)  # Total outlet mass (g) exports (heavy fraction only)
+    model.resM_EXP_light_g_tss = getSeriesOutput("resM_EXP_light_g", model, nominal("outlet_v3"),
+                                               noHeader=False)  # Total outlet mass (g) exports (light fraction only)
+    model.resM_EXP_heavy_g_tss = getSeriesOutput("resM_EXP_heavy_g", model, nominal("outlet_v3"),
+                                               noHeader=False)  # Total outlet mass (g) exports (heavy fraction only)
     # Concentrations outlet
-    model.resM_oCONC_ugL_tss = TimeoutputTimeseries("resM_oCONC_ugL", model, nominal("outlet_v3"),
-                                                   noHeader=False)  # Total outlet conc (ug/L)
-    model.resM_oCONC_ROFF_ugL_tss = TimeoutputTimeseries("resM_oCONC_ROFF_ugL", model, nominal("outlet_v3"),
-                                                        noHeader=False)  # Runoff outlet conc (ug/L)
-    model.resM_oCONC_LF_ugL_tss = TimeoutputTimeseries("resM_oCONC_LF_ugL", model, nominal("outlet_v3"),
-                                                      noHeader=False)  # Latflow outlet conc (ug/L)
+    model.resM_oCONC_ugL_tss = getSeriesOutput("resM_oCONC_ugL", model, nominal("outlet_v3"),
+                                              noHeader=False)  # Total outlet conc (ug/L)
+    model.resM_oCONC_ROFF_ugL_tss = getSeriesOutput("resM_oCONC_ROFF_ugL", model, nominal("outlet_v3"),
+                                                   noHeader=False)  # Runoff outlet conc (ug/L)
+    model.resM_oCONC_LF_ugL_tss = getSeriesOutput("resM_oCONC_LF_ugL", model, nominal("outlet_v3"),
+                                                 noHeader=False)  # Latflow outlet conc (ug/L)
     
-    model.resM_oCONC_ADR_ugL_tss = TimeoutputTimeseries("resM_oCONC_ADR_ugL", model, nominal("outlet_v3"),
-                                                       noHeader=False)  # Artificial drainage outlet conc (ug/L)
+    model.resM_oCONC_ADR_ugL_tss = getSeriesOutput("resM_oCONC_ADR_ugL", model, nominal("outlet_v3"),
+                                                  noHeader=False)  # Artificial drainage outlet conc (ug/L)
     # Isotopes outlet
-    model.resM_outISO_d13C_tss = TimeoutputTimeseries("resM_outISO_d13C", model, nominal("outlet_v3"),
-                                                     noHeader=False)  #
-    model.resM_outISO_ROFF_d13C_tss = TimeoutputTimeseries("resM_outISO_ROFF_d13C", model, nominal("outlet_v3"),
-                                                          noHeader=False)  # Runoff outlet
-    model.resM_outISO_LF_d13C_tss = TimeoutputTimeseries("resM_outISO_LF_d13C", model, nominal("outlet_v3"),
-                                                        noHeader=False)  # Latflow outlet
-    model.resM_outISO_ADR_d13C_tss = TimeoutputTimeseries("resM_outISO_ADR_d13C", model, nominal("outlet_v3"),
-                                                         noHeader=False)  # Artificial drainage outlet
+    model.resM_outISO_d13C_tss = getSeriesOutput("resM_outISO_d13C", model, nominal("outlet_v3"),
+                                                noHeader=False)  #
+    model.resM_outISO_ROFF_d13C_tss = getSeriesOutput("resM_outISO_ROFF_d13C", model, nominal("outlet_v3"),
+                                                     noHeader=False)  # Runoff outlet
+    model.resM_outISO_LF_d13C_tss = getSeriesOutput("resM_outISO_LF_d13C", model, nominal("outlet_v3"),
+                                                   noHeader=False)  # Latflow outlet
+    model.resM_outISO_ADR_d13C_tss = getSeriesOutput("resM_outISO_ADR_d13C", model, nominal("outlet_v3"),
+                                                    noHeader=False)  # Artificial drainage outlet
     
     # Cumulative Pesticide
-    model.cum_degZ0_g_tss = TimeoutputTimeseries("resM_cumDEGz0", model, nominal("outlet_v3"),
-                                                  noHeader=False)  # Deg z0
-    model.cum_deg_L_g_tss = TimeoutputTimeseries("resM_cumDEG_L", model, nominal("outlet_v3"),
-                                                noHeader=False)  # Deg z0
-    model.cum_aged_deg_L_g_tss = TimeoutputTimeseries("resM_cumAGE_DEG_L", model, nominal("outlet_v3"),
-                                                     noHeader=False)
-    model.resM_cumLCHz0_L_g_tss = TimeoutputTimeseries("resM_cumLCHz0_L", model, nominal("outlet_v3"),
-                                                      noHeader=False)  # Leaching z0
-    model.cum_roZ0_L_g_tss = TimeoutputTimeseries("resM_cumROz0_L", model, nominal("outlet_v3"),
-                                                 noHeader=False)  # Runoff
+    model.cum_degZ0_g_tss = getSeriesOutput("resM_cumDEGz0", model, nominal("outlet_v3"),
+                                             noHeader=False)  # Deg z0
+    model.cum_deg_L_g_tss = getSeriesOutput("resM_cumDEG_L", model, nominal("outlet_v3"),
+                                           noHeader=False)  # Deg z0
+    model.cum_aged_deg_L_g_tss = getSeriesOutput("resM_cumAGE_DEG_L", model, nominal("outlet_v3"),
+                                                noHeader=False)
+    model.resM_cumLCHz0_L_g_tss = getSeriesOutput("resM_cumLCHz0_L", model, nominal("outlet_v3"),
+                                                 noHeader=False)  # Leaching z0
+    model.cum_roZ0_L_g_tss = getSeriesOutput("resM_cumROz0_L", model, nominal("outlet_v3"),
+                                            noHeader=False)  # Runoff
     
-    model.cum_volatZ0_L_g_tss = TimeoutputTimeseries("resM_cumVOLATz0_L", model, nominal("outlet_v3"),
-                                                    noHeader=False)  # Runoff
+    model.cum_volatZ0_L_g_tss = getSeriesOutput("resM_cumVOLATz0_L", model, nominal("outlet_v3"),
+                                               noHeader=False)  # Runoff
     
-    model.cum_adr_L_g_tss = TimeoutputTimeseries("resM_cumADR_L", model, nominal("outlet_v3"),
-                                                noHeader=False)  # Art. drainage
-    model.cum_latflux_L_g_tss = TimeoutputTimeseries("resM_cumLF_L", model, nominal("outlet_v3"),
-                                                    noHeader=False)  # Soil column, outlet cells
+    model.cum_adr_L_g_tss = getSeriesOutput("resM_cumADR_L", model, nominal("outlet_v3"),
+                                           noHeader=False)  # Art. drainage
+    model.cum_latflux_L_g_tss = getSeriesOutput("resM_cumLF_L", model, nominal("outlet_v3"),
+                                               noHeader=False)  # Soil column, outlet cells
     
-    model.resM_cumEXP_Smet_g_tss = TimeoutputTimeseries("resM_cumEXP_Smet_g", model, nominal("outlet_v3"),
-                                                       noHeader=False)  # Total cum. outlet mass (g) exports
+    model.resM_cumEXP_Smet_g_tss = getSeriesOutput("resM_cumEXP_Smet_g", model, nominal("outlet_v3"),
+                                                  noHeader=False)  # Total cum. outlet mass (g) exports
 
     
 
@@ -279,29 +280,29 @@ def getCatchmentStorage(model):
 
 def defineAverageMoistTSS(model):
     # Theta average proportion to saturation
-    model.resW_z0_thetaPropSat = TimeoutputTimeseries("resW_z0_thetaPropSat", model, nominal("outlet_v3"),
-                                                     noHeader=False)
-
-    model.resW_z1_thetaPropSat = TimeoutputTimeseries("resW_z1_thetaPropSat", model, nominal("outlet_v3"),
-                                                     noHeader=False)
-    model.resW_z2_thetaPropSat = TimeoutputTimeseries("resW_z2_thetaPropSat", model, nominal("outlet_v3"),
-                                                     noHeader=False)
-    model.resW_z3_thetaPropSat = TimeoutputTimeseries("resW_z3_thetaPropSat", model, nominal("outlet_v3"),
-                                                     noHeader=False)
-    model.resW_Bsmt_thetaPropSat = TimeoutputTimeseries("resW_Bsmt_thetaPropSat", model, nominal("outlet_v3"),
-                                                       noHeader=False)
+    model.resW_z0_thetaPropSat = getSeriesOutput("resW_z0_thetaPropSat", model, nominal("outlet_v3"),
+                                                noHeader=False)
+
+    model.resW_z1_thetaPropSat = getSeriesOutput("resW_z1_thetaPropSat", model, nominal("outlet_v3"),
+                                                noHeader=False)
+    model.resW_z2_thetaPropSat = getSeriesOutput("resW_z2_thetaPropSat", model, nominal("outlet_v3"),
+                                                noHeader=False)
+    model.resW_z3_thetaPropSat = getSeriesOutput("resW_z3_thetaPropSat", model, nominal("outlet_v3"),
+                                                noHeader=False)
+    model.resW_Bsmt_thetaPropSat = getSeriesOutput("resW_Bsmt_thetaPropSat", model, nominal("outlet_v3"),
+                                                  noHeader=False)
 
 
 def defineTopSoilConditions(model):
     # Catchment Theta
-    model.resW_z0_theta = TimeoutputTimeseries("resW_z0_theta", model, nominal("outlet_v3"),
-                                                      noHeader=False)
-    model.resW_z1_theta = TimeoutputTimeseries("resW_z1_theta", model, nominal("outlet_v3"),
-                                                      noHeader=False)
-    model.resW_z2_theta = TimeoutputTimeseries("resW_z2_theta", model, nominal("outlet_v3"),
-                                                      noHeader=False)
-    model.resW_z3_theta = TimeoutputTimeseries("resW_z3_theta", model, nominal("outlet_v3"),
-                                                      noHeader=False)
+    model.resW_z0_theta = getSeriesOutput("resW_z0_theta", model, nominal("outlet_v3"),
+                                                 noHeader=False)
+    model.resW_z1_theta = getSeriesOutput("resW_z1_theta", model, nominal("outlet_v3"),
+                                                 noHeader=False)
+    model.resW_z2_theta = getSeriesOutput("resW_z2_theta", model, nominal("outlet_v3"),
+                                                 noHeader=False)
+    model.resW_z3_theta = getSeriesOutput("resW_z3_theta", model, nominal("outlet_v3"),
+                                                 noHeader=False)
 
     # model.resW_z0_theta_max = TimeoutputTimeseries("resW_z0_theta_max", model, nominal("outlet_v3"),
     #                                            noHeader=False)
@@ -311,30 +312,30 @@ def defineTopSoilConditions(model):
     #                                            noHeader=False)
 
     # Transect theta
-    model.resW_z0_theta_nor = TimeoutputTimeseries("resW_z0_theta_nor", model, nominal("north_ave"), noHeader=False)
-    model.resW_z0_theta_val = TimeoutputTimeseries("resW_z0_theta_val", model, nominal("valley_ave"), noHeader=False)
-    model.resW_z0_theta_sou = TimeoutputTimeseries("resW_z0_theta_sou", model, nominal("south_ave"), noHeader=False)
+    model.resW_z0_theta_nor = getSeriesOutput("resW_z0_theta_nor", model, nominal("north_ave"), noHeader=False)
+    model.resW_z0_theta_val = getSeriesOutput("resW_z0_theta_val", model, nominal("valley_ave"), noHeader=False)
+    model.resW_z0_theta_sou = getSeriesOutput("resW_z0_theta_sou", model, nominal("south_ave"), noHeader=False)
 
-    model.resW_z1_theta_nor = TimeoutputTimeseries("resW_z1_theta_nor", model, nominal("north_ave"), noHeader=False)
-    model.resW_z1_theta_val = TimeoutputTimeseries("resW_z1_theta_val", model, nominal("valley_ave"), noHeader=False)
-    model.resW_z1_theta_sou = TimeoutputTimeseries("resW_z1_theta_sou", model, nominal("south_ave"), noHeader=False)
+    model.resW_z1_theta_nor = getSeriesOutput("resW_z1_theta_nor", model, nominal("north_ave"), noHeader=False)
+    model.resW_z1_theta_val = getSeriesOutput("resW_z1_theta_val", model, nominal("valley_ave"), noHeader=False)
+    model.resW_z1_theta_sou = getSeriesOutput("resW_z1_theta_sou", model, nominal("south_ave"), noHeader=False)
 
-    model.resW_z2_theta_nor = TimeoutputTimeseries("resW_z2_theta_nor", model, nominal("north_ave"), noHeader=False)
-    model.resW_z2_theta_val = TimeoutputTimeseries("resW_z2_theta_val", model, nominal("valley_ave"), noHeader=False)
-    model.resW_z2_theta_sou = TimeoutputTimeseries("resW_z2_theta_sou", model, nominal("south_ave"), noHeader=False)
+    model.resW_z2_theta_nor = getSeriesOutput("resW_z2_theta_nor", model, nominal("north_ave"), noHeader=False)
+    model.resW_z2_theta_val = getSeriesOutput("resW_z2_theta_val", model, nominal("valley_ave"), noHeader=False)
+    model.resW_z2_theta_sou = getSeriesOutput("resW_z2_theta_sou", model, nominal("south_ave"), noHeader=False)
 
     # Temperature
-    model.resW_z0_temp = TimeoutputTimeseries("resW_z0_Temp", model, nominal("outlet_v3"),
-                                              noHeader=False)
+    model.resW_z0_temp = getSeriesOutput("resW_z0_Temp", model, nominal("outlet_v3"),
+                                         noHeader=False)
 
-    model.resW_z1_temp = TimeoutputTimeseries("resW_z1_Temp", model, nominal("outlet_v3"),
-                                              noHeader=False)
+    model.resW_z1_temp = getSeriesOutput("resW_z1_Temp", model, nominal("outlet_v3"),
+                                         noHeader=False)
 
-    model.resW_z2_temp = TimeoutputTimeseries("resW_z2_Temp", model, nominal("outlet_v3"),
-                                              noHeader=False)
+    model.resW_z2_temp = getSeriesOutput("resW_z2_Temp", model, nominal("outlet_v3"),
+                                         noHeader=False)
 
-    model.resW_z3_temp = TimeoutputTimeseries("resW_z3_Temp", model, nominal("outlet_v3"),
-                                              noHeader=False)
+    model.resW_z3_temp = getSeriesOutput("resW_z3_Temp", model, nominal("outlet_v3"),
+                                         noHeader=False)
 
     # model.resW_z0_temp_max = TimeoutputTimeseries("resW_z0_temp_max", model, nominal("outlet_v3"),
     #                                                noHeader=False)
@@ -343,52 +344,52 @@ def defineTopSoilConditions(model):
     # model.resW_z2_temp_max = TimeoutputTimeseries("resW_z2_temp_max", model, nominal("outlet_v3"),
     #                                                noHeader=False)
 
-    model.resW_z0_temp_nor = TimeoutputTimeseries("resW_z0_temp_nor", model, nominal("north_ave"), noHeader=False)
-    model.resW_z0_temp_val = TimeoutputTimeseries("resW_z0_temp_val", model, nominal("valley_ave"), noHeader=False)
-    model.resW_z0_temp_sou = TimeoutputTimeseries("resW_z0_temp_sou", model, nominal("south_ave"), noHeader=False)
+    model.resW_z0_temp_nor = getSeriesOutput("resW_z0_temp_nor", model, nominal("north_ave"), noHeader=False)
+    model.resW_z0_temp_val = getSeriesOutput("resW_z0_temp_val", model, nominal("valley_ave"), noHeader=False)
+    model.resW_z0_temp_sou = getSeriesOutput("resW_z0_temp_sou", model, nominal("south_ave"), noHeader=False)
 
-    model.resW_z1_temp_nor = TimeoutputTimeseries("resW_z1_temp_nor", model, nominal("north_ave"), noHeader=False)
-    model.resW_z1_temp_val = TimeoutputTimeseries("resW_z1_temp_val", model, nominal("valley_ave"), noHeader=False)
-    model.resW_z1_temp_sou = TimeoutputTimeseries("resW_z1_temp_sou", model, nominal("south_ave"), noHeader=False)
+    model.resW_z1_temp_nor = getSeriesOutput("resW_z1_temp_nor", model, nominal("north_ave"), noHeader=False)
+    model.resW_z1_temp_val = getSeriesOutput("resW_z1_temp_val", model, nominal("valley_ave"), noHeader=False)
+    model.resW_z1_temp_sou = getSeriesOutput("resW_z1_temp_sou", model, nominal("south_ave"), noHeader=False)
 
-    model.resW_z2_temp_nor = TimeoutputTimeseries("resW_z2_temp_nor", model, nominal("north_ave"), noHeader=False)
-    model.resW_z2_temp_val = TimeoutputTimeseries("resW_z2_temp_val", model, nominal("valley_ave"), noHeader=False)
-    model.resW_z2_temp_sou = TimeoutputTimeseries("resW_z2_temp_sou", model, nominal("south_ave"), noHeader=False)
+    model.resW_z2_temp_nor = getSeriesOutput("resW_z2_temp_nor", model, nominal("north_ave"), noHeader=False)
+    model.resW_z2_temp_val = getSeriesOutput("resW_z2_temp_val", model, nominal("valley_ave"), noHeader=False)
+    model.resW_z2_temp_sou = getSeriesOutput("resW_z2_temp_sou", model, nominal("south_ave"), noHeader=False)
 
     # DT50
-    model.resW_z0_DT50_min = TimeoutputTimeseries("resW_z0_DT50_min", model, nominal("outlet_v3"),
-                                              noHeader=False)
-    model.resW_z0_DT50_max = TimeoutputTimeseries("resW_z0_DT50_max", model, nominal("outlet_v3"),
-                                              noHeader=False)
-
-    model.resW_z0_DT50 = TimeoutputTimeseries("resW_z0_DT50", model, nominal("outlet_v3"),
-                                              noHeader=False)
-    model.resW_z1_DT50 = TimeoutputTimeseries("resW_z1_DT50", model, nominal("outlet_v3"),
-                                              noHeader=False)
-    model.resW_z2_DT50 = TimeoutputTimeseries("resW_z2_DT50", model, nominal("outlet_v3"),
-                                              noHeader=False)
-
-
-    model.resW_z0_DT50_nor = TimeoutputTimeseries("resW_z0_DT50_nor", model, nominal("north_ave"),
-                                              noHeader=False)
-    model.resW_z0_DT50_val = TimeoutputTimeseries("resW_z0_DT50_val", model, nominal("valley_ave"),
-                                                  noHeader=False)
-    model.resW_z0_DT50_sou = TimeoutputTimeseries("resW_z0_DT50_sou", model, nominal("south_ave"),
-                                                  noHeader=False)
-
-    model.resW_z1_DT50_nor = TimeoutputTimeseries("resW_z1_DT50_nor", model, nominal("north_ave"),
-                                                  noHeader=False)
-    model.resW_z1_DT50_val = TimeoutputTimeseries("resW_z1_DT50_val", model, nominal("valley_ave"),
-                                                  noHeader=False)
-    model.resW_z1_DT50_sou = TimeoutputTimeseries("resW_z1_DT50_sou", model, nominal("south_ave"),
-                                                  noHeader=False)
-
-    model.resW_z2_DT50_nor = TimeoutputTimeseries("resW_z2_DT50_nor", model, nominal("north_ave"),
-                                                  noHeader=False)
-    model.resW_z2_DT50_val = TimeoutputTimeseries("resW_z2_DT50_val", model, nominal("valley_ave"),
-                                                  noHeader=False)
-    model.resW_z2_DT50_sou = TimeoutputTimeseries("resW_z2_DT50_sou", model, nominal("south_ave"),
-                                                  noHeader=False)
+    model.resW_z0_DT50_min = getSeriesOutput("resW_z0_DT50_min", model, nominal("outlet_v3"),
+                                         noHeader=False)
+    model.resW_z0_DT50_max = getSeriesOutput("resW_z0_DT50_max", model, nominal("outlet_v3"),
+                                         noHeader=False)
+
+    model.resW_z0_DT50 = getSeriesOutput("resW_z0_DT50", model, nominal("outlet_v3"),
+                                         noHeader=False)
+    model.resW_z1_DT50 = getSeriesOutput("resW_z1_DT50", model, nominal("outlet_v3"),
+                                         noHeader=False)
+    model.resW_z2_DT50 = getSeriesOutput("resW_z2_DT50", model, nominal("outlet_v3"),
+                                         noHeader=False)
+
+
+    model.resW_z0_DT50_nor = getSeriesOutput("resW_z0_DT50_nor", model, nominal("north_ave"),
+                                         noHeader=False)
+    model.resW_z0_DT50_val = getSeriesOutput("resW_z0_DT50_val", model, nominal("valley_ave"),
+                                             noHeader=False)
+    model.resW_z0_DT50_sou = getSeriesOutput("resW_z0_DT50_sou", model, nominal("south_ave"),
+                                             noHeader=False)
+
+    model.resW_z1_DT50_nor = getSeriesOutput("resW_z1_DT50_nor", model, nominal("north_ave"),
+                                             noHeader=False)
+    model.resW_z1_DT50_val = getSeriesOutput("resW_z1_DT50_val", model, nominal("valley_ave"),
+                                             noHeader=False)
+    model.resW_z1_DT50_sou = getSeriesOutput("resW_z1_DT50_sou", model, nominal("south_ave"),
+                                             noHeader=False)
+
+    model.resW_z2_DT50_nor = getSeriesOutput("resW_z2_DT50_nor", model, nominal("north_ave"),
+                                             noHeader=False)
+    model.resW_z2_DT50_val = getSeriesOutput("resW_z2_DT50_val", model, nominal("valley_ave"),
+                                             noHeader=False)
+    model.resW_z2_DT50_sou = getSeriesOutput("resW_z2_DT50_sou", model, nominal("south_ave"),
+                                             noHeader=False)
 
 def getTopSoilConditions(model, layer = 0):
 
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 from pcraster.framework import *
+from series import getSeriesOutput, getSampleCells, sampleCells
+from zonal import zoneTotals, getZoneRows, getCellTotals, asCells
+import numpy as np
 
 """
 Nash Soil Concentrations
@@ -19,6 +22,11 @@ var_north = (conc_north - mean_north)**1, if conc_north > 0
 north_plot_codes = ['n1', 'n2', 'n3', 'n4', 'n5', 'n7', 'n8']  # no 'n6'!
 north_plots = len(north_plot_codes)
 
+# transect: (plots, sampling points of each plot, sampling points of the transect)
+transect_plots = {'north': (['n1', 'n2', 'n3', 'n4', 'n5', 'n7', 'n8'], [4, 6, 6, 4, 4, 5, 5], 30),
+                  'valley': (['v4', 'v5', 'v7', 'v8', 'v9', 'v10'], [4, 4, 5, 5, 5, 5], 25),
+                  'south': (['s11', 's12', 's13'], [8, 7, 5], 26)}
+
 
 def importPlotMaps(model):
     # Points model to sampling points (pixels) on a given plot
@@ -61,7 +69,7 @@ def defineMassTSS(model, mMap="outlet_v3"):
     ]
     for i in range(len(names)):
         tss_name = names[i]
-        model.catch_dict[tss_name] = TimeoutputTimeseries(names[i], model, nominal(mMap), noHeader=False)
+        model.catch_dict[tss_name] = getSeriesOutput(names[i], model, nominal(mMap), noHeader=False)
 
 
 def reportSoilMass(model, name, var):
@@ -86,19 +94,19 @@ def defineSoilTSS(model):
         transect_map = transect + '_ave'
 
         # Concentrations
-        model.soil_dict[transect_conc] = TimeoutputTimeseries("resM_" + transect_conc, model, ordinal(transect_map),
-                                                              noHeader=False)
-        model.soil_dict[transect_conc_real] = TimeoutputTimeseries("resM_" + transect_conc_real, model,
-                                                                   ordinal(transect_map), noHeader=False)
-        model.soil_dict[transect_conc_aged] = TimeoutputTimeseries("resM_" + transect_conc_aged, model,
-                                                                   ordinal(transect_map), noHeader=False)
+        model.soil_dict[transect_conc] = getSeriesOutput("resM_" + transect_conc, model, ordinal(transect_map),
+                                                         noHeader=False)
+        model.soil_dict[transect_conc_real] = getSeriesOutput("resM_" + transect_conc_real, model,
+                                                              ordinal(transect_map), noHeader=False)
+        model.soil_dict[transect_conc_aged] = getSeriesOutput("resM_" + transect_conc_aged, model,
+                                                              ordinal(transect_map), noHeader=False)
         # Isotopes
-        model.soil_dict[transect_delta] = TimeoutputTimeseries("resM_" + transect_delta, model, ordinal(transect_map),
-                                                               noHeader=False)
-        model.soil_dict[transect_delta_real] = TimeoutputTimeseries("resM_" + transect_delta_real, model,
-                                                                    ordinal(transect_map), noHeader=False)
-        model.soil_dict[transect_delta_aged] = TimeoutputTimeseries("resM_" + transect_delta_aged, model,
-                                                                    ordinal(transect_map), noHeader=False)
+        model.soil_dict[transect_delta] = getSeriesOutput("resM_" + transect_delta, model, ordinal(transect_map),
+                                                          noHeader=False)
+        model.soil_dict[transect_delta_real] = getSeriesOutput("resM_" + transect_delta_real, model,
+                                                               ordinal(transect_map), noHeader=False)
+        model.soil_dict[transect_delta_aged] = getSeriesOutput("resM_" + transect_delta_aged, model,
+                                                               ordinal(transect_map), noHeader=False)
     plots = ['n1', 'n2', 'n3', 'n4', 'n5', 'n7', 'n8',
              'v4', 'v5', 'v7', 'v8', 'v9', 'v10',
              's11', 's12', 's13']
@@ -115,19 +123,19 @@ def defineSoilTSS(model):
         plot_delta_aged = plot_name + 'd13C_aged'
 
         # Concentrations
-        model.soil_dict[plot_conc] = TimeoutputTimeseries("resM_" + plot_conc, model, ordinal(plot_map), noHeader=False)
-        model.soil_dict[plot_conc_real] = TimeoutputTimeseries("resM_" + plot_conc_real, model, ordinal(plot_map),
-                                                               noHeader=False)
-        model.soil_dict[plot_conc_aged] = TimeoutputTimeseries("resM_" + plot_conc_aged, model, ordinal(plot_map),
-                                                               noHeader=False)
+        model.soil_dict[plot_conc] = getSeriesOutput("resM_" + plot_conc, model, ordinal(plot_map), noHeader=False)
+        model.soil_dict[plot_conc_real] = getSeriesOutput("resM_" + plot_conc_real, model, ordinal(plot_map),
+                                                          noHeader=False)
+        model.soil_dict[plot_conc_aged] = getSeriesOutput("resM_" + plot_conc_aged, model, ordinal(plot_map),
+                                                          noHeader=False)
 
         # Delta
-        model.soil_dict[plot_delta] = TimeoutputTimeseries("resM_" + plot_delta, model, ordinal(plot_map),
+        model.soil_dict[plot_delta] = getSeriesOutput("resM_" + plot_delta, model, ordinal(plot_map),
+                                                      noHeader=False)
+        model.soil_dict[plot_delta_real] = getSeriesOutput("resM_" + plot_delta_real, model, ordinal(plot_map),
+                                                           noHeader=False)
+        model.soil_dict[plot_delta_aged] = getSeriesOutput("resM_" + plot_delta_aged, model, ordinal(plot_map),
                                                            noHeader=False)
-        model.soil_dict[plot_delta_real] = TimeoutputTimeseries("resM_" + plot_delta_real, model, ordinal(plot_map),
-                                                                noHeader=False)
-        model.soil_dict[plot_delta_aged] = TimeoutputTimeseries("resM_" + plot_delta_aged, model, ordinal(plot_map),
-                                                                noHeader=False)
         # Example:
         # model.soil_dict[n1_d13C] = TimeoutputTimeseries("resM_n1d13C", model, ordinal("n1_out"), noHeader=False)
 
@@ -212,8 +220,8 @@ def defineTransectSinkTSS(model, sink_name):
         transect_map = transect + '_ave'
 
         # Sinks (e.g. degradation or leaching or volat. )
-        model.sink_dict[transect_sink] = TimeoutputTimeseries("resM_" + transect_sink, model, ordinal(transect_map),
-                                                              noHeader=False)
+        model.sink_dict[transect_sink] = getSeriesOutput("resM_" + transect_sink, model, ordinal(transect_map),
+                                                         noHeader=False)
     # plots = ['n1', 'n2', 'n3', 'n4', 'n5', 'n7', 'n8',
     #          'v4', 'v5', 'v7', 'v8', 'v9', 'v10',
     #          's11', 's12', 's13']
@@ -254,3 +262,87 @@ def reportTransectSinkTSS(model, sink_name, sink, transect):
 
     model.sink_dict[transect_sink].sample(transect_ave_mass)
 
+
+def getZoneSamples(model, id_map, zone_map):
+    """
+    :return: sampling cells of the series with id_map and the zone of each cell in zone_map
+    """
+    try:
+        model.zone_samples
+    except AttributeError:
+        model.zone_samples = dict()
+    key = (id_map, zone_map)
+    if key not in model.zone_samples:
+        cells = getSampleCells(ordinal(id_map))
+        model.zone_samples[key] = (cells, getZoneRows(model, zone_map, cells))
+    return model.zone_samples[key]
+
+
+def atCells(arr, cells):
+    return np.where(cells >= 0, arr[np.where(cells >= 0, cells, 0)], np.nan)
+
+
+def reportZonalTSS(model, soil_masses=None, sinks=None):
+    """
+    Samples the series of reportSoilTSS() and reportTransectSinkTSS(), with the
+    zone totals of all variables computed in one pass (zonal.py).
+    :param soil_masses: {type: (cell_mass, cell_massXdelta)}, type as in reportSoilTSS()
+    :param sinks: {sink_name: sink map}, as in reportTransectSinkTSS()
+    """
+    if soil_masses is None:
+        soil_masses = dict()
+    if sinks is None:
+        sinks = dict()
+    types = sorted(soil_masses)
+    sink_names = sorted(sinks)
+
+    variables = []
+    for type in types:
+        variables.extend(soil_masses[type])
+    for sink_name in sink_names:
+        variables.append(sinks[sink_name])
+    if not variables:
+        return
+    totals = zoneTotals(model, variables)
+    shape = model.zones['shape']
+
+    if types:
+        # Mass -> ug/g soil at each cell
+        to_conc = 1e6 / (asCells(cellarea()) * asCells(model.smp_depth)) / (asCells(model.p_bAgr) * 1e03)
+
+    with np.errstate(divide='ignore', invalid='ignore'):  # Empty zones -> NaN, as areatotal() MV
+        for transect in ['north', 'valley', 'south']:
+            plots, plot_sampling_pts, transect_sampling_pts = transect_plots[transect]
+            cells, rows = getZoneSamples(model, transect + '_ave', transect + '_nom')
+
+            for i in range(len(types)):
+                if types[i] == 'bioavail':
+                    suffix = ''
+                elif types[i] == 'real':
+                    suffix = '_real'
+                else:
+                    suffix = '_aged'
+                mass_totals = totals[2 * i]
+                massXdelta_totals = totals[2 * i + 1]
+
+                # Record Transect
+                tot_mass = getCellTotals(mass_totals, rows)
+                ave_conc = tot_mass / transect_sampling_pts * atCells(to_conc, cells)
+                d13C = getCellTotals(massXdelta_totals, rows) / tot_mass
+                sampleCells(model.soil_dict[transect[0:3] + 'CONC' + suffix], cells, ave_conc, shape)
+                sampleCells(model.soil_dict[transect[0:3] + 'd13C' + suffix], cells, d13C, shape)
+
+                # Record detailed
+                for plot in range(len(plots)):
+                    plot_name = plots[plot]
+                    plot_cells, plot_rows = getZoneSamples(model, plot_name + '_out', plot_name + '_nom')
+                    tot_mass = getCellTotals(mass_totals, plot_rows)
+                    ave_conc = tot_mass / plot_sampling_pts[plot] * atCells(to_conc, plot_cells)
+                    d13C = getCellTotals(massXdelta_totals, plot_rows) / tot_mass
+                    sampleCells(model.soil_dict[plot_name + 'CONC' + suffix], plot_cells, ave_conc, shape)
+                    sampleCells(model.soil_dict[plot_name + 'd13C' + suffix], plot_cells, d13C, shape)
+
+            # Sinks per sample
+            for i in range(len(sink_names)):
+                ave_mass = getCellTotals(totals[2 * len(types) + i], rows) / transect_sampling_pts
+                sampleCells(model.sink_dict[transect[0:3] + sink_names[i]], cells, ave_mass, shape)
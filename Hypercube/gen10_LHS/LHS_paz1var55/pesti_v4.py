@@ -5,9 +5,15 @@ from pcraster.framework import *
 # import os
 # import time
 from copy import deepcopy
+from checks import checkState, cellMin
 
 
-def getConcAq(model, layer, mass, sorption_model="linear", gas=True):
+def getSorptionTerms(model, layer, sorption_model="linear", gas=True):
+    """
+    Terms of getConcAq() that only depend on the layer state (not on the mass),
+    i.e. shared by the light and heavy fractions.
+    :return: dictionary with the cell volume (L) and the partition denominator (-)
+    """
     # Note that p_b (g/cm3) x k_d (L/Kg) -> unit-less
     theta_layer = model.theta[layer]
     depth = model.layer_depth[layer]
@@ -16,8 +22,7 @@ def getConcAq(model, layer, mass, sorption_model="linear", gas=True):
     else:
         p_b = model.p_bZ
 
-    if mapminimum(model.theta[layer]) < scalar(0):
-        print("Moisture is " + float(mapminimum(model.theta[layer])) + " on layer: " + str(layer))
+    checkState(model, 'SORP', 'theta', model.theta[layer], layer)
 
     if sorption_model == "linear":
         # Retardation factor (dimensionless)
@@ -31,27 +36,24 @@ def getConcAq(model, layer, mass, sorption_model="linear", gas=True):
 
     if gas:  # Leistra et al., 2001
         theta_gas = max(model.theta_sat[layer] - theta_layer, scalar(0))
+        denom = theta_gas / model.k_h + max(theta_layer, scalar(1e-03)) * retard_layer  # mass/L cell volume
+    else:  # No gas phase
+        # Whelan, 1987
+        denom = max(theta_layer, scalar(1e-03)) * retard_layer
 
-        conc_aq = max(scalar(0), (mass / (cellarea() * depth)) /  # m2 * mm = L
-                      (theta_gas / model.k_h + max(theta_layer, scalar(1e-03)) * retard_layer))  # mass/L cell volume
-        # conc_aq = max(scalar(0), (mass / (cellarea() * depth)) /  # m2 * mm = L
-        #               (max(theta_layer, scalar(1e-03)) * retard_layer))  # mass/L cell volume
+    return {"volume": cellarea() * depth,  # m2 * mm = L
+            "denom": denom}
 
-        # conc_ads = model.k_d * conc_aq
-        # mass_aq = conc_aq * (theta_layer * depth * cellarea())
-        # if layer == 2:
-        #     model.report(conc_aq, "Caq2")
-        #     model.report(mass_aq, "Maq2")
-        #     model.report(mass, "Mtot2")
-        #     model.report(cellarea(), "cAr2")
-        #     model.report(depth, "depth2")
 
-    else:  # No gas phase
-        # Whelan, 1987
-        conc_aq = max(scalar(0), (mass / (cellarea() * depth)) / (max(theta_layer, scalar(1e-03)) * retard_layer))
-        # conc_ads = model.k_d * conc_aq
+def getConcFromTerms(terms, mass):
+    return max(scalar(0), (mass / terms["volume"]) / terms["denom"])
 
-    return conc_aq
+
+def getConcAq(model, layer, mass, sorption_model="linear", gas=True):
+    # conc_ads = model.k_d * conc_aq
+    # mass_aq = conc_aq * (theta_layer * depth * cellarea())
+    terms = getSorptionTerms(model, layer, sorption_model=sorption_model, gas=gas)
+    return getConcFromTerms(terms, mass)
 
 
 def getLightMass(model, mass, app_indx):
@@ -208,14 +210,9 @@ def getLeachedMass(model, layer, water_flux,
             #     model.report(cellarea(), "cAr")
             #     model.report(depth, "depth1")
 
-            test = mass - mass_aq
-            if mapminimum(test) < 0:
-                print("Error, mass < mass_aq, on layer: ", str(layer))
-                model.report(test, 'aMzErr' + str(layer))
-
-            if mapminimum(mass_aq) < 0:
-                print("Corrected error caught in getLeachedMass(), mass_aq < 0")
-                mass_aq = max(mass_aq, scalar(0))
+            checkState(model, 'LCH', 'mass - mass_aq', mass - mass_aq, layer)
+            checkState(model, 'LCH', 'mass_aq', mass_aq, layer)
+            mass_aq = max(mass_aq, scalar(0))
 
             if sorption_model == "linear":
                 # Retardation factor
@@ -228,9 +225,7 @@ def getLeachedMass(model, layer, water_flux,
                 if layer == 0:
                     mass_aq_new = mass_aq * exp(-water_flux / (theta_layer * retard_layer * depth))
                     mass_leached = mass_aq - mass_aq_new
-                    if mapminimum(mass_leached) < -1e-06:
-                        print("Error in Leached Model, layer: ", str(layer))
-                        model.report(mass_leached, 'aZ' + str(layer) + 'LCH')
+                    checkState(model, 'LCH', 'leached', mass_leached, layer, tol=1e-06)
                 else:
                     # mass_aq_new = mass_aq * exp(-water_flux / (theta_layer * retard_layer * depth))
                     # mass_leached = mass_aq - mass_aq_new
@@ -242,19 +237,14 @@ def getLeachedMass(model, layer, water_flux,
 
                     mass_aq = conc_aq * (theta_layer * depth * cellarea())
                     mass_aq_new = mass_aq - mass_leached
-                    if mapminimum(mass_aq_new) < -1e-06:
-                        print("Error in Leached Model, layer: ", str(layer))
-                        model.report(mass_leached, 'aZ' + str(layer) + 'LCH')
-                    if mapminimum(mass_aq_new) < 0:
-                        print("Err mass_aq_new")
+                    checkState(model, 'LCH', 'mass_aq_new', mass_aq_new, layer, tol=1e-06)
+                    if cellMin(mass_aq_new) < 0:
                         mass_leached = max(mass_leached, scalar(0))
-                        # mass_aq_new = mass_aq - mass_leached
             else:
                 mass_leached = conc_aq * water_flux * cellarea()
                 mass_aq = conc_aq * (theta_layer * depth) * cellarea()
                 mass_aq_new = mass_aq - mass_leached
-                if mapminimum(mass_aq_new) < 0:
-                    print("Error in Leached Model")
+                checkState(model, 'LCH', 'mass_aq_new', mass_aq_new, layer)
 
     return mass_leached
 
@@ -295,9 +285,8 @@ def getLatMassFlux(model, layer, mass, flux_map_mm,
             new_mass = mass - mass_loss + mass_gain
             # http://pcraster.geo.uu.nl/pcraster/4.1.0/doc/manual/op_upstream.html
 
-            if mapminimum(new_mass) < 0:
-                print("Corrected error caught in getLatMassFlux(), new_mass < 0")
-                new_mass = max(new_mass, scalar(0))
+            checkState(model, 'LF', 'new_mass', new_mass, layer)
+            new_mass = max(new_mass, scalar(0))
 
             if debug:
                 model.report(mass, 'aMi' + str(layer))
@@ -551,3 +540,362 @@ def getMassDegradation(model, layer, mass, old_aged_mass,
             # "aged_mass": aged_mass,
             "mass_aged_new": mass_aged_new,
             "mass_deg_aged": mass_deg_aged}
+
+
+"""
+Paired isotopologue API
+
+The light and heavy fractions are transported and degraded with the same layer state,
+only the mass differs (and alpha_iso for degradation of the heavy fraction).
+The functions below compute the shared terms (sorption, gas partition, transfer and
+decay factors) once and apply them to both masses. Each returns (light, heavy)
+with the same values as two calls of the single-fraction function.
+"""
+
+
+def getVolatileMassPair(model, temperature, light_mass, heavy_mass,
+                        rel_diff_model="option-2", sorption_model="linear",
+                        gas=True, run=True):
+    if not run:
+        return model.zero_map, model.zero_map
+
+    layer = 0
+    theta_gas = max(model.theta_sat[layer] - model.theta[layer], scalar(0))
+    depth_m = model.layer_depth[0] * 1 / 10 ** 3
+    thickness_a = scalar(1.0)  # m
+    diff_ar = 0.03609052694 * 86400.0 * 1.0 / 10 ** 4  # m2/d
+    diff_a = ((temperature + 273.15) / 293.15) ** 1.75 * diff_ar  # m2/d
+
+    if rel_diff_model == "option-2":
+        diff_relative_gas = max((diff_a * theta_gas ** 2 /
+                                 model.theta_sat[layer] ** (2 / 3)), scalar(1e10 - 6))  # m2/d
+    elif rel_diff_model == "option-1":
+        diff_relative_gas = max((diff_a * 2.5 * theta_gas ** 3), scalar(1e10 - 6))  # m2/d
+    else:
+        print("No appropriate relative diffusion parameter chosen")
+        diff_relative_gas = diff_a  # m2/d
+    r_a = thickness_a / diff_a  # d/m
+    r_s = max(scalar(0), (0.5 * depth_m) / diff_relative_gas)  # d/m
+    r_tot = r_a + r_s
+
+    terms = getSorptionTerms(model, layer, sorption_model=sorption_model, gas=gas)
+    volat = []
+    for mass in (light_mass, heavy_mass):
+        conc_aq = getConcFromTerms(terms, mass)
+        conc_aq *= 10 ** 3  # ug/L * 10^3 L/m3
+        conc_gas = conc_aq / model.k_h  # ug/L air
+        volat.append((conc_gas / r_tot) * cellarea())  # ug/day
+    return volat[0], volat[1]
+
+
+def getRunOffMassPair(model, precip, runoff_mm, light_mass, heavy_mass,
+                      transfer_model="simple-mt", sorption_model="linear",
+                      gas=True, debug=False, run=True):
+    if not run or debug:
+        return deepcopy(model.zero_map), deepcopy(model.zero_map)
+
+    layer = 0
+    terms = getSorptionTerms(model, layer, sorption_model=sorption_model, gas=gas)
+    if transfer_model == "nu-mlm-ro" or transfer_model == "nu-mlm":
+        mixing = exp(-model.beta_runoff * model.layer_depth[layer])
+    elif transfer_model == "d-mlm":
+        k_film = getKfilm(model, runoff_mm) * cellarea()
+    elif transfer_model != "simple-mt":
+        print("Run-off transfer model not stated")
+        return None
+
+    mass_ro = []
+    for mass in (light_mass, heavy_mass):
+        conc_aq = getConcFromTerms(terms, mass)
+        if transfer_model == "simple-mt":
+            mass_ro.append(conc_aq * runoff_mm * cellarea())
+        elif transfer_model == "nu-mlm-ro":
+            mass_ro.append(conc_aq * (runoff_mm * cellarea()) * mixing)
+        elif transfer_model == "nu-mlm":
+            mass_ro.append(ifthenelse(runoff_mm > scalar(0), conc_aq * (precip * cellarea()) * mixing, scalar(0)))
+        else:
+            mass_ro.append(k_film * conc_aq)
+    return mass_ro[0], mass_ro[1]
+
+
+def getLeachedMassPair(model, layer, water_flux, light_mass, heavy_mass,
+                       sorption_model=None,
+                       leach_model=None, gas=True, debug=False, run=True):
+    if not run or debug or mapminimum(model.theta[layer]) < scalar(1e-06):
+        return deepcopy(model.zero_map), deepcopy(model.zero_map)
+
+    theta_layer = model.theta[layer]
+    depth = model.layer_depth[layer]
+    if layer < 2:
+        p_b = model.p_bAgr
+    else:
+        p_b = model.p_bZ
+
+    terms = getSorptionTerms(model, layer, sorption_model=sorption_model, gas=gas)
+    water_volume = theta_layer * depth * cellarea()
+
+    if sorption_model == "linear":
+        retard_layer = scalar(1) + (p_b * model.k_d) / theta_layer
+    else:
+        print("No sorption assumed, Ret. factor = 2")
+        retard_layer = scalar(1)  # No retardation.
+
+    if leach_model == "mcgrath":
+        if layer == 0:
+            remaining = exp(-water_flux / (theta_layer * retard_layer * depth))
+        else:
+            # McGrath not used in lower layers, as formulation accounts for rainfall impact
+            max_flux = max(min(water_flux, (theta_layer - model.theta_fc[layer]) * depth), scalar(0))
+
+    mass_leached = []
+    for mass in (light_mass, heavy_mass):
+        conc_aq = getConcFromTerms(terms, mass)
+        mass_aq = conc_aq * water_volume
+
+        checkState(model, 'LCH', 'mass - mass_aq', mass - mass_aq, layer)
+        checkState(model, 'LCH', 'mass_aq', mass_aq, layer)
+        mass_aq = max(mass_aq, scalar(0))
+
+        if leach_model == "mcgrath":
+            if layer == 0:
+                leached = mass_aq - mass_aq * remaining
+                checkState(model, 'LCH', 'leached', leached, layer, tol=1e-06)
+            else:
+                leached = conc_aq * max_flux * cellarea()
+                mass_aq_new = conc_aq * water_volume - leached
+                checkState(model, 'LCH', 'mass_aq_new', mass_aq_new, layer, tol=1e-06)
+                if cellMin(mass_aq_new) < 0:
+                    leached = max(leached, scalar(0))
+        else:
+            leached = conc_aq * water_flux * cellarea()
+            checkState(model, 'LCH', 'mass_aq_new', conc_aq * water_volume - leached, layer)
+        mass_leached.append(leached)
+    return mass_leached[0], mass_leached[1]
+
+
+def getLatMassFluxPair(model, layer, light_mass, heavy_mass, flux_map_mm,
+                       sorption_model='linear', gas=True,
+                       debug=False, run=True):
+    """
+    :return: (light, heavy) dictionaries as getLatMassFlux()
+    """
+    if not run or mapminimum(model.theta[layer]) < scalar(1e-06) or layer == (model.num_layers - 1):
+        return tuple({'mass_loss': deepcopy(model.zero_map),
+                      'mass_gain': deepcopy(model.zero_map),
+                      'new_mass': deepcopy(mass)} for mass in (light_mass, heavy_mass))
+
+    terms = getSorptionTerms(model, layer, sorption_model=sorption_model, gas=gas)
+
+    latflux = []
+    for mass in (light_mass, heavy_mass):
+        mass_loss = getConcFromTerms(terms, mass) * flux_map_mm * cellarea()  # mm * m2 = L
+        mass_gain = upstream(model.ldd_subs, mass_loss)
+        new_mass = mass - mass_loss + mass_gain
+        checkState(model, 'LF', 'new_mass', new_mass, layer)
+        new_mass = max(new_mass, scalar(0))
+        if debug:
+            model.report(mass, 'aMi' + str(layer))
+            model.report(mass_loss, 'aMloss' + str(layer))
+            model.report(mass_gain, 'aMgain' + str(layer))
+        latflux.append({'mass_loss': mass_loss,
+                        'mass_gain': mass_gain,
+                        'new_mass': new_mass})
+    return latflux[0], latflux[1]
+
+
+def getLatMassFluxManfredaPair(model, layer, light_mass, heavy_mass, cell_outflow_mm, cell_inflow_mm,
+                               sorption_model='linear', gas=True,
+                               debug=False, run=True):
+    """
+    Pesticide transport with the Manfreda lateral flow (hydro_v3.getLateralFlow_Manfreda),
+    where a cell receives water from its whole upstream area, not only from its direct neighbours.
+    The inflow carries the mean concentration of the water leaving the upstream cells.
+    :return: (light, heavy) dictionaries as getLatMassFluxPair()
+    """
+    if not run or mapminimum(model.theta[layer]) < scalar(1e-06) or layer == (model.num_layers - 1):
+        return tuple({'mass_loss': deepcopy(model.zero_map),
+                      'mass_gain': deepcopy(model.zero_map),
+                      'new_mass': deepcopy(mass)} for mass in (light_mass, heavy_mass))
+
+    terms = getSorptionTerms(model, layer, sorption_model=sorption_model, gas=gas)
+    upstream_water = accuflux(model.ldd_subs, cell_outflow_mm * cellarea())  # L
+
+    latflux = []
+    for mass in (light_mass, heavy_mass):
+        mass_loss = getConcFromTerms(terms, mass) * cell_outflow_mm * cellarea()  # mm * m2 = L
+        conc_in = ifthenelse(upstream_water > scalar(0),
+                             accuflux(model.ldd_subs, mass_loss) / upstream_water, scalar(0))
+        mass_gain = conc_in * cell_inflow_mm * cellarea()
+        new_mass = mass - mass_loss + mass_gain
+        checkState(model, 'LF', 'new_mass', new_mass, layer)
+        new_mass = max(new_mass, scalar(0))
+        if debug:
+            model.report(mass, 'aMi' + str(layer))
+            model.report(mass_loss, 'aMloss' + str(layer))
+            model.report(mass_gain, 'aMgain' + str(layer))
+        latflux.append({'mass_loss': mass_loss,
+                        'mass_gain': mass_gain,
+                        'new_mass': new_mass})
+    return latflux[0], latflux[1]
+
+
+def getDrainMassFluxPair(model, layer, light_mass, heavy_mass,
+                         sorption_model='linear', gas=True,
+                         debug=False, run=True):
+    if not run:
+        return deepcopy(model.zero_map), deepcopy(model.zero_map)
+
+    terms = getSorptionTerms(model, layer, sorption_model=sorption_model, gas=gas)
+    cell_mm = max(model.c_adr * (model.layer_depth[layer] * model.theta[layer] -
+                                 model.layer_depth[layer] * model.theta_fc[layer]), scalar(0))
+    return (getConcFromTerms(terms, light_mass) * cellarea() * cell_mm,
+            getConcFromTerms(terms, heavy_mass) * cellarea() * cell_mm)
+
+
+def reportDT50(model, layer, dt_50):
+    dt50_ave = areaaverage(dt_50, model.is_catchment)
+    dt50_ave_nor = areaaverage(dt_50, model.is_north)
+    dt50_ave_val = areaaverage(dt_50, model.is_valley)
+    dt50_ave_sou = areaaverage(dt_50, model.is_south)
+    if layer == 0:
+        model.resW_z0_DT50_max.sample(areamaximum(dt_50, model.is_catchment))
+        model.resW_z0_DT50_min.sample(areaminimum(dt_50, model.is_catchment))
+        model.resW_z0_DT50.sample(dt50_ave)
+        model.resW_z0_DT50_nor.sample(dt50_ave_nor)
+        model.resW_z0_DT50_val.sample(dt50_ave_val)
+        model.resW_z0_DT50_sou.sample(dt50_ave_sou)
+    elif layer == 1:
+        model.resW_z1_DT50.sample(dt50_ave)
+        model.resW_z1_DT50_nor.sample(dt50_ave_nor)
+        model.resW_z1_DT50_val.sample(dt50_ave_val)
+        model.resW_z1_DT50_sou.sample(dt50_ave_sou)
+    elif layer == 2:
+        model.resW_z2_DT50.sample(dt50_ave)
+        model.resW_z2_DT50_nor.sample(dt50_ave_nor)
+        model.resW_z2_DT50_val.sample(dt50_ave_val)
+        model.resW_z2_DT50_sou.sample(dt50_ave_sou)
+
+
+def getDegradationRate(model, layer, fixed_dt50=True, deg_method=None):
+    """
+    :return: degradation constant k_b (1/day) of the dissolved phase, at the layer's theta & temperature
+    if not fixed_dt50
+    """
+    theta_wp = model.theta_wp[layer]
+    theta_layer = model.theta[layer]
+    k_b = ifthenelse(model.dt_50_ref == scalar(0), scalar(0),
+                     ln(2) / model.dt_50_ref)
+    if not fixed_dt50:
+        if deg_method == 'schroll':  # Schroll et al., 2006
+            theta_factor = ifthenelse(theta_layer <= 0.5 * theta_wp, scalar(0),
+                                      ifthenelse(theta_layer <= model.theta_100[layer],
+                                                 (((theta_layer - 0.5 * theta_wp) / (
+                                                     model.theta_100[layer] - theta_wp)) ** scalar(
+                                                     model.beta_moisture)),
+                                                 scalar(1)))
+        else:  # Walker, 1973, Macro
+            assert float(model.theta_ref) > 0
+            theta_factor = min(scalar(1.), (theta_layer / model.theta_ref) ** scalar(model.beta_moisture))
+
+        tk_ref = model.temp_ref + 273.15
+        tk_obs = model.temp_fin[layer] + 273.15
+        t_obs = model.temp_fin[layer]
+        temp_factor = ifthenelse(t_obs < scalar(0), scalar(0),
+                                 ifthenelse(t_obs <= scalar(5.),
+                                            (t_obs / scalar(5.)) * exp(
+                                                (model.act_e / (model.r_gas*tk_obs*tk_ref))*(tk_obs - tk_ref)),
+                                            exp((model.act_e / (model.r_gas*tk_obs*tk_ref))*(tk_obs - tk_ref))
+                                            )
+                                 )
+        k_b *= theta_factor * temp_factor
+    return k_b
+
+
+def getMassDegradationPair(model, layer, light_mass, heavy_mass, light_aged_old, heavy_aged_old,
+                           sor_deg_factor=1,
+                           sorption_model="linear", fixed_dt50=True, deg_method=None,
+                           bioavail=True, gas=True,
+                           debug=False, run=True):
+    """
+    :return: (light, heavy) dictionaries as getMassDegradation(frac="L") and (frac="H")
+    """
+    if not run:
+        return tuple({"mass_tot_new": deepcopy(mass),
+                      "mass_deg_aq": deepcopy(model.zero_map),
+                      "mass_deg_ads": deepcopy(model.zero_map)} for mass in (light_mass, heavy_mass))
+
+    theta_layer = model.theta[layer]
+    depth = model.layer_depth[layer]
+    if layer < 2:
+        p_b = model.p_bAgr
+    else:
+        p_b = model.p_bZ
+
+    # Shared by both fractions: partition, aging and degradation rates
+    terms = getSorptionTerms(model, layer, sorption_model=sorption_model, gas=gas)
+    water_volume = theta_layer * depth * cellarea()
+    soil_mass = p_b * depth * cellarea()  # pb = g/cm3
+    if bioavail:
+        k_aged = ln(2) / model.dt_50_aged
+        bioa_remaining = exp(-k_aged * scalar(model.jd_dt))
+    k_ab = max(ln(2) / model.dt_50_ab, scalar(0))
+    aged_remaining = exp(-k_ab * scalar(model.jd_dt))
+
+    k_b = getDegradationRate(model, layer, fixed_dt50=fixed_dt50, deg_method=deg_method)
+    k_bs = k_b * sor_deg_factor
+
+    reportDT50(model, layer, ifthenelse(k_b == scalar(0), 500, ln(2)/k_b))  # As frac == "L"
+
+    decay = {"L": (exp(-1 * k_b * scalar(model.jd_dt)),
+                   exp(-1 * k_bs * scalar(model.jd_dt))),
+             "H": (exp(-1 * model.alpha_iso * k_b * scalar(model.jd_dt)),
+                   exp(-1 * model.alpha_iso * k_bs * scalar(model.jd_dt)))}
+
+    result = []
+    for frac, mass, old_aged_mass in (("L", light_mass, light_aged_old), ("H", heavy_mass, heavy_aged_old)):
+        conc_aq = getConcFromTerms(terms, mass)
+        mass_aq = conc_aq * water_volume
+        mass_ads = (model.k_d * conc_aq) * soil_mass
+        mass_gas = max(mass - mass_aq - mass_ads, scalar(0))
+
+        if bioavail:
+            bioa_mass = mass_ads * bioa_remaining
+            aged_mass = mass_ads - bioa_mass
+        else:
+            bioa_mass = deepcopy(mass_ads)
+            aged_mass = deepcopy(model.zero_map)
+        total_aged = old_aged_mass + aged_mass
+        mass_aged_new = total_aged * aged_remaining
+
+        mass_aq_new = mass_aq * decay[frac][0]
+        mass_ads_new = bioa_mass * decay[frac][1]
+        result.append({"mass_tot_new": mass_aq_new + mass_ads_new + mass_gas,
+                       "mass_deg_aq": mass_aq - mass_aq_new,
+                       "mass_deg_ads": bioa_mass - mass_ads_new,
+                       "mass_aged_new": mass_aged_new,
+                       "mass_deg_aged": total_aged - mass_aged_new})
+    return result[0], result[1]
+
+
+def getBackgroundDecayPair(model, layer, light_mass, heavy_mass, light_aged_old, heavy_aged_old,
+                           fixed_dt50=True, deg_method=None):
+    """
+    Closed-form decay of a layer without active cells (activeset.py): the bio-available mass decays
+    at k_b (alpha_iso x k_b for the heavy fraction) as a whole, without phase partition nor aging,
+    the aged mass at k_ab.
+    :return: (light, heavy) dictionaries as getMassDegradationPair()
+    """
+    k_b = getDegradationRate(model, layer, fixed_dt50=fixed_dt50, deg_method=deg_method)
+    reportDT50(model, layer, ifthenelse(k_b == scalar(0), 500, ln(2)/k_b))
+    aged_remaining = exp(-max(ln(2) / model.dt_50_ab, scalar(0)) * scalar(model.jd_dt))
+
+    result = []
+    for mass, old_aged_mass, factor in ((light_mass, light_aged_old, 1), (heavy_mass, heavy_aged_old, model.alpha_iso)):
+        mass_new = mass * exp(-1 * factor * k_b * scalar(model.jd_dt))
+        mass_aged_new = old_aged_mass * aged_remaining
+        result.append({"mass_tot_new": mass_new,
+                       "mass_deg_aq": mass - mass_new,
+                       "mass_deg_ads": deepcopy(model.zero_map),
+                       "mass_aged_new": mass_aged_new,
+                       "mass_deg_aged": old_aged_mass - mass_aged_new})
+    return result[0], result[1]
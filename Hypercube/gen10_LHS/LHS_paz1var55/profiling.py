@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+from time import perf_counter
+import os
+
+"""
+Stage timing of BeachModel.dynamic()
+
+StageTimer.start() opens a time step, every lap(stage) adds the wall time since the previous
+lap to that stage. PCRaster operations run eagerly, so a lap holds the cost of the map algebra
+written before it. A lap is one perf_counter() call; with model.profile False nothing is timed.
+
+<sample>/timing.csv: seconds per stage (columns) and time step (rows)
+timing_samples.csv: seconds per stage (columns) and sample (rows), see mergeTiming()
+"""
+
+
+class StageTimer(object):
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = []  # Order of first appearance
+        self.rows = []  # (time step, {stage: seconds})
+        self.step = None
+        self.times = None
+        self.last = None
+
+    def start(self, step):
+        if not self.enabled:
+            return
+        self.step = step
+        self.times = dict()
+        self.last = perf_counter()
+
+    def lap(self, stage):
+        if not self.enabled or self.times is None:
+            return
+        now = perf_counter()
+        if stage not in self.times:
+            self.times[stage] = 0.
+            if stage not in self.stages:
+                self.stages.append(stage)
+        self.times[stage] += now - self.last
+        self.last = now
+
+    def stop(self, stage='other'):
+        """ Closes the time step, the time since the last lap goes to stage """
+        if not self.enabled or self.times is None:
+            return
+        self.lap(stage)
+        self.rows.append((self.step, self.times))
+        self.times = None
+
+
+def writeTiming(timer, path='timing.csv'):
+    """
+    Writes the steps timed so far and clears them (one file per sample).
+    """
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(path, 'w') as f:
+        f.write('step,' + ','.join(timer.stages) + ',total\n')
+        for step, times in timer.rows:
+            values = [times.get(stage, 0.) for stage in timer.stages]
+            f.write(str(step) + ',' + ','.join(repr(v) for v in values) + ',' + repr(sum(values)) + '\n')
+    timer.rows = []
+
+
+def readTiming(path='timing.csv'):
+    """
+    :return: stages, number of time steps, {stage: total seconds} of a timing.csv
+    """
+    with open(path, 'r') as f:
+        stages = f.readline().strip().split(',')[1:]
+        sums = dict((stage, 0.) for stage in stages)
+        steps = 0
+        for line in f:
+            values = line.strip().split(',')[1:]
+            for stage, v in zip(stages, values):
+                sums[stage] += float(v)
+            steps += 1
+    return stages, steps, sums
+
+
+def mergeTiming(samples, path='timing_samples.csv'):
+    """
+    Totals per stage of each sample's timing.csv, in one file.
+    """
+    stages = []
+    totals = []
+    for s in samples:
+        sample_path = os.path.join(str(s), 'timing.csv')
+        if not os.path.exists(sample_path):
+            continue
+        header, steps, sums = readTiming(sample_path)
+        for stage in header:
+            if stage not in stages:
+                stages.append(stage)
+        totals.append((s, steps, sums))
+    if not totals:
+        return
+
+    with open(path, 'w') as f:
+        f.write('sample,steps,' + ','.join(stages) + '\n')
+        for s, steps, sums in totals:
+            f.write(str(s) + ',' + str(steps) + ',' + ','.join(repr(sums.get(stage, 0.)) for stage in stages) + '\n')
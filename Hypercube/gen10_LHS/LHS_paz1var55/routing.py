@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+from pcraster import pcr2numpy, numpy2pcr, Scalar
+import numpy as np
+
+from zonal import zoneTotals, getZoneTotalMap, zoneValues, isValue
+
+"""
+ldd routing on numpy arrays
+
+The drainage network (ldd_subs) does not change during a run. buildRouting() derives, once,
+the receiver of every ldd cell and a topological order grouped in levels: a cell is in level k
+if its longest upstream path has k cells, so all cells of a level can be processed at once.
+The accumulation operators are then one sweep over the levels, from the sources to the pits:
+
+ - upstreamTotal: upstream(ldd, x)
+ - downstreamValue: downstream(ldd, x)
+ - accuFlux: accuflux(ldd, x)
+ - accuFractionFlux: accufractionflux / accufractionstate(ldd, x, fraction)
+ - accuCapacityFlux: accucapacityflux / accucapacitystate(ldd, x, capacity)
+
+Inputs are arrays of the clone shape, or stacks (..., rows, cols), e.g. the (samples, rows, cols)
+arrays of batch.py (or (..., cells) vectors with the routing of compact.py). Missing values (NaN) propagate downstream, as PCRaster MV.
+Sums are carried in float64, the results are float32.
+
+getOutletTotals() returns the outlet totals of several materials (a stack of K maps),
+i.e. areatotal(accuflux(ldd, x), outlet_multi) for each x. That expression only asks, for each
+zone of outlet_multi, for the sum of x over the cells draining through the zone, each cell
+counted once per zone cell on its downstream path (once, for outlets not nested in each other).
+buildOutletIndex() derives these counts once from the ldd, so the totals are a weighted sum
+of the contributing cells, without routing.
+Missing values: accuflux makes every cell downstream of a MV missing, so a zone with a missing
+contributor is missing (NaN) in the index totals, and in the float64 totals of all backends (scalars).
+For an outlet zone of one cell this is the PCRaster result; areatotal() of a zone of several cells
+skips its missing cells instead (outlet_check reports such differences).
+Zone 1 of out_multi_nom_v3 has 139 cells, so 'pcraster' stays the default backend until a run of
+'index' with outlet_check on the dataset has recorded no differences (<sample>/outlet_check.csv).
+"""
+
+# ldd direction (keypad) -> (row, col) offset of the receiver. 5 = pit
+ldd_offsets = {1: (1, -1), 2: (1, 0), 3: (1, 1),
+               4: (0, -1), 5: (0, 0), 6: (0, 1),
+               7: (-1, -1), 8: (-1, 0), 9: (-1, 1)}
+
+
+def buildRouting(ldd_map):
+    """
+    :param ldd_map: PCRaster ldd, or (rows, cols) array of ldd directions (0: missing value)
+    :return: dict with the ldd cells (flat indices), receiver of each cell (-1: pit or outflow
+    out of the network) and the levels (lists of cells) in topological order
+    """
+    if isinstance(ldd_map, np.ndarray):
+        ldd = ldd_map.astype(np.int64)
+    else:
+        ldd = pcr2numpy(ldd_map, 0).astype(np.int64)
+    shape = ldd.shape
+    flat = ldd.ravel()
+    cells = np.flatnonzero((flat >= 1) & (flat <= 9))
+    n = len(cells)
+    pos = np.full(flat.size, -1, dtype=np.int64)
+    pos[cells] = np.arange(n)
+
+    d_row = np.zeros(10, dtype=np.int64)
+    d_col = np.zeros(10, dtype=np.int64)
+    for direction, (dr, dc) in ldd_offsets.items():
+        d_row[direction] = dr
+        d_col[direction] = dc
+    row, col = np.divmod(cells, shape[1])
+    direction = flat[cells]
+    to_row = row + d_row[direction]
+    to_col = col + d_col[direction]
+    inside = (to_row >= 0) & (to_row < shape[0]) & (to_col >= 0) & (to_col < shape[1]) & (direction != 5)
+    receiver = np.full(n, -1, dtype=np.int64)
+    receiver[inside] = pos[to_row[inside] * shape[1] + to_col[inside]]
+
+    # Kahn's algorithm, one level at a time
+    in_degree = np.bincount(receiver[receiver >= 0], minlength=n)
+    levels = []
+    frontier = np.flatnonzero(in_degree == 0)
+    while len(frontier) > 0:
+        levels.append(frontier)
+        down = receiver[frontier]
+        down = down[down >= 0]
+        np.subtract.at(in_degree, down, 1)
+        down = np.unique(down)
+        frontier = down[in_degree[down] == 0]
+    if sum(len(level) for level in levels) != n:
+        raise ValueError("ldd is not a tree (cycles in the drainage network)")
+
+    return {'shape': shape, 'cells': cells, 'receiver': receiver, 'levels': levels,
+            'level_receivers': [receiver[level] for level in levels]}
+
+
+def getRouting(model):
+    """
+    Routing of model.ldd_subs, built on first use
+    """
+    try:
+        return model.routing
+    except AttributeError:
+        model.routing = buildRouting(model.ldd_subs)
+        return model.routing
+
+
+def getBatchShape(routing, *arrays):
+    shape = np.broadcast_shapes(*[np.shape(a) for a in arrays] + [routing['shape']])
+    return shape[:len(shape) - len(routing['shape'])]
+
+
+def compress(routing, arr, batch_shape):
+    """
+    :return: (batch, ldd cells) float64 array
+    """
+    arr = np.broadcast_to(np.asarray(arr, dtype=np.float64), batch_shape + routing['shape'])
+    return arr.reshape(-1, int(np.prod(routing['shape'])))[:, routing['cells']]
+
+
+def expand(routing, values, batch_shape):
+    """
+    :return: float32 array (batch_shape, rows, cols), NaN outside the ldd
+    """
+    out = np.full((values.shape[0], int(np.prod(routing['shape']))), np.nan, dtype=np.float32)
+    out[:, routing['cells']] = values
+    return out.reshape(batch_shape + routing['shape'])
+
+
+def upstreamTotal(routing, x):
+    """ upstream(ldd, x): sum of x of the cells that drain into each cell """
+    batch_shape = getBatchShape(routing, x)
+    values = compress(routing, x, batch_shape)
+    total = np.zeros_like(values)
+    has_receiver = routing['receiver'] >= 0
+    np.add.at(total, (slice(None), routing['receiver'][has_receiver]), values[:, has_receiver])
+    return expand(routing, total, batch_shape)
+
+
+def downstreamValue(routing, x):
+    """ downstream(ldd, x): x of the receiving cell, pits take their own value """
+    batch_shape = getBatchShape(routing, x)
+    values = compress(routing, x, batch_shape)
+    receiver = np.where(routing['receiver'] >= 0, routing['receiver'], np.arange(len(routing['cells'])))
+    return expand(routing, values[:, receiver], batch_shape)
+
+
+def accumulate(routing, material, rule, *params):
+    """
+    Sweep from the sources to the pits. At each cell total = material + inflow,
+    flux = rule(total, *params at the cell), state = total - flux; the flux goes to the receiver.
+    :return: (flux, state) float32 arrays
+    """
+    batch_shape = getBatchShape(routing, material, *params)
+    values = compress(routing, material, batch_shape)
+    params = [compress(routing, p, batch_shape) for p in params]
+    inflow = np.zeros_like(values)
+    flux = np.empty_like(values)
+    state = np.empty_like(values)
+    for level, receivers in zip(routing['levels'], routing['level_receivers']):
+        total = values[:, level] + inflow[:, level]
+        out = rule(total, *[p[:, level] for p in params])
+        flux[:, level] = out
+        state[:, level] = total - out
+        to_cell = receivers >= 0
+        np.add.at(inflow, (slice(None), receivers[to_cell]), out[:, to_cell])
+    return expand(routing, flux, batch_shape), expand(routing, state, batch_shape)
+
+
+def accuFlux(routing, material):
+    """ accuflux(ldd, material) """
+    return accumulate(routing, material, lambda total: total)[0]
+
+
+def accuFractionFlux(routing, material, fraction):
+    """ accufractionflux(ldd, material, fraction), accufractionstate(...) """
+    return accumulate(routing, material, lambda total, f: total * f, fraction)
+
+
+def accuCapacityFlux(routing, material, capacity):
+    """ accucapacityflux(ldd, material, capacity), accucapacitystate(...) """
+    return accumulate(routing, material, lambda total, cap: np.minimum(total, cap), capacity)
+
+
+def toArray(x):
+    if isinstance(x, np.ndarray):
+        return x
+    return pcr2numpy(spatial(scalar(x)), np.nan)
+
+
+def buildOutletIndex(routing, zone_map):
+    """
+    :param zone_map: outlet_multi, or (rows, cols) array of zone codes (NaN: no zone)
+    :return: dict with the zone codes, the zone map (flat codes), the contributing cells
+    (flat indices) and their weights (cells x zones): number of cells of each zone
+    on the downstream path of the cell, itself included
+    """
+    if isinstance(zone_map, np.ndarray):
+        codes = zone_map.astype(np.float64).ravel()
+    else:
+        codes = pcr2numpy(scalar(zone_map), np.nan).ravel()
+    zone_codes = np.unique(codes[np.isfinite(codes)])
+    cell_codes = codes[routing['cells']]
+    n = len(routing['cells'])
+
+    # Sweep from the pits to the sources: count = own + count of the receiver (row n = no receiver)
+    counts = np.zeros((n + 1, len(zone_codes)))
+    for level, receivers in zip(reversed(routing['levels']), reversed(routing['level_receivers'])):
+        counts[level] = (cell_codes[level, None] == zone_codes) + counts[np.where(receivers >= 0, receivers, n)]
+    counts = counts[:n]
+
+    contributes = np.any(counts > 0, axis=1)
+    return {'zone_codes': zone_codes, 'codes': codes, 'cells': routing['cells'][contributes],
+            'weights': counts[contributes]}
+
+
+def getOutletIndex(model):
+    """
+    Outlet index of model.ldd_subs & model.outlet_multi, built on first use
+    """
+    try:
+        return model.outlet_index
+    except AttributeError:
+        model.outlet_index = buildOutletIndex(getRouting(model), model.outlet_multi)
+        return model.outlet_index
+
+
+def outletIndexTotals(index, stack):
+    """
+    :param stack: (..., rows, cols) array of materials ((..., cells) for a compact index, compact.py)
+    :return: (..., zones) float64 totals, NaN for the zones with a missing contributor (as accuflux)
+    """
+    stack = np.asarray(stack)
+    values = stack.reshape(stack.shape[:stack.ndim - index.get('ndim', 2)] + (-1,))[..., index['cells']]
+    values = values.astype(np.float64)
+    missing = np.isnan(values)
+    totals = np.where(missing, 0.0, values) @ index['weights']
+    if missing.any():
+        totals[(missing @ (index['weights'] > 0)) > 0] = np.nan
+    return totals
+
+
+def setOutletMissing(model, totals, fluxes):
+    """
+    Float64 outlet totals (zonal.zoneValues skips missing values): NaN if the accuflux of
+    the material is missing on a cell of the outlet zone
+    :param fluxes: accumulated materials, maps or (rows, cols) arrays
+    """
+    outlet = getOutletIndex(model)['codes'] == 1
+    return [np.nan if np.isnan(toArray(flux).ravel()[outlet]).any() else total
+            for total, flux in zip(totals, fluxes)]
+
+
+def getOutletMap(index, totals):
+    """
+    :param totals: (zones,) totals of one material
+    :return: map with the total of its zone in every cell, as areatotal(x, outlet_multi)
+    """
+    cell_totals = np.full(index['codes'].shape, np.nan, dtype=np.float32)
+    for z in range(len(index['zone_codes'])):
+        cell_totals[index['codes'] == index['zone_codes'][z]] = totals[z]
+    return numpy2pcr(Scalar, cell_totals.reshape(clone().nrRows(), clone().nrCols()), np.nan)
+
+
+def getOutletZero(model, scalars=False):
+    """
+    Outlet totals of a zero material, computed once
+    """
+    if scalars:
+        return 0.
+    try:
+        return model.outlet_zero
+    except AttributeError:
+        model.outlet_zero = areatotal(accuflux(model.ldd_subs, model.zero_map), model.outlet_multi)
+        return model.outlet_zero
+
+
+def getOutletTotals(model, materials, scalars=False):
+    """
+    areatotal(accuflux(ldd_subs, x), outlet_multi) of each material, None = zero material (not routed).
+    model.outlet_backend:
+     - 'index': weighted sum over the outlet index (buildOutletIndex), no routing
+     - 'route': all materials in one traversal of the ldd (accuFlux of the stack) and one zonal pass
+     - 'pcraster': one accuflux & areatotal per material
+    With model.outlet_check the 'index' and 'route' totals are compared with the PCRaster ones.
+    :param scalars: float64 totals of the outlet zone (outlet_multi 1) instead of maps (zonal.zoneValue)
+    :return: list of maps, or of values
+    """
+    if any(x is None for x in materials):
+        routed = [x for x in materials if x is not None]
+        routed = iter(getOutletTotals(model, routed, scalars=scalars) if routed else [])
+        return [getOutletZero(model, scalars) if x is None else next(routed) for x in materials]
+
+    backend = getattr(model, 'outlet_backend', 'pcraster')
+    if backend == 'pcraster':
+        if scalars:
+            fluxes = [accuflux(model.ldd_subs, x) for x in materials]
+            return setOutletMissing(model, list(zoneValues(model, fluxes, 'outlet_multi')), fluxes)
+        return [areatotal(accuflux(model.ldd_subs, x), model.outlet_multi) for x in materials]
+
+    stack = np.stack(np.broadcast_arrays(*[toArray(x) for x in materials]))
+    if backend == 'index':
+        index = getOutletIndex(model)
+        totals = outletIndexTotals(index, stack)
+        if scalars:
+            outlets = list(totals[:, int(np.flatnonzero(index['zone_codes'] == 1)[0])])
+        else:
+            outlets = [getOutletMap(index, totals[k]) for k in range(len(materials))]
+    else:
+        with np.errstate(all='ignore'):
+            flux = accuFlux(getRouting(model), stack)
+        if scalars:
+            outlets = setOutletMissing(model, list(zoneValues(model, list(flux), 'outlet_multi')), list(flux))
+        else:
+            totals = zoneTotals(model, list(flux))
+            outlets = [getZoneTotalMap(model, totals[k], 'outlet_multi') for k in range(len(materials))]
+
+    if getattr(model, 'outlet_check', False):
+        checkOutletTotals(model, materials, outlets)
+    return outlets
+
+
+def checkOutletTotals(model, materials, outlet_maps, rtol=1e-4, atol=1e-6):
+    """
+    Verification mode: compares outlet totals with areatotal(accuflux(ldd_subs, x), outlet_multi).
+    One record per material is kept in model.outlet_diff (reportOutletDiff()):
+    (time step, backend, material, nr. of differing cells, max. abs. difference). Mismatches are printed.
+    :return: True if all materials match
+    """
+    if not hasattr(model, 'outlet_diff'):
+        model.outlet_diff = []
+    backend = getattr(model, 'outlet_backend', 'pcraster')
+    match = True
+    for k in range(len(materials)):
+        if isValue(outlet_maps[k]):
+            flux = accuflux(model.ldd_subs, materials[k])
+            expected = setOutletMissing(model, zoneValues(model, [flux], 'outlet_multi'), [flux])[0]
+            found = outlet_maps[k]
+        else:
+            expected = pcr2numpy(areatotal(accuflux(model.ldd_subs, materials[k]), model.outlet_multi), np.nan)
+            found = pcr2numpy(outlet_maps[k], np.nan)
+        same = np.isclose(found, expected, rtol=rtol, atol=atol, equal_nan=True)
+        n_diff = int(np.sum(~same))
+        diff = 0.
+        if n_diff > 0:
+            match = False
+            with np.errstate(invalid='ignore'):
+                diff = float(np.nanmax(np.abs(np.asarray(found, dtype=np.float64) - expected)))
+            print("Outlet totals differ from PCRaster, material " + str(k) +
+                  ", step " + str(model.currentTimeStep()) + ", max. diff: " + str(diff))
+        model.outlet_diff.append((model.currentTimeStep(), backend, k, n_diff, diff))
+    return match
+
+
+def reportOutletDiff(model, path='outlet_check.csv'):
+    """
+    Records of checkOutletTotals(). NaN in max_abs_diff: a total is missing in one result only
+    (e.g. a zone with a missing contributor, see module docstring)
+    """
+    with open(path, 'w') as f:
+        f.write('step,backend,material,cells_diff,max_abs_diff\n')
+        for step, backend, k, n_diff, diff in getattr(model, 'outlet_diff', []):
+            f.write(str(step) + ',' + backend + ',' + str(k) + ',' + str(n_diff) + ',' + repr(diff) + '\n')
@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+from pcraster import setclone, numpy2pcr, Nominal, Scalar
+import numpy as np
+import os
+import shutil
+import tempfile
+
+from routing import ldd_offsets, buildRouting, upstreamTotal, downstreamValue, accuFlux, accuFractionFlux, \
+    buildOutletIndex, outletIndexTotals
+from mlhs_v15 import get_problem, get_ordered_latin, ordered_pairs, hydro_names, get_hydro_groups, \
+    get_hydro_group_ids, get_nested_matrix
+from forcing import readTss
+from crops import readCropTable
+from series import writeTss, npzToTss, mergeSeries
+from zonal import buildZoneIndex, zoneTotals
+from nash import getBestReachable, updateObjectives
+import hydro_np
+
+"""
+Self-checks of the pieces that don't need the dataset
+
+No input maps and no model run: the routing runs on a hand-built 5 x 5 ldd (numpy array)
+and is compared with a brute-force walk down the ldd, cell by cell. Only checkZones() and
+checkHydroArrays() build PCRaster maps, on an in-memory clone of the same size (setclone).
+ - checkRouting(): upstreamTotal, downstreamValue, accuFlux, accuFractionFlux and the outlet index
+   (buildOutletIndex, outletIndexTotals), with and without a missing value in the material
+ - checkOrderedLatin(): get_ordered_latin() rows in the bounds, ordering constraints hold,
+   one point per stratum in each unconstrained column
+ - checkNestedMatrix(): get_nested_matrix() rows grouped by hydrology sub-vector (get_hydro_groups)
+ - checkReaders(): readTss (header, no header, missing values, gaps) and readCropTable
+ - checkSeries(): writeTss -> readTss, series.npz -> npzToTss and mergeSeries (series.py)
+ - checkZones(): zoneTotals against a sum over the cells of each zone, cells in several zones
+ - checkObjectives(): getBestReachable / updateObjectives against the NSE of the whole series
+ - checkHydroArrays(): compareResults records, anyCell / cellMaxima of a batch against each sample,
+   and the numba kernels against the numpy kernels (skipped if numba is not installed)
+Mismatches are printed; python selfcheck.py runs all checks.
+"""
+
+# Hand-built ldd: pit at (2, 2), (0, 4) drains out of the grid, (4, 0) is a missing value
+check_ldd = np.array([[3, 2, 2, 2, 9],
+                      [6, 3, 2, 1, 4],
+                      [6, 6, 5, 4, 4],
+                      [9, 9, 8, 7, 4],
+                      [0, 8, 8, 8, 7]])
+
+# Zone 1: the pit, zone 2: two cells on the same path (cells above (0, 3) are counted twice)
+check_zones = np.full(check_ldd.shape, np.nan)
+check_zones[2, 2] = 1
+check_zones[0, 3] = 2
+check_zones[1, 3] = 2
+
+
+def getReceiver(ldd, row, col):
+    """
+    :return: (row, col) of the receiving cell, None for pits, outflow out of the grid or into a missing value
+    """
+    if ldd[row, col] == 5:
+        return None
+    dr, dc = ldd_offsets[ldd[row, col]]
+    row, col = row + dr, col + dc
+    if not (0 <= row < ldd.shape[0] and 0 <= col < ldd.shape[1]) or ldd[row, col] == 0:
+        return None
+    return row, col
+
+
+def getPath(ldd, row, col):
+    """
+    :return: cells on the downstream path of (row, col), itself included
+    """
+    path = [(row, col)]
+    while getReceiver(ldd, *path[-1]) is not None:
+        path.append(getReceiver(ldd, *path[-1]))
+    return path
+
+
+def walkRouting(ldd, x, fraction):
+    """
+    Brute force: upstream, downstream, accuflux and accufractionflux of x, one cell at a time
+    """
+    cells = [(r, c) for r in range(ldd.shape[0]) for c in range(ldd.shape[1]) if ldd[r, c] != 0]
+    upstream = np.full(ldd.shape, np.nan)
+    downstream = np.full(ldd.shape, np.nan)
+    accu = np.full(ldd.shape, np.nan)
+    for cell in cells:
+        donors = [d for d in cells if getReceiver(ldd, *d) == cell]
+        upstream[cell] = sum(x[d] for d in donors)
+        receiver = getReceiver(ldd, *cell)
+        downstream[cell] = x[cell] if receiver is None else x[receiver]
+        accu[cell] = sum(x[d] for d in cells if cell in getPath(ldd, *d))
+
+    def fractionFlux(cell):
+        donors = [d for d in cells if getReceiver(ldd, *d) == cell]
+        return (x[cell] + sum(fractionFlux(d) for d in donors)) * fraction[cell]
+
+    frac = np.full(ldd.shape, np.nan)
+    for cell in cells:
+        frac[cell] = fractionFlux(cell)
+    return upstream, downstream, accu, frac
+
+
+class CheckModel(object):
+    """ Attributes read by the checked functions, in place of a BeachModel """
+    def __init__(self, **attributes):
+        self.step = 1
+        self.__dict__.update(attributes)
+
+    def currentTimeStep(self):
+        return self.step
+
+
+def compareArrays(name, found, expected, rtol=1e-5, atol=1e-6, check='Routing'):
+    if np.shape(found) == np.shape(expected) and \
+            np.allclose(found, expected, rtol=rtol, atol=atol, equal_nan=True):
+        return True
+    if np.shape(found) != np.shape(expected):
+        print(check + " check failed: " + name + ", shape " + str(np.shape(found)) + " != " + str(np.shape(expected)))
+        return False
+    with np.errstate(invalid='ignore'):
+        diff = np.nanmax(np.abs(np.asarray(found, dtype=np.float64) - expected))
+    print(check + " check failed: " + name + ", max. diff: " + str(diff))
+    return False
+
+
+def setCheckClone():
+    setclone(check_ldd.shape[0], check_ldd.shape[1], 1., 0., 0.)
+
+
+def checkRouting(seed=0):
+    """
+    :return: True if the array routing matches the brute-force walk on check_ldd
+    """
+    rng = np.random.default_rng(seed)
+    routing = buildRouting(check_ldd)
+    index = buildOutletIndex(routing, check_zones)
+    zone_cells = [np.argwhere(check_zones == code) for code in index['zone_codes']]
+
+    x = rng.random(check_ldd.shape)
+    x_missing = x.copy()
+    x_missing[1, 1] = np.nan  # Upstream of zone 1 only
+    fraction = rng.random(check_ldd.shape)
+
+    match = True
+    for label, material in [('', x), (' (missing value)', x_missing)]:
+        upstream, downstream, accu, frac = walkRouting(check_ldd, material, fraction)
+        mask = check_ldd != 0  # The routing is NaN outside the ldd
+        match &= compareArrays('upstreamTotal' + label,
+                               np.where(mask, upstreamTotal(routing, material), np.nan), upstream)
+        match &= compareArrays('downstreamValue' + label,
+                               np.where(mask, downstreamValue(routing, material), np.nan), downstream)
+        match &= compareArrays('accuFlux' + label, accuFlux(routing, material), accu)
+        match &= compareArrays('accuFractionFlux' + label, accuFractionFlux(routing, material, fraction)[0], frac)
+        outlet = [np.sum([accu[tuple(cell)] for cell in cells]) for cells in zone_cells]
+        match &= compareArrays('outletIndexTotals' + label, outletIndexTotals(index, material), outlet)
+
+    # Stack of materials (samples, rows, cols), as batch.py
+    stack = np.stack([x, 2 * x])
+    match &= compareArrays('accuFlux (stack)', accuFlux(routing, stack),
+                           np.stack([walkRouting(check_ldd, m, fraction)[2] for m in stack]))
+    return match
+
+
+def checkOrderedLatin(n=50, seed=0):
+    """
+    :return: True if get_ordered_latin() keeps the bounds, the ordering constraints and the strata
+    """
+    problem = get_problem()
+    names = problem['names']
+    bounds = np.asarray(problem['bounds'], dtype=float)
+    upper = np.asarray(problem.get('upper', np.ones(len(names))), dtype=float)
+    values = get_ordered_latin(problem, n, seed=seed)
+
+    match = True
+    if values.shape != (n, len(names)):
+        print("LHS check failed: shape " + str(values.shape))
+        return False
+    outside = (values < bounds[:, 0] - 1e-12) | (values > bounds[:, 1] + 1e-12)
+    if outside.any():
+        match = False
+        print("LHS check failed: values out of bounds, " + str([names[i] for i in np.flatnonzero(outside.any(0))]))
+    pairs = [pair for pair in ordered_pairs if pair[0] in names and pair[1] in names]
+    for name_a, name_b in pairs:
+        a = values[:, names.index(name_a)] * upper[names.index(name_a)]
+        b = values[:, names.index(name_b)] * upper[names.index(name_b)]
+        if np.any(a < b - 1e-12):
+            match = False
+            print("LHS check failed: " + name_a + " < " + name_b + " in " + str(int(np.sum(a < b - 1e-12))) + " rows")
+    constrained = set(name for pair in pairs for name in pair)
+    for i, name in enumerate(names):
+        if name in constrained or bounds[i, 1] <= bounds[i, 0]:
+            continue
+        strata = np.floor((values[:, i] - bounds[i, 0]) / (bounds[i, 1] - bounds[i, 0]) * n).astype(int)
+        if len(np.unique(np.clip(strata, 0, n - 1))) != n:
+            match = False
+            print("LHS check failed: " + name + " is not stratified")
+    return match
+
+
+def checkNestedMatrix(n_hydro=4, n_fate=5):
+    """
+    :return: True if each hydrology row of get_nested_matrix() is one group of n_fate rows
+    """
+    problem = get_problem()
+    names = problem['names']
+    bounds = np.asarray(problem['bounds'], dtype=float)
+    hydro_cols = [names.index(name) for name in hydro_names if name in names]
+    fate_cols = [i for i in range(len(names)) if names[i] not in hydro_names]
+
+    match = True
+    for design in ('cross', 'stratified'):
+        matrix = get_nested_matrix(problem, n_hydro, n_fate, design=design)
+        groups = get_hydro_groups(matrix, names)
+        expected = [list(range(h * n_fate, (h + 1) * n_fate)) for h in range(n_hydro)]
+        if matrix.shape != (n_hydro * n_fate, len(names)) or groups != expected:
+            print("Nested LHS check failed (" + design + "): groups " + str(groups))
+            match = False
+            continue
+        if np.any((matrix < bounds[:, 0] - 1e-12) | (matrix > bounds[:, 1] + 1e-12)):
+            print("Nested LHS check failed (" + design + "): values out of bounds")
+            match = False
+        if not np.array_equal(get_hydro_group_ids(matrix, names), np.repeat(np.arange(n_hydro), n_fate)):
+            print("Nested LHS check failed (" + design + "): group ids")
+            match = False
+        first = matrix[:n_fate][:, fate_cols]
+        if design == 'cross' and not all(np.array_equal(matrix[rows][:, fate_cols], first) for rows in groups):
+            print("Nested LHS check failed (cross): the fate rows differ between the groups")
+            match = False
+
+    # Given hydrology rows are kept as they are
+    hydro_values = get_ordered_latin(get_problem(), n_hydro, seed=1)[:, hydro_cols]
+    matrix = get_nested_matrix(problem, n_hydro, n_fate, hydro_values=hydro_values)
+    match &= compareArrays('get_nested_matrix (hydro_values)', matrix[::n_fate][:, hydro_cols], hydro_values,
+                           rtol=0, atol=0, check='Nested LHS')
+    return match
+
+
+def checkReaders():
+    """
+    :return: True if readTss and readCropTable return the values of hand-written files
+    """
+    folder = tempfile.mkdtemp()
+    values = np.array([[1., 2.5], [np.nan, 4.], [5., -1.]])
+    match = True
+    try:
+        for header in (True, False):
+            path = os.path.join(folder, 'check.tss')
+            writeTss(path, np.arange(3, 6), values, header=header)
+            first, found = readTss(path)
+            match &= first == 3
+            match &= compareArrays('readTss' + ('' if header else ' (no header)'), found, values,
+                                   rtol=0, atol=0, check='Reader')
+            if found.flags.writeable:
+                print("Reader check failed: readTss values are writeable")
+                match = False
+
+        path = os.path.join(folder, 'gap.tss')
+        with open(path, 'w') as f:
+            f.write('1 0.5\n2 0.5\n4 0.5\n')
+        try:
+            readTss(path)
+            print("Reader check failed: readTss accepts non-consecutive time steps")
+            match = False
+        except ValueError:
+            pass
+
+        # Codes in any order, columns in any order
+        path = os.path.join(folder, 'croptable.tbl')
+        with open(path, 'w') as f:
+            f.write('0 2 1\n')
+            f.write('7 70.2 70.1\n')
+            f.write('3 30.2 30.1\n')
+        table = readCropTable(path)
+        match &= compareArrays('readCropTable codes', table['codes'], [3., 7.], rtol=0, atol=0, check='Reader')
+        found = table['values'][:, [table['columns'][1], table['columns'][2]]]
+        match &= compareArrays('readCropTable values', found, [[30.1, 30.2], [70.1, 70.2]],
+                               rtol=0, atol=0, check='Reader')
+    finally:
+        shutil.rmtree(folder)
+    return bool(match)
+
+
+def checkSeries(steps=4, ids=3):
+    """
+    :return: True if the series survive series.npz -> .tss -> readTss and mergeSeries
+    """
+    rng = np.random.default_rng(0)
+    folder = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    samples = dict()
+    match = True
+    try:
+        os.chdir(folder)
+        for sample in (1, 3):  # Sample 2 without output
+            os.makedirs(str(sample))
+            samples[sample] = {'resA': rng.random((steps, ids)), 'resB': rng.random((steps, 1))}
+            samples[sample]['resA'][1, 2] = np.nan
+            np.savez_compressed(os.path.join(str(sample), 'series.npz'), _steps=np.arange(2, 2 + steps),
+                                **samples[sample])
+        for sample, arrays in samples.items():
+            npzToTss(os.path.join(str(sample), 'series.npz'))
+            for name, values in arrays.items():
+                first, found = readTss(os.path.join(str(sample), name + '.tss'))
+                match &= first == 2
+                match &= compareArrays('npzToTss ' + str(sample) + '/' + name, found, values,
+                                       rtol=0, atol=0, check='Series')
+
+        mergeSeries(range(1, 4))
+        with np.load('series_ensemble.npz') as data:
+            match &= compareArrays('mergeSeries _samples', data['_samples'], [1, 3], rtol=0, atol=0, check='Series')
+            match &= compareArrays('mergeSeries _steps', data['_steps'], np.arange(2, 2 + steps),
+                                   rtol=0, atol=0, check='Series')
+            for name in ('resA', 'resB'):
+                match &= compareArrays('mergeSeries ' + name, data[name],
+                                       np.stack([samples[1][name], samples[3][name]]), rtol=0, atol=0, check='Series')
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder)
+    return bool(match)
+
+
+def checkZones(seed=0):
+    """
+    :return: True if zoneTotals matches the sum over the cells of each zone
+    """
+    setCheckClone()
+    rng = np.random.default_rng(seed)
+    zone_arrays = {'check_zones': check_zones,
+                   'halves': np.where(np.arange(check_ldd.size).reshape(check_ldd.shape) < 12, 1., 2.)}
+    zone_arrays['halves'][4, 0] = np.nan
+    model = CheckModel()
+    buildZoneIndex(model, dict((name, numpy2pcr(Nominal, np.nan_to_num(arr, nan=-1).astype(np.int32), -1))
+                               for name, arr in zone_arrays.items()))
+
+    variables = [rng.random(check_ldd.shape), rng.random(check_ldd.shape)]
+    variables[1][2, 2] = np.nan  # Not counted, as areatotal()
+    totals = zoneTotals(model, variables)
+    expected = np.zeros_like(totals)
+    for (name, code), zone in model.zones['lookup'].items():
+        cells = zone_arrays[name] == code
+        for i, x in enumerate(variables):
+            expected[i, zone] = np.nansum(x[cells])
+    return compareArrays('zoneTotals', totals, expected, check='Zone')
+
+
+def checkObjectives(steps=30, bound=0.5, seed=0):
+    """
+    :return: True if the best reachable NSE ends at the NSE of the series and the abort is
+    the first step below the bound
+    """
+    rng = np.random.default_rng(seed)
+    obs = rng.random(steps) + 1.
+    obs[[3, 10]] = -1.  # No data
+    sim = obs + rng.normal(0., 0.4, steps)
+    observed = obs >= 0
+    mean = float(np.mean(obs[observed]))
+    sst = float(np.sum((obs[observed] - mean) ** 2))
+    model = CheckModel(aborted=None, forcing={'q_obs_m3day': {'first': 1, 'values': obs[:, None], 'cols': None}})
+    model.objectives = {'q': {'series': 'q_obs_m3day', 'cell': 0, 'bound': bound, 'best': 1.,
+                              'terms': [{'transform': None, 'sst': sst, 'sse': 0.}]}}
+
+    best = []
+    for step in range(1, steps + 1):
+        model.step = step
+        updateObjectives(model, {'q': sim[step - 1]})
+        best.append(model.objectives['q']['best'])
+
+    match = True
+    sse = np.cumsum(np.where(observed, (sim - obs) ** 2, 0.))
+    match &= compareArrays('getBestReachable', best, 1. - sse / sst, check='Objective')
+    below = np.flatnonzero(1. - sse / sst < bound)
+    aborted = int(below[0]) + 1 if len(below) else None
+    if model.aborted != aborted:
+        print("Objective check failed: aborted at " + str(model.aborted) + ", expected " + str(aborted))
+        match = False
+    if getBestReachable({'terms': [{'sst': 0., 'sse': 1.}]}) != 1.:
+        print("Objective check failed: a term without variance is not skipped")
+        match = False
+    return bool(match)
+
+
+def checkHydroArrays(seed=0):
+    """
+    :return: True if compareResults records the differing cells, the batch branch tests match the
+    samples and the numba kernels match the numpy kernels
+    """
+    setCheckClone()
+    rng = np.random.default_rng(seed)
+    match = True
+
+    # compareResults: one record per output, differing cells and max. difference
+    ref = rng.random(check_ldd.shape).astype(np.float32)
+    res = ref.copy()
+    res[1, 2] += np.float32(0.5)
+    model = CheckModel(step=7, hydro_diff=[])
+    hydro_np.compareResults(model, 'fn', {'a': numpy2pcr(Scalar, ref, np.nan), 'b': numpy2pcr(Scalar, ref, np.nan)},
+                            {'a': numpy2pcr(Scalar, res, np.nan), 'b': numpy2pcr(Scalar, ref, np.nan)})
+    found = [(step, name, n_diff) for step, name, n_diff, max_diff in model.hydro_diff]
+    if found != [(7, 'fn:a', 1), (7, 'fn:b', 0)] or abs(model.hydro_diff[0][3] - 0.5) > 1e-6:
+        print("Hydro check failed: compareResults records " + str(model.hydro_diff))
+        match = False
+
+    # anyCell / cellMaxima of a stack (samples, cells) against each sample
+    stack = rng.random((3, 12)).astype(np.float32)
+    stack[1, 4] = np.nan
+    batch = CheckModel(batched=True)
+    single = CheckModel()
+    for label, x in [('anyCell', stack > 0.9), ('cellMaxima', stack)]:
+        if label == 'anyCell':
+            found = hydro_np.anyCell(batch, x)
+            expected = [hydro_np.anyCell(single, row) for row in x]
+        else:
+            found = hydro_np.cellMaxima(batch, x, x.shape)
+            expected = [hydro_np.cellMaxima(single, row, row.shape) for row in x]
+        match &= compareArrays(label, found, np.reshape(expected, (-1, 1)), rtol=0, atol=0, check='Hydro')
+
+    # numba kernels: float32 scalars mixed with arrays of the full (2-D) and compact (1-D) cells
+    try:
+        import numba
+    except ImportError:
+        print("numba kernels: skipped, numba is not installed")
+        return bool(match)
+    numba_model = CheckModel(hydro_backend='numba')
+    numpy_model = CheckModel(hydro_backend='numpy')
+    for name in hydro_np.kernels:
+        kernel = hydro_np.getKernel(numpy_model, name)
+        n_args = kernel.__code__.co_argcount
+        for shape in (check_ldd.shape, (check_ldd.size,)):
+            args = [np.float32(rng.random() + 0.5) if i % 3 == 1 else
+                    (rng.random(shape) + 0.5).astype(np.float32) for i in range(n_args)]
+            with np.errstate(all='ignore'):
+                expected = kernel(*args)
+                found = hydro_np.getKernel(numba_model, name)(*args)
+            if not isinstance(expected, tuple):
+                expected, found = (expected,), (found,)
+            for i in range(len(expected)):
+                label = 'numba ' + name + ' ' + str(len(shape)) + '-D'
+                match &= compareArrays(label, found[i], expected[i], check='Hydro')
+                if np.asarray(found[i]).dtype != np.float32:
+                    print("Hydro check failed: " + label + " returns " + str(np.asarray(found[i]).dtype))
+                    match = False
+    return bool(match)
+
+
+if __name__ == "__main__":
+    results = {'routing': checkRouting(), 'ordered latin': checkOrderedLatin(), 'nested matrix': checkNestedMatrix(),
+               'readers': checkReaders(), 'series': checkSeries(), 'zones': checkZones(),
+               'objectives': checkObjectives(), 'hydro arrays': checkHydroArrays()}
+    for name, ok in results.items():
+        print(name + ": " + ('ok' if ok else 'FAILED'))
+    if not all(results.values()):
+        raise SystemExit(1)
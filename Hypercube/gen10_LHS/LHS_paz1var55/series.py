@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+from pcraster import pcr2numpy, numpy2pcr, Scalar
+import numpy as np
+import os
+
+from zonal import isValue
+
+"""
+Columnar time series output
+
+SeriesOutput has the interface of TimeoutputTimeseries (constructor and sample()), but keeps
+the values in memory: one (time steps x ids) array per series. At the last time step all
+series of the sample are flushed into a single <sample>/series.npz, keyed by the series name
+(the .tss file name without extension); '_steps' holds the time steps of the rows.
+Column j is id j + 1 of the id map, the value is taken at the first cell (row-wise) of the id,
+as TimeoutputTimeseries does. NaN = missing value.
+sample() also takes a value (catchment & outlet totals, zonal.zoneValue), recorded at every id
+without a map; TssOutput does the same for the 'tss' backend.
+
+The buffers are also written (not cleared) at each checkpoint of the run (checkpoint.py), so a
+crash loses at most the steps since the last checkpoint. A resumed run reads them back
+(loadPriorSeries) and its series.npz holds the steps before the restart as well.
+
+npzToTss() writes the .tss files back for tools that read them,
+mergeSeries() stacks the samples in one file (samples x time steps x ids).
+"""
+
+tss_mv = '1e31'
+
+
+def getSampleCells(idMap):
+    """
+    :return: flat index of the first cell of ids 1..max of the id map (-1: id without cells)
+    """
+    if isinstance(idMap, str):
+        idMap = readmap(idMap)
+    ids = pcr2numpy(cover(ordinal(idMap), 0), 0).ravel()
+    addresses = np.full(max(int(ids.max()), 0), -1, dtype=np.int64)
+    for cell_id in range(1, len(addresses) + 1):
+        cells = np.flatnonzero(ids == cell_id)
+        if len(cells) > 0:
+            addresses[cell_id - 1] = cells[0]
+    return addresses
+
+
+def getSeriesOutput(tssFilename, model, idMap=None, noHeader=False):
+    """
+    :return: TssOutput, or SeriesOutput if model.series_backend == 'npz'
+    """
+    if getattr(model, 'series_backend', 'tss') == 'npz':
+        return SeriesOutput(tssFilename, model, idMap, noHeader=noHeader)
+    return TssOutput(tssFilename, model, idMap, noHeader=noHeader)
+
+
+def getValueMap(value):
+    """
+    :return: map holding the value in every cell (NaN -> missing value)
+    """
+    return numpy2pcr(Scalar, np.full((clone().nrRows(), clone().nrCols()), value, dtype=np.float32), np.nan)
+
+
+class TssOutput(TimeoutputTimeseries):
+    """
+    TimeoutputTimeseries that also samples values, as a map holding the value
+    """
+    def sample(self, expression):
+        if isValue(expression):
+            expression = getValueMap(float(expression))
+        TimeoutputTimeseries.sample(self, expression)
+
+
+class SeriesOutput(object):
+    def __init__(self, tssFilename, model, idMap=None, noHeader=False):
+        self.name = os.path.splitext(tssFilename)[0]
+        self.model = model
+        self.noHeader = noHeader
+        self.values = None
+
+        self.addresses = None  # None -> one column, maximum of the map
+        if idMap is not None:
+            self.addresses = getSampleCells(idMap)
+
+        try:
+            model.series_outputs
+        except AttributeError:
+            model.series_outputs = dict()
+        model.series_outputs[self.name] = self
+
+    def sample(self, expression):
+        if isValue(expression):
+            value = float(expression)
+            self.sampleRow([value] if self.addresses is None else np.where(self.addresses >= 0, value, np.nan))
+            return
+        cells = pcr2numpy(spatial(scalar(expression)), np.nan).ravel()
+        if self.addresses is None:
+            self.sampleRow([np.nanmax(cells) if np.any(np.isfinite(cells)) else np.nan])
+        else:
+            found = self.addresses >= 0
+            self.sampleRow(np.where(found, cells[np.where(found, self.addresses, 0)], np.nan))
+
+    def sampleRow(self, values):
+        """
+        :param values: value of each column (id), computed without a map
+        """
+        first = self.model.firstTimeStep()
+        if self.values is None:
+            cols = 1 if self.addresses is None else len(self.addresses)
+            self.values = np.full((self.model.nrTimeSteps() - first + 1, cols), np.nan)
+        self.values[self.model.currentTimeStep() - first] = values
+
+
+def sampleCells(output, cells, values, shape):
+    """
+    Samples values known at the sampling cells of the output (getSampleCells of its id map).
+    A TimeoutputTimeseries gets a map holding the values at those cells.
+    """
+    if isinstance(output, SeriesOutput):
+        output.sampleRow(values)
+        return
+    found = cells >= 0
+    cell_values = np.full(shape, np.nan, dtype=np.float32).ravel()
+    cell_values[cells[found]] = np.asarray(values)[found]
+    output.sample(numpy2pcr(Scalar, cell_values.reshape(shape), np.nan))
+
+
+def flushSeries(model, path=None, clear=True):
+    """
+    Writes the buffered series of the current sample, after the rows of loadPriorSeries().
+    :param path: default <sample>/series.npz
+    :param clear: False at a checkpoint, the buffers are kept (rows of later steps are NaN)
+    """
+    outputs = getattr(model, 'series_outputs', dict())
+    arrays = dict()
+    for name, output in outputs.items():
+        if output.values is not None:
+            arrays[name] = output.values
+            if clear:
+                output.values = None
+    if not arrays:
+        return
+    if path is None:
+        path = os.path.join(str(model.currentSampleNumber()), 'series.npz')
+    first = model.firstTimeStep()
+    arrays['_steps'] = np.arange(first, first + len(list(arrays.values())[0]))
+
+    prior = getattr(model, 'series_prior', None)
+    if prior is not None:
+        rows = len(prior['_steps'])
+        for name in arrays:
+            before = prior.get(name, np.full((rows,) + arrays[name].shape[1:], np.nan))
+            arrays[name] = np.concatenate([before, arrays[name]])
+    np.savez_compressed(path, **arrays)
+
+
+def loadPriorSeries(model, path):
+    """
+    Resume: keeps the rows of a series.npz (written at the checkpoint) before the first time step
+    of the run, flushSeries() writes them ahead of the new rows
+    :param path: series.npz of the sample, next to its checkpoints
+    """
+    model.series_prior = None
+    if not os.path.exists(path):
+        return
+    with np.load(path) as data:
+        keep = data['_steps'] < model.firstTimeStep()
+        model.series_prior = dict((name, data[name][keep]) for name in data.files)
+
+
+def writeTss(path, steps, values, header=True):
+    with open(path, 'w') as f:
+        if header:
+            f.write('timeseries scalar\n')
+            f.write(str(values.shape[1] + 1) + '\n')
+            f.write('timestep\n')
+            for col in range(values.shape[1]):
+                f.write(str(col + 1) + '\n')
+        for row in range(len(steps)):
+            cells = [tss_mv if np.isnan(v) else repr(float(v)) for v in values[row]]
+            f.write(str(int(steps[row])) + ' ' + ' '.join(cells) + '\n')
+
+
+def npzToTss(path, out_dir=None, names=None, header=True):
+    """
+    :param path: series.npz of a sample
+    :param out_dir: folder of the .tss files (default: folder of path)
+    :param names: series to convert (default: all)
+    """
+    if out_dir is None:
+        out_dir = os.path.dirname(path)
+    with np.load(path) as data:
+        steps = data['_steps']
+        for name in data.files:
+            if name == '_steps' or (names is not None and name not in names):
+                continue
+            writeTss(os.path.join(out_dir, name + '.tss'), steps, data[name], header=header)
+
+
+def mergeSeries(samples, path='series_ensemble.npz'):
+    """
+    One file for the whole ensemble: series name -> (samples x time steps x ids).
+    Samples without output are skipped, '_samples' holds the sample numbers.
+    """
+    found = [s for s in samples if os.path.exists(os.path.join(str(s), 'series.npz'))]
+    if not found:
+        return
+    stacked = dict()
+    for s in found:
+        with np.load(os.path.join(str(s), 'series.npz')) as data:
+            for name in data.files:
+                stacked.setdefault(name, []).append(data[name])
+    arrays = dict((name, np.stack(values)) for name, values in stacked.items() if name != '_steps')
+    arrays['_steps'] = stacked['_steps'][0]
+    arrays['_samples'] = np.array(found)
+    np.savez_compressed(path, **arrays)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+import numpy as np
+import hashlib
+import json
+import os
+
+from compact import getCellIndex, compressCells, toMap
+from mlhs_v15 import hydro_names
+
+"""
+Hydrology trajectories (record & replay)
+
+The water and temperature model (the hydro_v3 functions, run through runHydro) only depends on
+the forcing and the hydrology parameters (mlhs_v15.hydro_names): f_oc, k_oc, beta_runoff, dt_50_*,
+epsilon_iso and beta_moisture never feed back into it. model.trajectory_mode (premcloop):
+ - 'record': the result of every runHydro() call is appended to <trajectory_dir>/<key>.bin,
+   one float32 row of catchment cells (compact.py) per map, and indexed in <key>.json
+ - 'replay': runHydro() returns the recorded maps instead of solving the hydrology. dynamic()
+   still runs the water balance map algebra (theta updates, baseflow, outlet totals), so the
+   pesticide fate (pesti_v4.py) sees the moisture & temperature of the recorded run
+ - 'auto': replay if the trajectory of the sample's hydrology is complete, else record
+ - 'off': default
+key: hash of the hydrology parameters and switches, the first time step and the checkpoints the
+sample starts from (spin-up, resume; their content), i.e. one trajectory per unique hydrology of the LHS matrix.
+The backend is not part of the key (the array backend reproduces hydro_v3, see hydro_np.hydro_compare):
+the .json records it ('backend'). batch.py records the trajectories of all its samples in one run,
+the pesticide fate of each sample is then replayed by BeachModel. The .json is written when the run ends, so an incomplete
+recording is never replayed. PCRaster maps are float32: the replay is exact on the catchment
+cells, the cells outside compact.py's index are missing values.
+"""
+
+hydro_switches = ['LF', 'LF_scheme', 'ETP', 'DRY_DAYS', 'num_layers']
+trajectory_modes = ['off', 'record', 'replay', 'auto']
+
+
+def getFileDigest(path):
+    if path is None:
+        return repr(None)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def getHydroKey(model, vector):
+    values = [repr(float(vector[model.names.index(name)]) * float(model.upper[model.names.index(name)]))
+              for name in hydro_names]
+    values += [repr(getattr(model, name, None)) for name in hydro_switches]
+    # Start of the run: the recorded steps and the initial state differ with a restart
+    resume_path = getattr(model, 'resume_path', None)
+    if resume_path is not None:
+        resume_path = resume_path.format(sample=model.currentSampleNumber())
+    values += [repr(model.firstTimeStep()), getFileDigest(getattr(model, 'spinup_path', None)),
+               getFileDigest(resume_path)]
+    return hashlib.sha1(','.join(values).encode('utf-8')).hexdigest()[:16]
+
+
+def getTrajectoryPath(model, key):
+    return os.path.join(getattr(model, 'trajectory_dir', 'trajectories'), key)
+
+
+def isComplete(path):
+    return os.path.exists(path + '.json') and os.path.exists(path + '.bin')
+
+
+def openTrajectory(model, vector):
+    """
+    Sets model.trajectory for the sample (initial), None if model.trajectory_mode is 'off'
+    :return: mode of the sample, 'record', 'replay' or 'off'
+    """
+    mode = getattr(model, 'trajectory_mode', 'off')
+    model.trajectory = None
+    if mode == 'off':
+        return mode
+
+    key = getHydroKey(model, vector)
+    model.trajectory_key = key
+    path = getTrajectoryPath(model, key)
+    if mode == 'auto':
+        mode = 'replay' if isComplete(path) else 'record'
+    cells = len(getCellIndex(model)['cells'])
+
+    if mode == 'replay':
+        with open(path + '.json', 'r') as f:
+            index = json.load(f)
+        if index['cells'] != cells:
+            raise ValueError("Trajectory " + path + " has " + str(index['cells']) + " cells, the clone " + str(cells))
+        data = np.memmap(path + '.bin', dtype=np.float32, mode='r', shape=(index['rows'], cells))
+        model.trajectory = {'mode': mode, 'path': path, 'index': index, 'data': data, 'call': 0, 'step': None}
+    else:
+        model.trajectory = openRecording(model, path, model.currentSampleNumber())
+    return mode
+
+
+def openRecording(model, path, sample):
+    """
+    :return: trajectory dict of a new recording, written to a temporary file until closeRecording()
+    """
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    # Unique per process: the ensemble workers all run sample 1 of their own MonteCarloFramework
+    tmp_path = path + '.' + str(os.getpid()) + '.' + str(sample) + '.tmp'
+    cells = len(getCellIndex(model)['cells'])
+    return {'mode': 'record', 'path': path, 'tmp_path': tmp_path, 'file': open(tmp_path, 'wb'),
+            'index': {'cells': cells, 'rows': 0, 'calls': [], 'steps': dict(),
+                      'backend': getattr(model, 'hydro_backend', 'pcraster')}}
+
+
+def hasTrajectory(model):
+    """
+    :return: True if the hydrology of the model's sample has a complete trajectory (e.g. after the run)
+    """
+    key = getattr(model, 'trajectory_key', None)
+    return key is not None and isComplete(getTrajectoryPath(model, key))
+
+
+def isReplaying(model):
+    trajectory = getattr(model, 'trajectory', None)
+    return trajectory is not None and trajectory['mode'] == 'replay'
+
+
+def recordHydro(model, fn, res):
+    """
+    Appends the result of a runHydro() call (map, or dictionary of maps)
+    """
+    trajectory = getattr(model, 'trajectory', None)
+    if trajectory is None or trajectory['mode'] != 'record':
+        return
+    cell_index = getCellIndex(model)
+    appendHydro(model, trajectory, fn.__name__, res, lambda value: compressCells(cell_index, value))
+
+
+def appendHydro(model, trajectory, name, res, compress):
+    """
+    Appends the result of the hydro_v3 function name to a recording
+    :param compress: value -> (cells,) vector of the catchment cells (compact.py)
+    """
+    index = trajectory['index']
+    step = str(model.currentTimeStep())
+    if step not in index['steps']:
+        index['steps'][step] = len(index['calls'])
+
+    keys = sorted(res.keys()) if isinstance(res, dict) else None
+    for value in ([res[key] for key in keys] if keys is not None else [res]):
+        trajectory['file'].write(np.asarray(compress(value), dtype=np.float32).tobytes())
+    index['calls'].append([name, keys, index['rows']])
+    index['rows'] += 1 if keys is None else len(keys)
+
+
+def replayHydro(model, fn):
+    """
+    :return: the recorded result of the next runHydro() call of the time step
+    """
+    trajectory = model.trajectory
+    index = trajectory['index']
+    if trajectory['step'] != model.currentTimeStep():
+        step = str(model.currentTimeStep())
+        if step not in index['steps']:
+            raise ValueError("Trajectory " + trajectory['path'] + " does not hold time step " + step)
+        trajectory['step'] = model.currentTimeStep()
+        trajectory['call'] = index['steps'][step]
+
+    name, keys, row = index['calls'][trajectory['call']]
+    if name != fn.__name__:
+        raise ValueError("Trajectory " + trajectory['path'] + ", step " + str(trajectory['step']) +
+                         ": recorded " + name + ", replayed " + fn.__name__)
+    trajectory['call'] += 1
+
+    cell_index = getCellIndex(model)
+    if keys is None:
+        return toMap(cell_index, trajectory['data'][row])
+    return dict((key, toMap(cell_index, trajectory['data'][row + i])) for i, key in enumerate(keys))
+
+
+def closeTrajectory(model, complete=True):
+    """
+    Ends the sample (last time step): a recording becomes <key>.bin & <key>.json
+    :param complete: False if the sample stopped early, its recording is deleted
+    """
+    trajectory = getattr(model, 'trajectory', None)
+    if trajectory is None:
+        return
+    if trajectory['mode'] == 'record':
+        closeRecording(trajectory, complete)
+    model.trajectory = None
+
+
+def closeRecording(trajectory, complete=True):
+    trajectory['file'].close()
+    if not complete:
+        os.remove(trajectory['tmp_path'])
+        return
+    os.rename(trajectory['tmp_path'], trajectory['path'] + '.bin')
+    with open(trajectory['path'] + '.json', 'w') as f:
+        json.dump(trajectory['index'], f)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+from pcraster.framework import *
+from pcraster import pcr2numpy, numpy2pcr, Scalar
+import numpy as np
+
+"""
+Zonal totals
+
+areatotal(x, zones) is a full raster pass per variable and zone map. Here the zone maps
+(plot_maps, is_north/is_valley/is_south, is_catchment, outlet_multi) are indexed once as
+(cell, zone) pairs, a cell can belong to several zones (e.g. 'n1_nom' and 'north_nom').
+The totals of all zones for a batch of variables are then one np.bincount per time step.
+Zone = one value of a zone map, as areatotal() groups the cells (False is a zone too).
+Missing values of a variable are not counted.
+
+Catchment & outlet bookkeeping only needs one zone: the catchment (is_catchment True) and the
+outlet cells (outlet_multi 1, as batch.py). zoneValue() returns the total of that zone as a
+float64 value instead of the areatotal() map holding it in every cell, so the concentrations,
+deltas, balances and objectives built on it are arithmetic on numbers (model.scalar_lane).
+The time series sample such values directly (series.py).
+"""
+
+
+def getZoneMaps(model):
+    zone_maps = dict(model.plot_maps)
+    zone_maps['is_north'] = model.is_north
+    zone_maps['is_valley'] = model.is_valley
+    zone_maps['is_south'] = model.is_south
+    zone_maps['is_catchment'] = model.is_catchment
+    zone_maps['outlet_multi'] = model.outlet_multi
+    return zone_maps
+
+
+def buildZoneIndex(model, zone_maps=None):
+    """
+    Sets model.zones (premcloop, or first use).
+    """
+    if zone_maps is None:
+        zone_maps = getZoneMaps(model)
+    codes = dict()
+    lookup = dict()  # (zone map, value) -> zone
+    pair_cells = []
+    pair_zones = []
+    shape = None
+    for name in sorted(zone_maps):
+        arr = pcr2numpy(scalar(zone_maps[name]), np.nan)
+        shape = arr.shape
+        arr = arr.ravel()
+        codes[name] = arr
+        for code in np.unique(arr[np.isfinite(arr)]):
+            cells = np.flatnonzero(arr == code)
+            lookup[(name, float(code))] = len(lookup)
+            pair_cells.append(cells)
+            pair_zones.append(np.full(len(cells), lookup[(name, float(code))], dtype=np.int64))
+
+    pair_cells = np.concatenate(pair_cells)
+    # Only the cells of some zone are read from the variables
+    cells, pair_pos = np.unique(pair_cells, return_inverse=True)
+    model.zones = {'shape': shape, 'codes': codes, 'lookup': lookup, 'count': len(lookup),
+                   'cells': cells, 'pair_pos': pair_pos, 'pair_zones': np.concatenate(pair_zones)}
+
+
+def asCells(var):
+    if isinstance(var, np.ndarray):
+        return var.ravel()
+    return pcr2numpy(spatial(scalar(var)), np.nan).ravel()
+
+
+def zoneTotals(model, variables):
+    """
+    :param variables: list of maps (or numpy arrays of the clone shape)
+    :return: (variables x zones) float64 totals; zone of (map, value) is model.zones['lookup']
+    """
+    try:
+        zones = model.zones
+    except AttributeError:
+        buildZoneIndex(model)
+        zones = model.zones
+
+    n_var = len(variables)
+    values = np.empty((n_var, len(zones['cells'])))
+    for i in range(n_var):
+        values[i] = asCells(variables[i])[zones['cells']]
+    values = np.nan_to_num(values[:, zones['pair_pos']], nan=0.0)
+    index = zones['pair_zones'] + zones['count'] * np.arange(n_var)[:, None]
+    totals = np.bincount(index.ravel(), weights=values.ravel(), minlength=n_var * zones['count'])
+    return totals.reshape(n_var, zones['count'])
+
+
+def isValue(x):
+    """ Number (e.g. a zone value), as opposed to a map or an array """
+    return isinstance(x, (bool, int, float, np.number, np.bool_))
+
+
+def getZoneCells(model, zone_map, code=1.):
+    """
+    :return: flat indices of the cells of zone_map == code, built on first use
+    """
+    try:
+        zone_cells = model.zone_cells
+    except AttributeError:
+        zone_cells = model.zone_cells = dict()
+    try:
+        return zone_cells[(zone_map, code)]
+    except KeyError:
+        codes = pcr2numpy(scalar(getattr(model, zone_map)), np.nan).ravel()
+        zone_cells[(zone_map, code)] = np.flatnonzero(codes == code)
+        return zone_cells[(zone_map, code)]
+
+
+def zoneValues(model, variables, zone_map, code=1.):
+    """
+    :param variables: list of maps (or numpy arrays of the clone shape)
+    :return: (variables,) float64 totals of the zone, the value of areatotal(x, zone_map) in its cells
+    """
+    cells = getZoneCells(model, zone_map, code)
+    return np.array([np.nansum(asCells(x)[cells].astype(np.float64)) for x in variables])
+
+
+def zoneValue(model, x, zone_map='is_catchment'):
+    """
+    Catchment (or outlet, zone_map='outlet_multi') total of x: a float64 value with
+    model.scalar_lane, else the map areatotal(x, zone_map)
+    """
+    if getattr(model, 'scalar_lane', False):
+        return zoneValues(model, [x], zone_map)[0]
+    return areatotal(x, getattr(model, zone_map))
+
+
+def divideValues(num, den):
+    """
+    num / den of maps, or of values with a missing value (NaN) where den is 0, as PCRaster
+    """
+    if isValue(num) and isValue(den):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.float64(num) / den
+        return ratio if np.isfinite(ratio) else np.nan
+    return num / den
+
+
+def getZoneRows(model, zone_map, cells):
+    """
+    :param cells: flat cell indices (e.g. sampling cells of a time series, -1 = none)
+    :return: zone of each cell in zone_map, -1 if the cell has a missing value
+    """
+    try:
+        zones = model.zones
+    except AttributeError:
+        buildZoneIndex(model)
+        zones = model.zones
+
+    rows = np.full(len(cells), -1, dtype=np.int64)
+    codes = zones['codes'][zone_map]
+    for i in range(len(cells)):
+        if cells[i] >= 0 and np.isfinite(codes[cells[i]]):
+            rows[i] = zones['lookup'][(zone_map, float(codes[cells[i]]))]
+    return rows
+
+
+def getCellTotals(totals, rows):
+    """
+    :param totals: zone totals of one variable (row of zoneTotals)
+    :return: areatotal() value at the cells of getZoneRows
+    """
+    return np.where(rows >= 0, totals[np.where(rows >= 0, rows, 0)], np.nan)
+
+
+def getZoneTotalMap(model, totals, zone_map):
+    """
+    :param totals: zone totals of one variable (row of zoneTotals)
+    :return: map with the total of its zone in every cell, as areatotal(x, zone_map)
+    """
+    zones = model.zones
+    codes = zones['codes'][zone_map]
+    cell_totals = np.full(codes.shape, np.nan, dtype=np.float32)
+    for (name, code), row in zones['lookup'].items():
+        if name == zone_map:
+            cell_totals[codes == code] = totals[row]
+    return numpy2pcr(Scalar, cell_totals.reshape(zones['shape']), np.nan)
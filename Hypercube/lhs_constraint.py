@@ -61,10 +61,13 @@ problem = {
 
 
 # from SALib.sample import latin
-from SALib.sample import latin
-from copy import deepcopy
 import numpy as np
-from random import randint
+import sys
+import os
+
+# Constrained sampler of the model (gen10_LHS/LHS_paz1var55/mlhs_v15.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gen10_LHS', 'LHS_paz1var55'))
+from mlhs_v15 import get_ordered_latin
 
 # Define models to run
 # problem = get_problem()
@@ -74,28 +77,11 @@ upper = problem['upper']
 
 
 def get_constrained_matrix(smps):
-    tot_len = 0
-    while tot_len < 1:
-        smps_values = latin.sample(problem, smps)
-        new_values = deepcopy(smps_values)
-        for row in range(len(smps_values))[::-1]:
-            v = smps_values[row]
-            if v[1] < v[2] or v[5] < v[6]:
-                # print("Deleting: ", new_values[row])
-                new_values = np.delete(new_values, row, axis=0)
-        tot_len = len(new_values)
-    return new_values
+    # cZ0Z1 >= cZ and gamma01 >= gammaZ, sampled inside the constraints (no rejection)
+    return get_ordered_latin(problem, smps)
 
 test_values = get_constrained_matrix(samples)
 
-print("Start")
-print(len(test_values))
-print(test_values)
-
-while len(test_values) < samples:
-    resample = get_constrained_matrix(samples)
-    test_values = np.vstack([test_values, resample[randint(0, len(resample)-1)]])
-
 print("End")
 print(len(test_values))
-print(test_values)
\ No newline at end of file
+print(test_values)